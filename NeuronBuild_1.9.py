@@ -6,8 +6,8 @@ spline-based models of neuronal structure. The original swc file format is detai
 Cannon, R.C, Turner, D.A, Pyapali, G.K, Wheal, H.V. An on-line archive of reconstructed
 hippocampal neurons. Journal of Neuroscience Methods. 84 1–2. pp 49-54. 1998
 The reconstruction units are μm (micrometers).
-Note: soma (cell body) definitions vary from file to file; this script assumes a three point spline
-(which is very common). The soma object is disabled by default, since they rarely produce acceptable geometry.
+Note: soma (cell body) definitions vary from file to file; the script recognises single point, three point,
+contour and cylinder stack somas and builds each as a closed polygon mesh.
 Note: use of neuromorpho files may come with an obligation to cite the original publication.
 
 How to use:
@@ -20,7 +20,7 @@ How to use:
 - A neuron should appear in your viewport.
 - If all the geometry options are chosen, the geometry consists of a HyperNURBs object, which contains a Connect object, which
 contains a null object, which contains the sweep objects that define the axons and dendrites.
-Since the Soma (cell body) definition in the swc files is so rudimentary, you may want to
+Since the Soma (cell body) definition in the swc files is often rudimentary, you may want to
 delete or hide it, and let the soma be defined by the merging dendrite roots. Within the sweep
 objects are n-sided splines (named "Profile") set to 6-sides; you could search for these
 objects and change the number of sides to 4 to simplify the geometry. Also in the SweepNURBs objects
@@ -67,8 +67,14 @@ OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 DEALINGS IN THE SOFTWARE.
 """
 
-import c4d, os
+import c4d, os, sys, time
 from c4d import gui
+import numpy as np
+
+#the neuronbuild package (SWC parsing and geometry support code) lives next to this script
+if "__file__" in globals():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from neuronbuild import swc, topology, mesh, voxel, batch, cache, lod, profile, instance, spatial, stats, soma
 
 #Welcome to the world of Python
 
@@ -88,116 +94,179 @@ PROFILESIDES = 1010
 VOLUMEBUILDERCHECK = 1011
 VOLUMEMESHERCHECK = 1012
 SINGLESPLINECHECK = 1013
+MESHCHECK = 1014
+VOXELCHECK = 1015
+VOXELTEXT = 1016
+VOXELSIZE = 1017
+BATCHCHECK = 1018
+CACHECHECK = 1019
+LODCHECK = 1020
+PROFILECHECK = 1021
+INSTANCECHECK = 1022
+CROPCHECK = 1023
+UPDATEBUTTON = 1024
+COMPACTCHECK = 1025
+TYPESCHECK = 1026
+RESAMPLETEXT = 1027
+RESAMPLESPACING = 1028
+REPAIRCHECK = 1029
 
 coordsystem="left"
-versionNumber=c4d.GetC4DVersion()
-
-def somaMake(somaLines, neuroFile, fileName):
-    """Create splines to make the cell body."""
-
-    #reference global variables that set model parameters
-    global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, NSides, DoVB, DoVM, NullName
-
-    #create spline
-    Spline = c4d.BaseObject(c4d.Ospline)
-
-    #add name to spline
-    Spline[c4d.ID_BASELIST_NAME] = "Soma"
-
-    #set type to linear
-    Spline[c4d.SPLINEOBJECT_TYPE] = 0
-
-    #set number of points for spline
-    Spline.ResizeObject(len(somaLines))
-    for n in range(0, len(somaLines)):
-        currLine = somaLines[n]
-
-        #create the variables for positioning the points
-        sx = float(currLine[2])
-        sy = float(currLine[3])
-        sz = float(currLine[4])
-        if coordsystem=="left":  #Convert to left-hand for C4D added by GJ March 11, 2013
-            sz = -sz
-        sRad = float(currLine[5])
-        pos = c4d.Vector(sx, sy, sz)
-        Spline.SetPoint(n, pos)
-
-    #create the soma spline
-    doc.InsertObject(Spline)
-
-    Spline.Message(c4d.MSG_UPDATE) #Message Update
-
-    #create sweep object
-    if DoSweep == True:
-        Sweep = c4d.BaseObject(c4d.Osweep)
-        Sweep[c4d.ID_BASELIST_NAME] = "Soma Sweep"
-        Sweep[c4d.SWEEPOBJECT_CONSTANT] = False
-        Sweep[c4d.SWEEPOBJECT_RAILDIRECTION] = False
-        Sweep[c4d.CAP_TYPE] = 1
-        Sweep.SetPhong(True, True, 80)
-        Sweep.SetDeformMode(False)
-        doc.InsertObject(Sweep)
-
-        #create the profile for the sweep
-        Profile = c4d.BaseObject(c4d.Osplinenside)
-        Profile[c4d.ID_BASELIST_NAME] = "Profile"
-        Profile[c4d.PRIM_NSIDE_RADIUS] = sRad
-        Profile[c4d.PRIM_NSIDE_SIDES] = NSides
-        doc.InsertObject(Profile)
-
-        Profile.Message(c4d.MSG_UPDATE) #Message Update
-
-        Spline.InsertUnder(Sweep)
-        Profile.InsertUnder(Sweep)
-
-        Sweep.Message(c4d.MSG_UPDATE) #Message Update
-
-    #add undo for spline creation
-    doc.AddUndo(c4d.UNDOTYPE_NEW, Spline)
-
-    #insert the spline under the null object
-    if DoSweep == True:
-        parent = doc.SearchObject(NullName)
-        Sweep.InsertUnder(parent)
-
-    c4d.EventAdd()
-
-def splineMake(splineLines, neuroFile, fileName):
-    #Create splines to define the dendrites and axons
-
-    #reference global variables that set model parameters
-    global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, NSides, DoVB, DoVM, NullName
 
-    #run through the data file, identifying contiguous spline segments. this is possible because
-    #the last value in the data refers to the "root" point of that branch segment
-    splineSep = []
-    for n in range(0, len(splineLines)):
-        currLine = splineLines[n]
-        sIndex = int(currLine[0])
-        sRoot = int(currLine[6])
-        if sIndex > sRoot + 1:
-            splineSep.append(sIndex)
-
-    #ensures that the final spline is included in the drawing
-    finalIndex = int(splineLines[len(splineLines)-1][0])
-
-    if finalIndex not in splineSep:
-        splineSep.append(finalIndex)
-
-    #now build the spline segments as separate splines
-    for n in range(0, len(splineSep)):
-        if n < (len(splineSep) - 1):
-
-            #determine the offset between segemnts; this is the number of vertices in each spline segment
-            offset = splineSep[n+1] - splineSep[n] + 1
-
-            #ensures that the final point is included in the drawing
-            if splineSep[n+1] == finalIndex:
-                offset = offset + 1
+#the import cache (see neuronbuild/cache.py): parsed files and generated geometry, keyed by file content
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".neuronbuild", "cache")
+CACHE_BYTES = 1 << 30
+
+#simplification tolerances in µm for the levels of detail below full detail (see neuronbuild/lod.py)
+LOD_TOLERANCES = (0.25, 1.0, 4.0)
+
+#resampling (see neuronbuild/resample.py): the spacing along a section may grow to this multiple of the
+#local radius, since detail finer than a tube's radius is not visible on it (0: the plain spacing everywhere)
+RESAMPLE_RADIUS_SCALE = 1.0
+
+#vertices around each ring of the soma mesh (see neuronbuild/soma.py)
+SOMA_SEGMENTS = 16
+
+#stage timings and counters for the import (see neuronbuild/profile.py); enabled by the Profile option.
+#Set PROFILE_FILE to also write the report to a file (JSON if it ends in .json).
+profiler = profile.Profiler()
+PROFILE_FILE = None
+
+#every imported neuron keeps a record of its source and build options in a container on its groupNull
+#(see rememberNeuron), so "Update Selected" can apply new options without importing it again
+NEURON_RECORD = 1060371
+RECORD_PATH = 1
+RECORD_SPLINE = 2
+RECORD_RAIL = 3
+#the crop region as spatial.regionText, or "" for a neuron that was not cropped
+RECORD_CROP = 4
+RECORD_FIRST_OPTION = 10
+RECORD_OPTIONS = ("DoHN", "DoConnect", "DoRail", "DoSweep", "DoSingleSpline", "NSides", "DoVB", "DoVM", "DoMesh",
+                  "DoVoxel", "VoxelSize", "DoLOD", "DoInstance", "DoCompact",
+                  "DoTypes", "ResampleSpacing", "DoRepair")
+
+#the region imports are cropped to with the Crop option (a neuronbuild.spatial Box, Sphere or Frustum
+#in C4D space); main() takes it from the selected object or camera
+cropRegion = None
+versionNumber=c4d.GetC4DVersion()
 
-            #special case: if the spline is not rooted, one fewer point
-            if int(neuroFile[splineSep[n]-1][6]) < 0:
-                offset = offset - 1
+class BuildContext(object):
+    """Everything the builders need for one import: the parsed data, the build options, and
+    the objects they parent to. The parents are held by reference, so the builders never
+    search the scene for them, and two files with the same name cannot get mixed up."""
+
+    def __init__(self, morph, fileName, points=None, DoHN=True, DoConnect=True, DoRail=True, DoSweep=True,
+                 DoSingleSpline=True, NSides=6, DoVB=False, DoVM=False, DoMesh=False, DoVoxel=False,
+                 VoxelSize=0.0, DoLOD=False, DoInstance=False, DoCompact=False, DoTypes=False,
+                 ResampleSpacing=0.0, DoRepair=False):
+        self.morph = morph
+        self.fileName = fileName
+
+        #sample positions in C4D space, converted from the right-handed swc data in one array
+        #operation (Convert to left-hand for C4D added by GJ March 11, 2013), unless the preparation
+        #stage already made that copy (points). An update that only rearranges existing objects has
+        #no data (morph is None).
+        self.points = points
+        if self.points is None and morph is not None:
+            self.points = morph.points * (1.0, 1.0, -1.0) if coordsystem=="left" else morph.points
+
+        #build options, as chosen in the settings dialog
+        self.DoHN = DoHN
+        self.DoConnect = DoConnect
+        self.DoRail = DoRail
+        self.DoSweep = DoSweep
+        self.DoSingleSpline = DoSingleSpline
+        self.NSides = NSides
+        self.DoVB = DoVB
+        self.DoVM = DoVM
+        self.DoMesh = DoMesh
+        self.DoVoxel = DoVoxel
+        self.VoxelSize = VoxelSize
+        self.DoLOD = DoLOD
+        self.DoInstance = DoInstance
+        self.DoCompact = DoCompact
+        self.DoTypes = DoTypes
+        self.ResampleSpacing = ResampleSpacing
+        self.DoRepair = DoRepair
+
+        #geometry pre-computed with the parse (see neuronbuild/batch.py), or None
+        self.geometry = None
+
+        #extents, radius figures and the recommended voxel size (see neuronbuild/stats.py)
+        self.stats = None
+
+        #the canonical frustums the instance builder links to (see instanceShapes), or None
+        self.instanceShapes = None
+
+        #the region the import is cropped to (see neuronbuild/spatial.py), or None
+        self.region = None
+
+        #parent object, created by readFile before the builders run
+        self.groupNull = None
+
+def setPoints(op, points):
+    """Upload an (n, 3) array of positions to a point object in a single SetAllPoints call."""
+    op.SetAllPoints([c4d.Vector(x, y, z) for x, y, z in points.tolist()])
+    profiler.count("points", len(points))
+
+def polygonObject(tubes, name):
+    """Create a PolygonObject from a neuronbuild Mesh (vertex and polygon arrays)."""
+    op = c4d.PolygonObject(len(tubes.vertices), len(tubes.polygons))
+    op[c4d.ID_BASELIST_NAME] = name
+    setPoints(op, tubes.vertices)
+    for i, (a, b, c, d) in enumerate(tubes.polygons.tolist()):
+        op.SetPolygon(i, c4d.CPolygon(a, b, c, d))
+    op.SetPhong(True, True, 80)
+    op.Message(c4d.MSG_UPDATE)
+    profiler.count("polygons", len(tubes.polygons))
+    return op
+
+def multiSegmentSpline(name, positions, counts):
+    """Create one linear spline holding consecutive runs of positions as segments of the given point counts,
+    allocated once with all its points and segments."""
+    op = c4d.BaseObject(c4d.Ospline)
+    op[c4d.ID_BASELIST_NAME] = name
+    op[c4d.SPLINEOBJECT_TYPE] = 0
+    op.ResizeObject(len(positions), len(counts))
+    for i, count in enumerate(counts):
+        op.SetSegment(i, count, False)
+    setPoints(op, positions)
+    op.Message(c4d.MSG_UPDATE)
+    return op
+
+def somaMake(ctx, somaRows):
+    """Create the cell body as one closed polygon mesh, under ctx.groupNull (not in the document yet).
+    The soma encoding (single point, three point, contour, cylinder stack) is detected from the soma rows
+    (see neuronbuild/soma.py)."""
+    somas = soma.reconstruct(ctx.morph, somaRows, points=ctx.points, segments=SOMA_SEGMENTS)
+    surface = soma.somaMesh(somas)
+    if len(surface.polygons) == 0:
+        return None
+    op = polygonObject(surface, "Soma")
+    op.InsertUnder(ctx.groupNull)
+    return op
+
+def splineMake(ctx, sections):
+    #Create splines to define the dendrites and axons. Everything is built under the parents held by
+    #ctx before any of it is in the document; readFile inserts the result in one go.
+
+    morph = ctx.morph
+    DoRail, DoSweep, NSides = ctx.DoRail, ctx.DoSweep, ctx.NSides
+
+    #each section in the table (see neuronbuild/topology.py) is an unbranched run of samples,
+    #listed from the point it hangs from (a branch point or the soma) out to a branch point or tip
+    for n in range(0, len(sections)):
+        #the first point is the root of the segment (its attachment point, or the first sample itself if
+        #the segment is unrooted); the positions are sliced straight out of the columns when the sections
+        #are contiguous runs of rows (see neuronbuild/batch.py), else gathered as one array
+        positions = sections.pathValues(n, ctx.points)
+
+        #a lone root sample with no children has nothing to draw
+        if len(positions) > 1:
+
+            #the number of vertices in this spline segment
+            offset = len(positions)
+            profiler.count("splines")
 
             #create an empty spline
             Spline = c4d.BaseObject(c4d.Ospline)
@@ -205,11 +274,8 @@ def splineMake(splineLines, neuroFile, fileName):
             #allocate points for the spline
             Spline.ResizeObject(offset)
 
-            #get the data line that starts the segment
-            splineStart = neuroFile[splineSep[n]-1]
-            splineType = int(splineStart[1])
-
             #determine what type of spline it is and name it
+            splineType = int(sections.types[n])
             if splineType == 2:
                 name = "Axon " + str(n)
             elif splineType == 3:
@@ -222,103 +288,48 @@ def splineMake(splineLines, neuroFile, fileName):
                 name = "Unspecified Neurites " + str(n)
             elif splineType == 7:
                 name = "Glial Process " + str(n)
+            else:
+                name = "Type " + str(splineType) + " " + str(n)
 
             Spline[c4d.ID_BASELIST_NAME] = name
             Spline[c4d.SPLINEOBJECT_TYPE] = 0
 
-            #find the root point for this segment by going back to
-            #the line in neuroFile that contains it
-            #if the point is unrooted, let it be 'its own root'
-            if int(splineStart[6]) >= 0:
-                rootLine = neuroFile[((int(splineStart[6])) - 1)]
-            else:
-                rootLine = splineStart
-
-            x, y, z = float(rootLine[2]), float(rootLine[3]), float(rootLine[4])
-            rootPos = c4d.Vector(x, y, z)
-            if coordsystem=="left":  #Convert to left-hand for C4D added by GJ March 11, 2013
-                rootPos = c4d.Vector(x, y, -z)
-            Spline.SetPoint(0, rootPos)
-
-            for m in range(1, offset):
-                l = int(splineSep[n]) + (m - 2)
-
-                #correction to account for difference in unrooted points
-                if rootLine == splineStart:
-                    l = l + 1
-
-                currLine = neuroFile[l]
-
-                #create the variables for positioning the points
-                sx = float(currLine[2])
-                sy = float(currLine[3])
-                sz = float(currLine[4])
-                if coordsystem=="left":  #Convert to left-hand for C4D added by GJ March 11, 2013
-                    sz = -sz
-                #radius, not used yet
-                sRad = float(currLine[5])
-                pos = c4d.Vector(sx, sy, sz)
-                Spline.SetPoint(m, pos)
-
-            #create the spline
-            doc.InsertObject(Spline)
-            c4d.EventAdd()
+            radii = sections.pathValues(n, morph.radii)
+            setPoints(Spline, positions)
+            #the profile radius comes from the last point of the segment
+            sRad = radii[-1]
+
+            Spline.Message(c4d.MSG_UPDATE) #Message Update
 
             #in order to scale the sweepNURBs object, we create a copy of the spline
-            #to act as a rail spline, and then add the radius value to one of the coords
+            #to act as a rail spline, and then add the radius value to the x coord of every point
             if DoRail == True:
-                railSpline = Spline.GetClone()
-                railSpline[c4d.ID_BASELIST_NAME] = name + " Rail"
-
-                rVector = c4d.Vector((x + (float(rootLine[5]))), y, z)
-                if coordsystem == "left":  #Convert to left-hand for C4D added by GJ March 11, 2013
-                    rVector = c4d.Vector((x + (float(rootLine[5]))), y, -z)
-
-                railSpline.SetPoint(0, rVector)
-                for m in range(1, offset):
-                    l = int(splineSep[n]) + (m - 2)
-
-
-                    #correction to account for difference in unrooted points
-                    if rootLine == splineStart:
-                        l = l + 1
-
-                    currLine = neuroFile[l]
+                with profiler.span("rails"):
+                    railSpline = Spline.GetClone()
+                    railSpline[c4d.ID_BASELIST_NAME] = name + " Rail"
 
-                    #create the variables for positioning the points
-                    sRad = float(currLine[5])
-                    #add the radius to the x coord this time
-                    sx = (float(currLine[2]) + sRad)
-                    sy = float(currLine[3])
-                    sz = float(currLine[4])
-                    if coordsystem=="left":  #Convert to left-hand for C4D added by GJ March 11, 2013
-                        sz = -sz
-                    #radius, not used yet
+                    railPositions = positions.copy()
+                    railPositions[:, 0] += radii
+                    setPoints(railSpline, railPositions)
 
-                    pos = c4d.Vector(sx, sy, sz)
-                    railSpline.SetPoint(m, pos)
-
-                doc.InsertObject(railSpline)
-                c4d.EventAdd()
-
-                railSpline.Message(c4d.MSG_UPDATE) #Message Update
+                    railSpline.Message(c4d.MSG_UPDATE) #Message Update
 
             #create the sweep object
             if DoSweep == True:
-                Sweep = c4d.BaseObject(c4d.Osweep)
-                Sweep[c4d.ID_BASELIST_NAME] = name
-                #the seep object needs to have two default settings disabled
-                Sweep[c4d.SWEEPOBJECT_CONSTANT] = False
-                Sweep[c4d.SWEEPOBJECT_RAILDIRECTION] = False
-                Sweep[c4d.CAP_TYPE] = 1
-                Sweep.SetPhong(True, True, 80)
-
-                #create the profile for the sweep
-                Profile = c4d.BaseObject(c4d.Osplinenside)
-                Profile[c4d.ID_BASELIST_NAME] = "Profile"
-                Profile[c4d.PRIM_NSIDE_RADIUS] = sRad
-                Profile[c4d.PRIM_NSIDE_SIDES] = NSides
-                doc.InsertObject(Profile)
+                with profiler.span("generators"):
+                    Sweep = c4d.BaseObject(c4d.Osweep)
+                    Sweep[c4d.ID_BASELIST_NAME] = name
+                    #the seep object needs to have two default settings disabled
+                    Sweep[c4d.SWEEPOBJECT_CONSTANT] = False
+                    Sweep[c4d.SWEEPOBJECT_RAILDIRECTION] = False
+                    Sweep[c4d.CAP_TYPE] = 1
+                    Sweep.SetPhong(True, True, 80)
+
+                    #create the profile for the sweep
+                    Profile = c4d.BaseObject(c4d.Osplinenside)
+                    Profile[c4d.ID_BASELIST_NAME] = "Profile"
+                    Profile[c4d.PRIM_NSIDE_RADIUS] = sRad
+                    Profile[c4d.PRIM_NSIDE_SIDES] = NSides
 
             #insert the splines as children of the sweepNURBs object, in the correct order
             if DoRail == True:
@@ -328,238 +339,699 @@ def splineMake(splineLines, neuroFile, fileName):
                 Spline.InsertUnder(Sweep)
                 Profile.InsertUnder(Sweep)
 
-            #add undo for spline creation
-            doc.AddUndo(c4d.UNDOTYPE_NEW, Spline)
-
-            #create and insert the spline into the SingleSplineNull if that option is chosen
-            if DoSingleSpline == True:
-                SplineCopy = Spline.GetClone()
-                doc.InsertObject(SplineCopy)
-                c4d.EventAdd()
-                SSOName = "Single_Spline_Object_" + fileName
-                parent = doc.SearchObject(SSOName)
-                SplineCopy.InsertUnder(parent)
-                doc.AddUndo(c4d.UNDOTYPE_NEW, SplineCopy)
-
-                #do the same for the Rail splines
-                SplineRailCopy = railSpline.GetClone()
-                doc.InsertObject(SplineRailCopy)
-                c4d.EventAdd()
-                SSROName = "Single_Spline_Object_Rail_" + fileName
-                parent = doc.SearchObject(SSROName)
-                SplineRailCopy.InsertUnder(parent)
-                doc.AddUndo(c4d.UNDOTYPE_NEW, SplineRailCopy)
-
             #insert the spline under the null object
             if DoSweep == True:
-                parent = doc.SearchObject(NullName)
-                Sweep.InsertUnder(parent)
+                Sweep.InsertUnder(ctx.groupNull)
             else:
-                parent = doc.SearchObject(NullName)
-                Spline.InsertUnder(parent)
-
-            c4d.EventAdd()
-
-            Spline.Message(c4d.MSG_UPDATE) #Message Update
-
-def readFile(path):
-    #Access the neuromorpho swc file, strip comments, and load it into the neuroFile nested list.
+                Spline.InsertUnder(ctx.groupNull)
+
+def singleSplineMake(ctx, sections):
+    #Build the single spline, with one segment per section path, and its rail (the same path offset by the
+    #radius along x) straight from the section table
+    rows, offsets = sections.paths()
+    counts = offsets[1:] - offsets[:-1]
+    #a lone root sample with no children has nothing to draw
+    drawn = counts > 1
+    rows = rows[drawn.repeat(counts)]
+    counts = counts[drawn].tolist()
+
+    positions = ctx.points[rows]
+    Spline = multiSegmentSpline("Single_Spline_Object_" + ctx.fileName, positions, counts)
+    railSpline = None
+    if ctx.DoRail == True:
+        positions[:, 0] += ctx.morph.radii[rows]
+        railSpline = multiSegmentSpline("Single_Spline_Object_Rail_" + ctx.fileName, positions, counts)
+    return Spline, railSpline
+
+def compactMake(ctx, sections):
+    #Build the neurites as one multi-segment spline per structure type, with a segment per section, under one
+    #Sweep and Profile per type (and a multi-segment rail, as in splineMake), instead of a Spline, rail, Sweep
+    #and Profile per section. Every point's radius is also kept in a "Radius" vertex map on the spline, as a
+    #fraction of the type's largest radius (named in the tag), for fields and deformers to pick up.
+    morph = ctx.morph
+    rows, offsets = sections.paths()
+    counts = offsets[1:] - offsets[:-1]
+    #a lone root sample with no children has nothing to draw
+    drawn = counts > 1
+
+    built = []
+    for splineType in sorted(set(sections.types[drawn].tolist())):
+        selected = drawn & (sections.types == splineType)
+        typeRows = rows[selected.repeat(counts)]
+        name = swc.TYPE_NAMES.get(splineType, "Type " + str(splineType))
+        positions = ctx.points[typeRows]
+        radii = morph.radii[typeRows]
+
+        Spline = multiSegmentSpline(name, positions, counts[selected].tolist())
+        profiler.count("splines")
+        largest = float(radii.max())
+        Radius = c4d.VariableTag(c4d.Tvertexmap, len(typeRows))
+        Radius[c4d.ID_BASELIST_NAME] = "Radius (1 = %g µm)" % largest
+        Radius.SetAllHighlevelData((radii / largest if largest > 0 else radii).tolist())
+        Spline.InsertTag(Radius)
+
+        if ctx.DoSweep != True:
+            Spline.InsertUnder(ctx.groupNull)
+            built.append(Spline)
+            continue
 
-    #reference global variables that set model parameters
-    global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, DoVB, DoVM, NullName
-
-    neuroFile = []
-    somaLines = []
-    splineLines = []
+        Sweep = c4d.BaseObject(c4d.Osweep)
+        Sweep[c4d.ID_BASELIST_NAME] = name
+        Sweep[c4d.SWEEPOBJECT_CONSTANT] = False
+        Sweep[c4d.SWEEPOBJECT_RAILDIRECTION] = False
+        Sweep[c4d.CAP_TYPE] = 1
+        Sweep.SetPhong(True, True, 80)
 
-    #Get the name of the file and split off the last file extension
-    filePath = os.path.basename(path)
-    fileName = os.path.splitext(filePath)[0]
-
-    #here we read the file, and create two sub lists: one for the soma, and one for the axons, dendrites, and other structures
-    for line in open(path):
-        # ignore lines that are comments
-        if line.startswith('#'):
-            pass
+        #one profile for the whole type: without rails its radius is the type's median
+        Profile = c4d.BaseObject(c4d.Osplinenside)
+        Profile[c4d.ID_BASELIST_NAME] = "Profile"
+        Profile[c4d.PRIM_NSIDE_RADIUS] = float(np.median(radii))
+        Profile[c4d.PRIM_NSIDE_SIDES] = ctx.NSides
+
+        #the rail offsets every point by its radius along x, segment for segment with the path
+        if ctx.DoRail == True:
+            with profiler.span("rails"):
+                positions[:, 0] += radii
+                railSpline = multiSegmentSpline(name + " Rail", positions, counts[selected].tolist())
+            railSpline.InsertUnder(Sweep)
+        Spline.InsertUnder(Sweep)
+        Profile.InsertUnder(Sweep)
+        Sweep.InsertUnder(ctx.groupNull)
+        built.append(Sweep)
+    return built
+
+def meshMake(ctx, sections):
+    #Build every section as a tube in one polygon mesh (see neuronbuild/mesh.py), instead of
+    #a Sweep, Profile and rail per section that C4D has to evaluate
+    tubes = ctx.geometry
+    if tubes is None:
+        tubes = mesh.tubeMesh(ctx.morph, sections, ctx.NSides, points=ctx.points)
+    if ctx.DoTypes != True:
+        op = polygonObject(tubes, "Mesh_" + ctx.fileName)
+        op.InsertUnder(ctx.groupNull)
+        return op
+
+    #one object per structure type, split from the same mesh by the type of each polygon's section,
+    #so materials and visibility can be set per type
+    types, parts = mesh.splitMesh(tubes, sections.types[tubes.sections])
+    built = []
+    for splineType, part in zip(types.tolist(), parts):
+        op = polygonObject(part, swc.TYPE_NAMES.get(splineType, "Type " + str(splineType)))
+        op.InsertUnderLast(ctx.groupNull)
+        built.append(op)
+    return built
+
+def instanceShapes(sides, name):
+    #Create the canonical unit frustums (see neuronbuild/instance.py) as polygon objects under a null.
+    #They are hidden; the instance objects made by instanceMake render them, once per segment.
+    shapes = c4d.BaseObject(c4d.Onull)
+    shapes[c4d.ID_BASELIST_NAME] = "Instance_Shapes_" + name
+    shapes[c4d.ID_BASEOBJECT_VISIBILITY_EDITOR] = c4d.OBJECT_OFF
+    shapes[c4d.ID_BASEOBJECT_VISIBILITY_RENDER] = c4d.OBJECT_OFF
+    for ratio in instance.taperRatios():
+        op = polygonObject(instance.unitFrustum(ratio, sides), "Frustum %g" % ratio)
+        op.InsertUnderLast(shapes)
+    return shapes
+
+def instanceMake(ctx, sections):
+    #Build the neurites as one multi-instance object per canonical frustum, holding a matrix per
+    #segment, instead of a tube mesh or a Sweep per section
+    segments = instance.segmentInstances(ctx.morph, sections, points=ctx.points)
+    frustums = ctx.instanceShapes.GetChildren()
+    #offset and the three axes of every segment as one flat row of 12 numbers
+    transforms = segments.matrices()
+
+    instances = c4d.BaseObject(c4d.Onull)
+    instances[c4d.ID_BASELIST_NAME] = "Instances_" + ctx.fileName
+    for index, ratio in enumerate(segments.ratios):
+        rows = segments.shape(index)
+        if len(rows) == 0:
+            continue
+        op = c4d.InstanceObject()
+        op[c4d.ID_BASELIST_NAME] = "Segments (taper %g)" % ratio
+        op[c4d.INSTANCEOBJECT_LINK] = frustums[index]
+        op[c4d.INSTANCEOBJECT_RENDERINSTANCE_MODE] = c4d.INSTANCEOBJECT_RENDERINSTANCE_MODE_MULTIINSTANCE
+        op.SetInstanceMatrices([c4d.Matrix(c4d.Vector(x, y, z), c4d.Vector(ax, ay, az), c4d.Vector(bx, by, bz),
+                                           c4d.Vector(cx, cy, cz))
+                                for x, y, z, ax, ay, az, bx, by, bz, cx, cy, cz in transforms[rows].tolist()])
+        op.InsertUnderLast(instances)
+    profiler.count("instances", len(segments))
+    instances.InsertUnder(ctx.groupNull)
+    return instances
+
+def neuritesMake(ctx, sections):
+    #Build the axons, dendrites etc. with the chosen builder
+    if ctx.DoInstance == True:
+        return instanceMake(ctx, sections)
+    if ctx.DoMesh == True:
+        return meshMake(ctx, sections)
+    if ctx.DoCompact == True:
+        return compactMake(ctx, sections)
+    return splineMake(ctx, sections)
+
+def lodMake(ctx, sections):
+    #Build the neurites once per level of detail under a LOD object: level 0 is the full data, the others
+    #are simplified per section to LOD_TOLERANCES (see neuronbuild/lod.py). Switch levels on the LOD object.
+    start = time.perf_counter()
+    levels = lod.levels(ctx.morph, sections, LOD_TOLERANCES, points=ctx.points)
+    simplifyTime = time.perf_counter() - start
+    profiler.record("simplify", simplifyTime)
+
+    LOD = c4d.BaseObject(c4d.Olod)
+    LOD[c4d.ID_BASELIST_NAME] = "LOD_" + ctx.fileName
+
+    groupNull = ctx.groupNull
+    buildTimes = []
+    for i, level in enumerate(levels):
+        levelNull = c4d.BaseObject(c4d.Onull)
+        if i == 0:
+            levelNull[c4d.ID_BASELIST_NAME] = "LOD 0 (full detail)"
         else:
-            # create nested list of data
-             x = [value for value in line.split()]
-             neuroFile.append(x)
-             #create
-             if x[1] == "1":
-                 somaLines.append(x)
-             else:
-                 splineLines.append(x)
-
-    #the numlines variable stores the length of the data files (number of points)
-    numLines = len(neuroFile)
-
-    #create null to contain splines for procedural hierarchy
-    groupNull = c4d.BaseObject(c4d.Onull)
-    NullName  = "groupNull_" + fileName
-    groupNull[c4d.ID_BASELIST_NAME] = NullName
-    #insert the null in the scene
-    doc.InsertObject(groupNull)
-    #add undo for null creation
-    doc.AddUndo(c4d.UNDOTYPE_NEW, groupNull)
-    c4d.EventAdd()
-
-    #create single spline null
-    #if DoSingleSpline == True:
-    SplineNull = c4d.BaseObject(c4d.Onull)
-    SplineNull[c4d.ID_BASELIST_NAME] = "Single_Spline_Object_" + fileName
-    #insert the null in the scene
-    doc.InsertObject(SplineNull)
-    doc.AddUndo(c4d.UNDOTYPE_NEW, SplineNull)
-    c4d.EventAdd()
-
-    #create single spline RAIL null
-    #if DoSingleSpline == True:
-    SplineRailNull = c4d.BaseObject(c4d.Onull)
-    SplineRailNull[c4d.ID_BASELIST_NAME] = "Single_Spline_Object_Rail_" + fileName
-    #insert the null in the scene
-    doc.InsertObject(SplineRailNull)
-    doc.AddUndo(c4d.UNDOTYPE_NEW, SplineRailNull)
-    c4d.EventAdd()
-
-    groupNull.Message(c4d.MSG_UPDATE) #Message Update
-
-    #call the functions that build the soma and other splines, if applicable
-    if len(somaLines) > 0:
-        somaMake(somaLines, neuroFile, fileName)
-
-    if len(splineLines) > 0:
-        splineMake(splineLines, neuroFile, fileName)
-
-
-    #Create single spline from all neuron spline segments
-    if DoSingleSpline == True:
-        #find and select the grouped source splines
-        SSOName = "Single_Spline_Object_" + fileName
-        op = doc.SearchObject(SSOName)
-        #issue the join command to connect the source splines
-        if not op:
-            raise TypeError("there's no object selected")
-        result = c4d.utils.SendModelingCommand(
-                                  command = c4d.MCOMMAND_JOIN,
-                                  list = [op])
-        op[c4d.ID_BASELIST_NAME] = "Component_Splines_" + fileName
-        #check if result is a list
-        if result is False:
-            raise TypeError("Join didn't work")
-        elif result is True:
-            print("join should not return true")
-        elif isinstance(result, list):
-            doc.InsertObject(result[0])
-
-        #find and select the grouped source Rail splines
-        SSROName = "Single_Spline_Object_Rail_" + fileName
-        op = doc.SearchObject(SSROName)
-        #issue the join command to connect the source splines
-        if not op:
-            raise TypeError("there's no object selected")
-        resultR = c4d.utils.SendModelingCommand(
-                                  command = c4d.MCOMMAND_JOIN,
-                                  list = [op])
-        op[c4d.ID_BASELIST_NAME] = "Component_Rail_Splines_" + fileName
-        #check if result is a list
-        if resultR is False:
-            raise TypeError("Join didn't work")
-        elif resultR is True:
-            print("join should not return true")
-        elif isinstance(resultR, list):
-            doc.InsertObject(resultR[0])
-
-        c4d.EventAdd()
-
-        startObject = doc.SearchObject(SSOName)
-        #startobject.Message(c4d.MSG_UPDATE) #Message Update
-
-        #send Message to update object cache (bounding box)s
-        startObject.Message(c4d.MSG_UPDATE)
-        #get the bounding box radius
-        bbox = startObject.GetRad()
-        bboxList = [bbox[0],bbox[1],bbox[2]]
-        #determine the Largest of the list items (used below if creating volume builder to determine voxel size)
-        largestSize = max(bboxList)
-        largestAxis = bboxList.index(largestSize)
+            levelNull[c4d.ID_BASELIST_NAME] = "LOD %d (%g µm)" % (i, level.tolerance)
+        ctx.groupNull = levelNull
+        start = time.perf_counter()
+        neuritesMake(ctx, level.sections)
+        buildTimes.append(time.perf_counter() - start)
+        levelNull.InsertUnderLast(LOD)
+    ctx.groupNull = groupNull
+    LOD.InsertUnder(ctx.groupNull)
+
+    print("Levels of detail for %s (simplified in %.3f s):" % (ctx.fileName, simplifyTime))
+    for i, level in enumerate(levels):
+        print("  LOD %d  tolerance %-5g  %8d points (%5.1f%%)  built in %.3f s (%5.1f%%)" % (
+            i, level.tolerance, level.points, 100.0 * level.points / max(levels[0].points, 1),
+            buildTimes[i], 100.0 * buildTimes[i] / max(buildTimes[0], 1e-9)))
+    return LOD
+
+def voxelMake(ctx):
+    #Build the whole neuron, soma included, as one closed mesh from a signed distance field
+    #(see neuronbuild/voxel.py), in place of a Volume Builder voxelizing hundreds of Sweeps
+    surface = ctx.geometry
+    if surface is None:
+        sections = topology.buildSections(ctx.morph, exclude=())
+        if ctx.region is not None:
+            index = spatial.segmentIndex(ctx.morph, sections, points=ctx.points)
+            sections = sections.subset(index.sectionMask(ctx.region))
+        voxelSize = ctx.VoxelSize
+        if voxelSize <= 0:
+            voxelSize = ctx.stats.voxelSize()
+        surface = voxel.voxelize(ctx.morph, sections, voxelSize, points=ctx.points)
+    op = polygonObject(surface, "Voxel_Mesh_" + ctx.fileName)
+    op.InsertUnder(ctx.groupNull)
+    return op
+
+def prepareOptions(region=None):
+    #The options the C4D-independent preparation stage needs (see neuronbuild/batch.py).
+    #Levels of detail build their own meshes, so there is no full-detail mesh to pre-compute for them.
+    #A cropped import builds its geometry from the cropped sections, so there is none to pre-compute; it gets
+    #a spatial index over the sections instead.
+    #Resampling happens first, so everything after it (geometry, index, stats) sees the resampled sections.
+    #Repairing (see neuronbuild/validate.py) happens before that, right after the parse.
+    #region is the crop region (see importRegion), or None.
+    global NSides, DoMesh, DoVoxel, VoxelSize, DoLOD, DoInstance, ResampleSpacing, DoRepair
+    crop = region is not None
+    return dict(sides=NSides, mesh=(DoMesh == True and DoLOD != True and DoInstance != True and not crop),
+                voxel=(DoVoxel == True and not crop), voxelSize=VoxelSize, flipZ=(coordsystem=="left"), index=crop,
+                resample=ResampleSpacing, resampleRadius=RESAMPLE_RADIUS_SCALE, repair=(DoRepair == True))
+
+def importRegion():
+    #The region a new import is cropped to, or None when cropping is off or nothing was selected
+    global DoCrop
+    if DoCrop == True:
+        return cropRegion
+    return None
+
+def importCache():
+    #The cache to prepare files with, or None when caching is switched off
+    global DoCache
+    if DoCache == True:
+        return cache.Cache(CACHE_DIR, CACHE_BYTES)
+    return None
+
+def buildOptions():
+    #The build options chosen in the dialog, as BuildContext keyword arguments
+    global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, NSides, DoVB, DoVM, DoMesh, DoVoxel, VoxelSize, DoLOD, DoInstance, DoCompact, DoTypes, ResampleSpacing, DoRepair
+    return dict(DoHN=DoHN, DoConnect=DoConnect, DoRail=DoRail, DoSweep=DoSweep, DoSingleSpline=DoSingleSpline,
+                NSides=NSides, DoVB=DoVB, DoVM=DoVM, DoMesh=DoMesh, DoVoxel=DoVoxel, VoxelSize=VoxelSize,
+                DoLOD=DoLOD, DoInstance=DoInstance, DoCompact=DoCompact, DoTypes=DoTypes,
+                ResampleSpacing=ResampleSpacing, DoRepair=DoRepair)
+
+def effectiveOptions(options):
+    #The build options as the builders use them: each build mode switches off what it replaces
+    options = dict(options)
+
+    #the single spline goes with the section splines, which the mesh builders replace
+    if options["DoMesh"] == True or options["DoVoxel"] == True or options["DoInstance"] == True:
+        options["DoSingleSpline"] = False
+
+    #only the tube mesh is split by type
+    if options["DoMesh"] != True or options["DoVoxel"] == True or options["DoInstance"] == True:
+        options["DoTypes"] = False
+
+    #instances are kept as instances: Connect and SDS would collapse them into one heavy mesh again
+    if options["DoInstance"] == True and options["DoVoxel"] != True:
+        options["DoConnect"] = False
+        options["DoHN"] = False
+
+    #the internal voxelizer already produces the single mesh the volume objects were for
+    if options["DoVoxel"] == True:
+        options["DoVB"] = False
+        options["DoVM"] = False
+    return options
+
+def neuronContext(prepared, region=None):
+    #The build context for a prepared file with the dialog's options, plus the sections and soma rows to build:
+    #all of them, or those that reach into the crop region when there is one
+    morph = prepared.morph
+    sections = prepared.sections
+
+    #the soma rows are built separately from the axons, dendrites, and other structures
+    somaRows = (morph.types == swc.SOMA).nonzero()[0]
+
+    #the build context carries the data, the options and the parent objects to the builders
+    ctx = BuildContext(morph, morph.name, prepared.points, **effectiveOptions(buildOptions()))
+    ctx.geometry = prepared.geometry
+    ctx.stats = prepared.stats
+    if ctx.stats is None:
+        ctx.stats = stats.measure(morph, ctx.points)
+
+    #keep only the sections and soma samples that reach into the crop region
+    if region is not None:
+        with profiler.span("crop"):
+            ctx.region = region
+            ctx.geometry = None
+            index = prepared.index
+            if index is None:
+                index = spatial.segmentIndex(morph, sections, points=ctx.points)
+            kept = index.sectionMask(region)
+            sections = sections.subset(kept)
+            somaPoints = ctx.points[somaRows]
+            somaRows = somaRows[region.capsules(somaPoints, somaPoints, morph.radii[somaRows])]
+        print("Cropped %s to %r: %d of %d sections" % (ctx.fileName, region, len(sections), len(kept)))
+    return ctx, sections, somaRows
+
+def contentMake(ctx, sections, somaRows):
+    #call the functions that build the soma and other splines, if applicable, under ctx.groupNull
+    if ctx.DoVoxel == True:
+        with profiler.span("voxel"):
+            voxelMake(ctx)
+    else:
+        if len(somaRows) > 0:
+            with profiler.span("soma"):
+                somaMake(ctx, somaRows)
+
+        if len(sections) > 0:
+            if ctx.DoLOD == True:
+                with profiler.span("lod"):
+                    lodMake(ctx, sections)
+            else:
+                with profiler.span("neurites"):
+                    neuritesMake(ctx, sections)
 
-        #print bboxList
-        #print "The largest Dimension is ", largestSize , " and it's the " , largestAxis , " Axis"
+def wrapperMake(ctx):
+    #Wrap ctx.groupNull in the chosen generators (Connect, HyperNURBs, Volume Builder, Volume Mesher);
+    #returns the outermost one, which ends up at the top of the hierarchy
+    groupNull, fileName = ctx.groupNull, ctx.fileName
+    top = groupNull
 
     #create connect object
-    if DoConnect == True:
+    if ctx.DoConnect == True:
         #Create and name connect object
         Connect = c4d.BaseObject(c4d.Oconnector)
         Connect[c4d.ID_BASELIST_NAME] = "Connect_" + fileName
         Connect[c4d.CONNECTOBJECT_WELD] = False
-        #insert the connect object in the scene
-        doc.InsertObject(Connect)
-
-        #add undo for Connect creation
-        doc.AddUndo(c4d.UNDOTYPE_NEW, Connect)
-        c4d.EventAdd()
 
         #insert previously created group groupNull under Connect
         groupNull.InsertUnder(Connect)
+        top = Connect
 
     #create HN object
-    if DoHN == True:
+    if ctx.DoHN == True:
         HN = c4d.BaseObject(c4d.Osds)
         HN[c4d.ID_BASELIST_NAME] = "SDS_" + fileName
-        #insert the HyperNURBs in the scene
-        doc.InsertObject(HN)
-        #add undo for HN creation
-        doc.AddUndo(c4d.UNDOTYPE_NEW, HN)
-        c4d.EventAdd()
 
-        if DoConnect == True:
+        if ctx.DoConnect == True:
             Connect.InsertUnder(HN)
         else:
             groupNull.InsertUnder(HN)
+        top = HN
 
 
     #create Volume Builder object
-    if DoVB == True:
+    if ctx.DoVB == True:
         VB = c4d.BaseObject(c4d.Ovolumebuilder)
         VB[c4d.ID_BASELIST_NAME] = "Volume_Builder_" + fileName
-        #insert the Volume Builder in the scene
-        doc.InsertObject(VB)
-
-        #add undo for Volume Builder creation
-        doc.AddUndo(c4d.UNDOTYPE_NEW, VB)
-        c4d.EventAdd()
 
-        #set the appropriate voxel dimension
-        VoxelDim = (largestSize * 2) / 200
+        #set the appropriate voxel dimension: 1/200 of the neuron's largest extent, measured from the data
+        VoxelDim = ctx.stats.voxelSize()
         #set the voxel (grid) size of the volume builder
         VB[c4d.ID_VOLUMEBUILDER_GRID_SIZE] = float(VoxelDim)
 
-        if DoHN == True:
+        if ctx.DoHN == True:
             HN.InsertUnder(VB)
         else:
             groupNull.InsertUnder(VB)
+        top = VB
 
     #create Volume Mesher object
-    if DoVM == True:
+    if ctx.DoVM == True:
         VM = c4d.BaseObject(c4d.Ovolumemesher)
         VM[c4d.ID_BASELIST_NAME] = "Volume_Mesher_" + fileName
-        #insert the Volume Builder in the scene
-        doc.InsertObject(VM)
         #set the volume mesh threshold to a 60%
         VM[c4d.ID_VOLUMETOMESH_THRESHOLD] = float(0.6)
 
-        #add undo for Volume Builder creation
-        doc.AddUndo(c4d.UNDOTYPE_NEW, VM)
-        c4d.EventAdd()
-
-        if DoVB == True:
+        if ctx.DoVB == True:
             VB.InsertUnder(VM)
         else:
             groupNull.InsertUnder(VM)
+        top = VM
+
+    return top
+
+def readFile(path, prepared=None, redraw=True, shapes=None):
+    #Access the neuromorpho swc file and parse it once into typed column arrays (see neuronbuild/swc.py).
+    #A batch import passes the file already prepared by a worker process, and redraws once at the end,
+    #and in the instance mode shares one set of canonical frustums (shapes) between all its neurons.
+
+    #here we read the file and split the axons, dendrites etc. into unbranched sections using the parent links
+    if prepared is None:
+        with profiler.span("prepare"):
+            prepared = batch.prepareFile(path, prepareOptions(importRegion()), importCache())
+            #the stages prepareFile timed (a batch worker's times are recorded by batchImport)
+            for stage, seconds in prepared.timings.items():
+                profiler.record(stage, seconds)
+        if prepared.validation.serious():
+            print("%s: %s\n%s" % (prepared.name, "repaired" if prepared.repaired else "problems found",
+                                  prepared.validation.format()))
+        if prepared.resampled is not None:
+            print("%s: %s" % (prepared.name, prepared.resampled.format()))
+
+    ctx, sections, somaRows = neuronContext(prepared, importRegion())
+
+    #Get the name of the file and split off the last file extension
+    fileName = ctx.fileName
+
+    #the numlines variable stores the length of the data files (number of points)
+    numLines = len(ctx.morph)
+
+    #The whole hierarchy is assembled off-document: nothing below touches the scene until the
+    #finished objects are inserted at the end, as one undo step followed by a single EventAdd.
+    #topObjects collects the objects that go directly into the document.
+    topObjects = []
 
-    #close out the undo stack
+    #create null to contain splines for procedural hierarchy
+    groupNull = c4d.BaseObject(c4d.Onull)
+    groupNull[c4d.ID_BASELIST_NAME] = "groupNull_" + fileName
+    ctx.groupNull = groupNull
+
+    #the instances link to canonical frustums: this neuron's own, or a set shared by a batch
+    if ctx.DoInstance == True and ctx.DoVoxel != True:
+        if shapes is None:
+            shapes = instanceShapes(ctx.NSides, fileName)
+            shapes.InsertUnderLast(groupNull)
+        elif shapes.GetUp() is None and shapes.GetDocument() is None:
+            #shared by a batch: inserted with its first neuron
+            topObjects.append(shapes)
+        ctx.instanceShapes = shapes
+
+    profiler.count("samples", numLines)
+    profiler.count("sections", len(sections))
+
+    contentMake(ctx, sections, somaRows)
+
+    #Create single spline from all neuron spline segments: one multi-segment spline (and rail) built
+    #directly from the section table
+    startObject = railObject = None
+    if ctx.DoSingleSpline == True:
+        with profiler.span("singleSpline"):
+            startObject, railObject = singleSplineMake(ctx, sections)
+
+        #InsertObject puts each object at the top of the scene, so the rail ends up above the spline
+        topObjects.append(startObject)
+        if railObject is not None:
+            topObjects.append(railObject)
+
+    #the outermost wrapper ends up at the top of the hierarchy
+    with profiler.span("generators"):
+        topObjects.append(wrapperMake(ctx))
+
+    #remember where the neuron came from and how it was built, for updateNeuron
+    rememberNeuron(groupNull, path, buildOptions(), startObject, railObject, ctx.region)
+
+    #insert the finished hierarchy in one undo step, then redraw once
+    with profiler.span("insert"):
+        doc.StartUndo()
+        for op in topObjects:
+            doc.InsertObject(op)
+            doc.AddUndo(c4d.UNDOTYPE_NEW, op)
+        doc.EndUndo()
+        profiler.count("objects", len(topObjects))
+        if redraw:
+            c4d.EventAdd()
+
+def rememberNeuron(groupNull, path, options, startObject=None, railObject=None, region=None):
+    #Store the source file, the dialog options, the single spline objects and the crop region in a container on
+    #groupNull
+    record = c4d.BaseContainer(NEURON_RECORD)
+    record[RECORD_PATH] = path
+    for i, name in enumerate(RECORD_OPTIONS):
+        record[RECORD_FIRST_OPTION + i] = options[name]
+    record.SetLink(RECORD_SPLINE, startObject)
+    record.SetLink(RECORD_RAIL, railObject)
+    record[RECORD_CROP] = spatial.regionText(region) if region is not None else ""
+    groupNull.GetDataInstance().SetContainer(NEURON_RECORD, record)
+
+def neuronRecord(op):
+    #The (path, options, single spline, rail, crop region) readFile recorded on a neuron's groupNull, or None for
+    #other objects
+    record = op.GetDataInstance().GetContainer(NEURON_RECORD)
+    path = record[RECORD_PATH]
+    if not path:
+        return None
+    options = dict((name, record[RECORD_FIRST_OPTION + i]) for i, name in enumerate(RECORD_OPTIONS))
+    region = spatial.parseRegion(record[RECORD_CROP]) if record[RECORD_CROP] else None
+    return path, options, record.GetLink(RECORD_SPLINE, doc), record.GetLink(RECORD_RAIL, doc), region
+
+def findNeuron(op):
+    #The groupNull of the imported neuron op belongs to (op may be the neuron's top object, a wrapper, the
+    #groupNull itself or anything inside it), or None
+    while op.GetUp() is not None and neuronRecord(op) is None:
+        op = op.GetUp()
+    #from the top, follow the chain of wrappers down to the groupNull
+    while op is not None and neuronRecord(op) is None:
+        op = op.GetDown()
+    return op
+
+def descendants(op):
+    #every object below op, depth first
+    child = op.GetDown()
+    while child is not None:
+        yield child
+        for below in descendants(child):
+            yield below
+        child = child.GetNext()
+
+def updateNeuron(groupNull):
+    #Bring an imported neuron up to date with the dialog's options, changing only what they affect: the profile
+    #side count is set on the existing Profiles, rails and single splines are removed or added, and the
+    #generator wrappers are rebuilt around the unchanged groupNull. The neurites are only rebuilt for a new build
+    #mode (or sweeps, rails added, mesh sides), from the file's cached data. Returns the names of what changed.
+    #a cropped neuron stays cropped to the region it was imported with, whatever the dialog's Crop option says
+    path, recorded, startObject, railObject, region = neuronRecord(groupNull)
+    options = buildOptions()
+    old, new = effectiveOptions(recorded), effectiveOptions(options)
+    changed = [name for name in RECORD_OPTIONS if old[name] != new[name]]
+    if not changed:
+        return changed
+
+    splines = not (new["DoMesh"] == True or new["DoVoxel"] == True or new["DoInstance"] == True)
+    rebuild = any(old[name] != new[name] for name in ("DoSweep", "DoMesh", "DoVoxel", "DoLOD", "DoInstance",
+                                                           "DoCompact", "DoTypes", "ResampleSpacing", "DoRepair"))
+    rebuild = rebuild or (new["DoVoxel"] == True and old["VoxelSize"] != new["VoxelSize"])
+    rebuild = rebuild or (not splines and new["DoVoxel"] != True and old["NSides"] != new["NSides"])
+    rebuild = rebuild or (splines and new["DoRail"] == True and old["DoRail"] != True)
+    respline = old["DoSingleSpline"] != new["DoSingleSpline"] or (new["DoSingleSpline"] == True and (
+        (old["DoRail"] != True and new["DoRail"] == True) or old["ResampleSpacing"] != new["ResampleSpacing"]
+        or old["DoRepair"] != new["DoRepair"]))
+    #with the single spline kept and rails switched off, only its rail goes
+    dropRail = old["DoSingleSpline"] == True and new["DoSingleSpline"] == True and new["DoRail"] != True
+    rewrap = any(old[name] != new[name] for name in ("DoConnect", "DoHN", "DoVB", "DoVM"))
+
+    #the data is only needed to build something new; it comes from the cache when that is on
+    ctx = sections = somaRows = None
+    if rebuild or (respline and new["DoSingleSpline"] == True) or (rewrap and new["DoVB"] == True):
+        with profiler.span("prepare"):
+            ctx, sections, somaRows = neuronContext(batch.prepareFile(path, prepareOptions(region), importCache()),
+                                                    region)
+    else:
+        ctx = BuildContext(None, groupNull.GetName()[len("groupNull_"):], **new)
+    ctx.groupNull = groupNull
+
+    doc.StartUndo()
+    if rebuild:
+        with profiler.span("rebuild"):
+            for op in groupNull.GetChildren():
+                doc.AddUndo(c4d.UNDOTYPE_DELETEOBJ, op)
+                op.Remove()
+            if ctx.DoInstance == True and ctx.DoVoxel != True:
+                ctx.instanceShapes = instanceShapes(ctx.NSides, ctx.fileName)
+                ctx.instanceShapes.InsertUnderLast(groupNull)
+            contentMake(ctx, sections, somaRows)
+            for op in groupNull.GetChildren():
+                doc.AddUndo(c4d.UNDOTYPE_NEW, op)
+    elif splines:
+        for op in list(descendants(groupNull)):
+            #the profile side count, in place
+            if old["NSides"] != new["NSides"] and op.GetType() == c4d.Osplinenside:
+                doc.AddUndo(c4d.UNDOTYPE_CHANGE_SMALL, op)
+                op[c4d.PRIM_NSIDE_SIDES] = new["NSides"]
+            #the rails splineMake put under each Sweep
+            elif new["DoRail"] != True and old["DoRail"] == True and op.GetName().endswith(" Rail"):
+                doc.AddUndo(c4d.UNDOTYPE_DELETEOBJ, op)
+                op.Remove()
+
+    if dropRail and railObject is not None:
+        doc.AddUndo(c4d.UNDOTYPE_DELETEOBJ, railObject)
+        railObject.Remove()
+        railObject = None
+
+    if respline:
+        #the new splines go where the old ones were (the rail above the spline), or, when there were none, just
+        #below the neuron's top object, as readFile puts them
+        replaced = [op for op in (railObject, startObject) if op is not None]
+        if replaced:
+            parent, pred = replaced[0].GetUp(), replaced[0].GetPred()
+            while pred is not None and pred in replaced:
+                pred = pred.GetPred()
+        else:
+            pred = groupNull
+            while pred.GetUp() is not None:
+                pred = pred.GetUp()
+            parent = pred.GetUp()
+        for op in replaced:
+            doc.AddUndo(c4d.UNDOTYPE_DELETEOBJ, op)
+            op.Remove()
+        startObject = railObject = None
+        if ctx.DoSingleSpline == True:
+            startObject, railObject = singleSplineMake(ctx, sections)
+            #each is inserted right after pred, so the rail, inserted last, ends up above the spline
+            for op in (startObject, railObject):
+                if op is not None:
+                    doc.InsertObject(op, parent=parent, pred=pred)
+                    doc.AddUndo(c4d.UNDOTYPE_NEW, op)
+
+    if rewrap:
+        #swap the old wrapper chain for a new one at the same place in the scene
+        oldTop = groupNull
+        while oldTop.GetUp() is not None:
+            oldTop = oldTop.GetUp()
+        parent, pred = oldTop.GetUp(), oldTop.GetPred()
+        #the groupNull moves (with everything in it) from the old wrappers to the new ones
+        doc.AddUndo(c4d.UNDOTYPE_CHANGE, groupNull)
+        groupNull.Remove()
+        if oldTop is not groupNull:
+            doc.AddUndo(c4d.UNDOTYPE_DELETEOBJ, oldTop)
+            oldTop.Remove()
+        with profiler.span("generators"):
+            newTop = wrapperMake(ctx)
+        doc.InsertObject(newTop, parent=parent, pred=pred)
+        if newTop is not groupNull:
+            doc.AddUndo(c4d.UNDOTYPE_NEW, newTop)
+
+    doc.AddUndo(c4d.UNDOTYPE_CHANGE_SMALL, groupNull)
+    rememberNeuron(groupNull, path, options, startObject, railObject, region)
     doc.EndUndo()
+    return changed
+
+def updateSelected():
+    #Update every imported neuron that has an object selected to the dialog's options
+    neurons = []
+    for op in doc.GetActiveObjects(c4d.GETACTIVEOBJECTFLAGS_NONE):
+        groupNull = findNeuron(op)
+        if groupNull is not None and groupNull not in neurons:
+            neurons.append(groupNull)
+    if not neurons:
+        print("Select imported neurons to update.")
+        return
+    for groupNull in neurons:
+        name = groupNull.GetName()[len("groupNull_"):]
+        try:
+            changed = updateNeuron(groupNull)
+        except (ValueError, OSError) as e:
+            #e.g. the file is gone, or loops and Repair was switched off
+            gui.MessageDialog("Could not update %s:\n%s" % (name, e))
+            continue
+        print("%s: %s" % (name, ", ".join(changed) or "up to date"))
+    c4d.EventAdd()
+
+def batchWorkers():
+    #Worker processes are spawned from sys.executable, which inside the Cinema 4D app is the app itself;
+    #use them only from a real Python interpreter (c4dpy, or the headless harness), else prepare in-process
+    exe = os.path.basename(sys.executable or "").lower()
+    if exe.startswith(("python", "c4dpy")):
+        return None
+    return 0
+
+def batchImport(pattern, workers=None):
+    #Import every SWC file in a folder (or matching a glob pattern). Files are parsed and their geometry
+    #pre-computed in worker processes, and each one is built into the document as soon as it is ready.
+    #A file that fails is reported at the end and does not stop the batch. Returns the batch.Report.
+    paths = batch.findFiles(pattern)
+    report = batch.Report()
+    if not paths:
+        print("No SWC files found in " + pattern)
+        return report
+    if workers is None:
+        workers = batchWorkers()
+
+    #in the instance mode every neuron links to the same canonical frustums
+    shapes = instanceShapes(NSides, "Batch") if DoInstance == True else None
+    for result in batch.prepareAll(paths, prepareOptions(importRegion()), workers=workers, cache=importCache()):
+        if isinstance(result, batch.Prepared):
+            #stage times measured in the worker, summed over the batch
+            profiler.record("prepare", sum(result.timings.values()))
+            for stage, seconds in result.timings.items():
+                profiler.record("prepare/" + stage, seconds)
+            start = time.perf_counter()
+            try:
+                with profiler.span("build"):
+                    readFile(result.path, prepared=result, redraw=False, shapes=shapes)
+                result.timings["build"] = time.perf_counter() - start
+            except Exception as e:
+                result = batch.Failure(result.path, "%s: %s" % (type(e).__name__, e))
+        report.add(result)
+
+    with profiler.span("redraw"):
+        c4d.EventAdd()
+    print(report.format())
+    return report
+
+def regionOf(op):
+    #The region to crop to (see neuronbuild/spatial.py): the view of a camera, or the world-space bounding box
+    #of any other object; None when nothing is selected
+    if op is None:
+        return None
+    mg = op.GetMg()
+    if op.GetType() == c4d.Ocamera:
+        near = far = None
+        if op[c4d.CAMERAOBJECT_NEAR_CLIPPING_ENABLE]:
+            near = op[c4d.CAMERAOBJECT_NEAR_CLIPPING]
+        if op[c4d.CAMERAOBJECT_FAR_CLIPPING_ENABLE]:
+            far = op[c4d.CAMERAOBJECT_FAR_CLIPPING]
+        axes = [tuple(v.GetNormalized()) for v in (mg.v1, mg.v2, mg.v3)]
+        return spatial.Frustum.perspective(tuple(mg.off), axes[0], axes[1], axes[2], op[c4d.CAMERAOBJECT_FOV],
+                                           op[c4d.CAMERAOBJECT_FOV_VERTICAL], near=near or 0.0, far=far)
+    centre, rad = op.GetMp(), op.GetRad()
+    corners = [mg * (centre + c4d.Vector(sx * rad.x, sy * rad.y, sz * rad.z))
+               for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)]
+    return spatial.Box([min(p[i] for p in corners) for i in range(3)], [max(p[i] for p in corners) for i in range(3)])
+
+def profileReport():
+    #Print the stage timings of the last import, and write them to PROFILE_FILE if that is set
+    print(profiler.report())
+    if PROFILE_FILE:
+        profiler.write(PROFILE_FILE)
+        print("Profile written to " + PROFILE_FILE)
 
 
 class SettingsDlg(gui.GeDialog):
@@ -610,12 +1082,58 @@ class SettingsDlg(gui.GeDialog):
         self.AddCheckbox(VOLUMEMESHERCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Add Volume Mesher object")
         self.SetBool(VOLUMEMESHERCHECK, False)
 
+        self.AddCheckbox(MESHCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Build polygon mesh directly (no Sweep/SDS generators)")
+        self.SetBool(MESHCHECK, False)
+
+        self.AddCheckbox(VOXELCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Voxelize internally into one mesh (replaces Volume Builder)")
+        self.SetBool(VOXELCHECK, False)
+
+        self.AddStaticText(VOXELTEXT, flags=c4d.BFH_LEFT, initw=400, inith=0, name="Voxel size in µm (0 = automatic):")
+
+        self.AddEditNumberArrows(VOXELSIZE, flags=c4d.BFH_LEFT, initw=100, inith=0)
+        self.SetFloat(VOXELSIZE, 0.0, min=0.0, max=100.0, step=0.1)
+
+        self.AddStaticText(RESAMPLETEXT, flags=c4d.BFH_LEFT, initw=400, inith=0, name="Resample sections to a spacing in µm (0 = off):")
+
+        self.AddEditNumberArrows(RESAMPLESPACING, flags=c4d.BFH_LEFT, initw=100, inith=0)
+        self.SetFloat(RESAMPLESPACING, 0.0, min=0.0, max=100.0, step=0.1)
+
+        self.AddCheckbox(BATCHCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Batch: import every SWC file in a folder")
+        self.SetBool(BATCHCHECK, False)
+
+        self.AddCheckbox(CACHECHECK, flags=c4d.BFH_LEFT, initw=300, inith=0,
+                         name="Cache parsed files and geometry for re-imports (up to %d MB in %s)" % (
+                             CACHE_BYTES >> 20, CACHE_DIR))
+        self.SetBool(CACHECHECK, False)
+
+        self.AddCheckbox(LODCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Build levels of detail (LOD object with simplified copies)")
+        self.SetBool(LODCHECK, False)
+
+        self.AddCheckbox(PROFILECHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Print a timing report after the import")
+        self.SetBool(PROFILECHECK, False)
+
+        self.AddCheckbox(INSTANCECHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Instance unit frustums per segment (for scenes with many neurons)")
+        self.SetBool(INSTANCECHECK, False)
+
+        self.AddCheckbox(CROPCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Crop: build only what is inside the selected object or camera view")
+        self.SetBool(CROPCHECK, False)
+
+        self.AddCheckbox(COMPACTCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Compact: one sweep per neurite type")
+        self.SetBool(COMPACTCHECK, False)
+
+        self.AddCheckbox(TYPESCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Mesh: one object per neurite type")
+        self.SetBool(TYPESCHECK, False)
+
+        self.AddCheckbox(REPAIRCHECK, flags=c4d.BFH_LEFT, initw=300, inith=0, name="Repair bad files (loops, missing parents, bad radii) instead of stopping")
+        self.SetBool(REPAIRCHECK, False)
+
         self.GroupEnd()
 
 
-        self.GroupBegin(DLG_GROUP_2, flags=c4d.BFH_RIGHT|c4d.BFV_BOTTOM, cols=2, rows=1, title="", groupflags=5)
+        self.GroupBegin(DLG_GROUP_2, flags=c4d.BFH_RIGHT|c4d.BFV_BOTTOM, cols=3, rows=1, title="", groupflags=5)
         self.GroupBorderSpace(20, 20, 20, 20)
         self.AddButton(CANCELBUTTON, flags=c4d.BFH_RIGHT, name="Cancel")
+        self.AddButton(UPDATEBUTTON, flags=c4d.BFH_RIGHT, name="Update Selected")
         self.AddButton(IMPORTBUTTON, flags=c4d.BFH_RIGHT, name="Import File")
         self.GroupEnd()
 
@@ -632,9 +1150,9 @@ class SettingsDlg(gui.GeDialog):
 
     def Command(self, id, msg):
         #reference global variables that set model parameters
-        global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, NSides, DoVB, DoVM
+        global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, NSides, DoVB, DoVM, DoMesh, DoVoxel, VoxelSize, DoBatch, DoCache, DoLOD, DoProfile, DoInstance, DoCrop, DoCompact, DoTypes, ResampleSpacing, DoRepair
         #handle user input
-        if id==IMPORTBUTTON:
+        if id==IMPORTBUTTON or id==UPDATEBUTTON:
             close = True
             DoHN = self.GetBool(HNCHECK)
             DoConnect = self.GetBool(CONNECTCHECK)
@@ -645,8 +1163,22 @@ class SettingsDlg(gui.GeDialog):
 
             DoVB = self.GetBool(VOLUMEBUILDERCHECK)
             DoVM = self.GetBool(VOLUMEMESHERCHECK)
-
-            self.result = True
+            DoMesh = self.GetBool(MESHCHECK)
+            DoVoxel = self.GetBool(VOXELCHECK)
+            VoxelSize = self.GetFloat(VOXELSIZE)
+            ResampleSpacing = self.GetFloat(RESAMPLESPACING)
+            DoBatch = self.GetBool(BATCHCHECK)
+            DoCache = self.GetBool(CACHECHECK)
+            DoLOD = self.GetBool(LODCHECK)
+            DoProfile = self.GetBool(PROFILECHECK)
+            DoInstance = self.GetBool(INSTANCECHECK)
+            DoCrop = self.GetBool(CROPCHECK)
+            DoCompact = self.GetBool(COMPACTCHECK)
+            DoTypes = self.GetBool(TYPESCHECK)
+            DoRepair = self.GetBool(REPAIRCHECK)
+
+            #"update" applies the options to the selected neurons instead of importing a file
+            self.result = "update" if id==UPDATEBUTTON else True
 
         elif id==CANCELBUTTON:
             close = True
@@ -663,6 +1195,19 @@ class SettingsDlg(gui.GeDialog):
 
             DoVB = self.GetBool(VOLUMEBUILDERCHECK)
             DoVM = self.GetBool(VOLUMEMESHERCHECK)
+            DoMesh = self.GetBool(MESHCHECK)
+            DoVoxel = self.GetBool(VOXELCHECK)
+            VoxelSize = self.GetFloat(VOXELSIZE)
+            ResampleSpacing = self.GetFloat(RESAMPLESPACING)
+            DoBatch = self.GetBool(BATCHCHECK)
+            DoCache = self.GetBool(CACHECHECK)
+            DoLOD = self.GetBool(LODCHECK)
+            DoProfile = self.GetBool(PROFILECHECK)
+            DoInstance = self.GetBool(INSTANCECHECK)
+            DoCrop = self.GetBool(CROPCHECK)
+            DoCompact = self.GetBool(COMPACTCHECK)
+            DoTypes = self.GetBool(TYPESCHECK)
+            DoRepair = self.GetBool(REPAIRCHECK)
 
         if close:
             self.Close()
@@ -675,28 +1220,59 @@ def open_settings_dialog(default=None, title=None, width=300, height=400):
     return dialog.result
 
 def main():
-    #Call the readfile function. Start undo here.
+    #Call the readfile function, which adds the neuron to the document as a single undo step.
 
     #reference global variables that set model parameters
-    global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, NSides, DoVB, DoVM
+    global DoHN, DoConnect, DoRail, DoSweep, DoSingleSpline, NSides, DoVB, DoVM, DoMesh, DoVoxel, VoxelSize, DoBatch, DoCache, DoLOD, DoProfile, DoInstance, DoCrop, DoCompact, DoTypes, ResampleSpacing, DoRepair
+    global cropRegion
 
     value = open_settings_dialog("test", "test")
 
+    #the profiler only records anything when the option is on; its hooks cost next to nothing otherwise
+    profiler.enabled = (value is not None and DoProfile == True)
+    profiler.reset()
+
+    #the crop region is taken from the selection before the file browser opens; an update keeps each neuron's own
+    #(the selection is then the neurons themselves)
+    cropRegion = None
+    if value is not None and value != "update" and DoCrop == True:
+        cropRegion = regionOf(doc.GetActiveObject())
+        if cropRegion is None:
+            print("Nothing selected to crop to; importing everything.")
+
     #test to see wehther the dialog "Cancel" button is pressed
     if value is None:
         print("Cancelled.")
+    elif value == "update":
+        with profiler.span("update"):
+            updateSelected()
+    elif DoBatch == True:
+        #choose a folder and import every swc file in it
+        folder = c4d.storage.LoadDialog(title="Choose a folder of SWC files", flags=c4d.FILESELECT_DIRECTORY)
+        if folder:
+            with profiler.span("batch"):
+                batchImport(folder)
+        else:
+            print("Cancelled in Browser.")
     else:
-        doc.StartUndo()
-
         # open the C4D file browser to allow the user to choose a text file to read
         neuromorphoFile = c4d.storage.LoadDialog()
 
         # run the read file procedure
         if neuromorphoFile:
-            readFile(neuromorphoFile)
+            #a file that cannot be read or built (a bad line, or parent links that loop without Repair) is
+            #reported in a dialog; nothing has been added to the document at that point
+            try:
+                with profiler.span("import"):
+                    readFile(neuromorphoFile)
+            except (ValueError, OSError) as e:
+                gui.MessageDialog("Could not import %s:\n%s" % (os.path.basename(neuromorphoFile), e))
         else:
             print("Cancelled in Browser.")
 
+    if profiler.enabled:
+        profileReport()
+
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,34 @@
+"""
+Benchmark: tube mesh generation (neuronbuild/mesh.py) in polygons per second.
+
+Usage: python benchmarks/bench_mesh.py [samples ...] [--sides N]
+"""
+
+import argparse, os, sys, time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from neuronbuild import swc, topology, mesh
+import synthetic
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("samples", nargs="*", type=int, default=[10000, 100000, 500000])
+    parser.add_argument("--sides", type=int, default=6)
+    args = parser.parse_args(argv)
+
+    print("%10s %10s %12s %10s %14s" % ("samples", "sections", "polygons", "time (s)", "polygons/s"))
+    for size in args.samples:
+        morph = swc.fromArray(np.array(synthetic.randomNeuron(size), dtype=np.float64))
+        sections = topology.buildSections(morph)
+        start = time.perf_counter()
+        tubes = mesh.tubeMesh(morph, sections, args.sides)
+        elapsed = time.perf_counter() - start
+        print("%10d %10d %12d %10.3f %14.0f" % (size, len(sections), len(tubes.polygons), elapsed,
+                                                 len(tubes.polygons) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark: string-list parse (NeuronBuild 1.9 readFile) against the columnar loader.
+
+The legacy path is timed the way the builders used it: split every line into strings,
+then float() each coordinate twice (spline pass and rail pass). The last column opens the
+same data converted to NBM (neuronbuild/nbm.py), which is memory-mapped instead of parsed.
+
+Usage: python benchmarks/bench_parse.py [samples ...]
+"""
+
+import os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from neuronbuild import swc, nbm
+import synthetic
+
+
+def legacyParse(path):
+    """The nested string-list parse and conversions from NeuronBuild 1.9."""
+    neuroFile = []
+    for line in open(path):
+        if line.startswith('#'):
+            pass
+        else:
+            neuroFile.append([value for value in line.split()])
+    for rail in (False, True):
+        for currLine in neuroFile:
+            sRad = float(currLine[5])
+            sx = float(currLine[2]) + (sRad if rail else 0.0)
+            sy = float(currLine[3])
+            sz = float(currLine[4])
+            int(currLine[0]), int(currLine[6])
+    return neuroFile
+
+
+def columnarParse(path):
+    return swc.readSWC(path)
+
+
+def nbmOpen(path):
+    return nbm.read(path)
+
+
+def timeIt(func, path, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(sizes):
+    print("%10s %12s %12s %8s %12s" % ("samples", "legacy (s)", "columnar (s)", "speedup", "nbm (s)"))
+    for size in sizes:
+        fd, path = tempfile.mkstemp(suffix=".swc")
+        os.close(fd)
+        try:
+            synthetic.writeSWC(path, synthetic.randomNeuron(size))
+            legacy = timeIt(legacyParse, path)
+            columnar = timeIt(columnarParse, path)
+            nbm.convert(path, path + nbm.EXTENSION)
+            mapped = timeIt(nbmOpen, path + nbm.EXTENSION)
+            print("%10d %12.4f %12.4f %7.1fx %12.5f" % (size, legacy, columnar, legacy / columnar, mapped))
+        finally:
+            os.remove(path)
+            if os.path.exists(path + nbm.EXTENSION):
+                os.remove(path + nbm.EXTENSION)
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10000, 100000])
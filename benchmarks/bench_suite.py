@@ -0,0 +1,211 @@
+"""
+Benchmark suite: the whole import pipeline over a grid of synthetic neurons, stored as JSON.
+
+Every scenario is a synthetic neuron (benchmarks/synthetic.py) of a given size, branching
+probability, branching factor and sample spacing. For each scenario the suite measures:
+  parse      neuronbuild SWC parse time
+  sections   neuronbuild section decomposition time
+(both always time the neuronbuild package next to this file, whatever --script is; the
+output labels them "nb parse" and "nb sections") and, for each build mode in MODES
+(spline: the dialog defaults, mesh, voxel, ...), a full headless import of --script
+against the stub c4d module (benchmarks/headless.py):
+  import     wall time of readFile
+  objects    objects in the resulting scene
+  calls      every stub call count (SetPoint, SetAllPoints, InsertObject, EventAdd, ...)
+  pointCalls SetPoint + SetAllPoints calls (point uploads, however they are batched)
+  peakMemory peak Python/NumPy allocation during the import, from a separate tracemalloc pass
+
+Times are the best of --repeat runs. Results go to a JSON file together with the script's
+hash and the git revision, and --compare prints the change against an earlier results file
+(returning 1 if anything got slower than --threshold or made more scene calls).
+Benchmark another version of the importer with --script, e.g. the 1.9 release from git:
+    git show <rev>:NeuronBuild_1.9.py > /tmp/v19.py
+    python benchmarks/bench_suite.py --script /tmp/v19.py --output v19.json
+
+Usage: python benchmarks/bench_suite.py [--quick] [--modes spline,mesh] [--output results.json]
+                                        [--compare old.json] [--script path]
+"""
+
+import argparse, datetime, hashlib, json, os, platform, subprocess, sys, tempfile, time, tracemalloc
+
+import numpy as np
+
+import headless
+from neuronbuild import swc, topology
+import synthetic
+
+#name: (samples, branchProbability, children, spacing)
+SCENARIOS = {
+    "size-1k": (1000, 0.02, 2, 1.5),
+    "size-10k": (10000, 0.02, 2, 1.5),
+    "size-100k": (100000, 0.02, 2, 1.5),
+    "branchy-10k": (10000, 0.1, 2, 1.5),
+    "trifurcating-10k": (10000, 0.02, 3, 1.5),
+    "dense-10k": (10000, 0.02, 2, 0.3),
+    "sparse-10k": (10000, 0.02, 2, 5.0),
+}
+
+#scenarios left out by --quick
+LARGE = ("size-100k",)
+
+#build mode: headless options
+MODES = {
+    "spline": {},
+    "spline-resampled": dict(ResampleSpacing=2.0),
+    "compact": dict(DoCompact=True),
+    "mesh": dict(DoMesh=True),
+    "mesh-types": dict(DoMesh=True, DoTypes=True),
+    "voxel": dict(DoVoxel=True),
+}
+
+#counters compared by --compare (lower is better)
+TRACKED_CALLS = ("pointCalls", "InsertObject", "InsertUnder", "EventAdd", "SearchObject", "BaseObject")
+
+#time differences below this many seconds are never reported as regressions
+NOISE = 0.005
+
+
+def best(func, repeat):
+    """Return the shortest of repeat timed calls of func."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def countObjects(doc):
+    """Number of objects in a stub document, children included."""
+    def count(op):
+        return 1 + sum(count(child) for child in op.GetChildren())
+    return sum(count(op) for op in doc.GetObjects())
+
+
+def runImport(script, path, options):
+    """One headless import into a fresh document; returns (document, call counts)."""
+    script.doc = headless.c4d.BaseDocument()
+    return headless.runImport(path, script=script, **options)
+
+
+def measureScenario(script, path, modes, repeat):
+    """Return the result dicts for one SWC file: one per mode."""
+    parse = best(lambda: swc.readSWC(path), repeat)
+    morph = swc.readSWC(path)
+    sections = best(lambda: topology.buildSections(morph), repeat)
+    results = []
+    for mode in modes:
+        options = MODES[mode]
+        elapsed = best(lambda: runImport(script, path, options), repeat)
+        doc, calls = runImport(script, path, options)
+        tracemalloc.start()
+        runImport(script, path, options)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        calls["pointCalls"] = calls.get("SetPoint", 0) + calls.get("SetAllPoints", 0)
+        results.append(dict(mode=mode, samples=len(morph), parse=parse, sections=sections, importTime=elapsed,
+                            objects=countObjects(doc), calls=calls, peakMemory=peak))
+    return results
+
+
+def metadata(scriptPath):
+    """Describe what was benchmarked, so result files from different versions can be told apart."""
+    with open(scriptPath, "rb") as f:
+        scriptHash = hashlib.sha1(f.read()).hexdigest()
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=headless.ROOT,
+                                           stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return dict(date=datetime.datetime.now().isoformat(timespec="seconds"), script=os.path.abspath(scriptPath),
+                scriptSha1=scriptHash, gitRevision=revision, python=platform.python_version(),
+                numpy=np.__version__, platform=platform.platform())
+
+
+def callCount(result, name):
+    """A call counter of a result; pointCalls is derived for results that predate it."""
+    calls = result["calls"]
+    if name == "pointCalls" and name not in calls:
+        return calls.get("SetPoint", 0) + calls.get("SetAllPoints", 0)
+    return calls.get(name, 0)
+
+
+def compare(old, new, threshold):
+    """Print the change of every shared result; returns the list of regressions."""
+    before = dict(((r["scenario"], r["mode"]), r) for r in old["results"])
+    regressions = []
+    print("%-18s %-16s %12s %12s %8s %10s" % ("scenario", "mode", "import old", "import new", "ratio", "memory"))
+    for r in new["results"]:
+        o = before.get((r["scenario"], r["mode"]))
+        if o is None:
+            continue
+        ratio = r["importTime"] / max(o["importTime"], 1e-9)
+        memory = r["peakMemory"] / max(o["peakMemory"], 1)
+        print("%-18s %-16s %12.4f %12.4f %7.2fx %9.2fx" % (r["scenario"], r["mode"], o["importTime"],
+                                                       r["importTime"], ratio, memory))
+        label = "%s/%s" % (r["scenario"], r["mode"])
+        for metric, shown in (("parse", "nb parse"), ("sections", "nb sections"), ("importTime", "import")):
+            if r[metric] > o[metric] * (1.0 + threshold) and r[metric] - o[metric] > NOISE:
+                regressions.append("%s: %s %.4f s -> %.4f s" % (label, shown, o[metric], r[metric]))
+        for name in TRACKED_CALLS:
+            if callCount(r, name) > callCount(o, name):
+                regressions.append("%s: %s %d -> %d" % (label, name, callCount(o, name), callCount(r, name)))
+    for line in regressions:
+        print("REGRESSION " + line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="leave out the large scenarios")
+    parser.add_argument("--scenarios", default=None, help="comma-separated scenario names (default: all)")
+    parser.add_argument("--modes", default="spline,mesh",
+                        help="comma-separated build modes: %s" % ", ".join(MODES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--script", default=headless.SCRIPT, help="importer script to benchmark")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    if args.quick:
+        names = [n for n in names if n not in LARGE]
+    modes = args.modes.split(",")
+    script = headless.loadScript(args.script)
+
+    results = []
+    if os.path.abspath(args.script) != os.path.abspath(headless.SCRIPT):
+        print("nb parse and nb sections time the neuronbuild package in %s, not %s" % (headless.ROOT, args.script))
+    print("%-18s %-16s %9s %9s %11s %9s %8s %10s %9s" % ("scenario", "mode", "samples", "nb parse", "nb sections",
+                                                         "import", "objects", "pt calls", "peak MB"))
+    for name in names:
+        samples, branchProbability, children, spacing = SCENARIOS[name]
+        fd, path = tempfile.mkstemp(suffix=".swc")
+        os.close(fd)
+        try:
+            synthetic.writeSWC(path, synthetic.randomNeuron(samples, branchProbability, children=children,
+                                                            spacing=spacing))
+            for r in measureScenario(script, path, modes, args.repeat):
+                r.update(scenario=name, branchProbability=branchProbability, children=children, spacing=spacing)
+                results.append(r)
+                print("%-18s %-16s %9d %9.4f %11.4f %9.4f %8d %10d %9.1f" % (
+                    name, r["mode"], r["samples"], r["parse"], r["sections"], r["importTime"], r["objects"],
+                    r["calls"]["pointCalls"], r["peakMemory"] / 1e6))
+        finally:
+            os.remove(path)
+
+    report = dict(meta=metadata(args.script), results=results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, report, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Benchmark: signed-distance voxelizer (neuronbuild/voxel.py) at several voxel sizes.
+
+Usage: python benchmarks/bench_voxel.py [--samples N] [--workers N] [voxelSize ...]
+"""
+
+import argparse, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from neuronbuild import swc, topology, voxel
+import synthetic
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=float, default=[1.0, 0.5])
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes evaluating blocks")
+    args = parser.parse_args(argv)
+
+    morph = swc.fromArray(np.array(synthetic.randomNeuron(args.samples), dtype=np.float64))
+    sections = topology.buildSections(morph, exclude=())
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    print("%10s %8s %12s %10s" % ("voxel", "blocks", "triangles", "time (s)"))
+    for size in args.sizes:
+        start = time.perf_counter()
+        blocks = len(voxel.Grid(voxel.capsules(morph, sections), size))
+        surface = voxel.voxelize(morph, sections, size, executor=executor)
+        elapsed = time.perf_counter() - start
+        print("%10.3f %8d %12d %10.3f" % (size, blocks, len(surface.polygons), elapsed))
+    if executor is not None:
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
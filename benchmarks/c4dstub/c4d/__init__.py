@@ -0,0 +1,438 @@
+"""
+Minimal stand-in for the Cinema 4D c4d module, for running NeuronBuild headless.
+Objects keep their points, parameters and hierarchy; the document and c4d.EventAdd
+count every call so benchmarks and checks can see how much scene traffic an import makes.
+"""
+
+import collections, itertools
+
+#every call the importer makes into the scene, keyed by name
+calls = collections.Counter()
+
+_ids = itertools.count(100000)
+_constants = {}
+
+#constants the stub itself refers to; everything else comes from __getattr__ below
+ID_BASELIST_NAME = 900
+Ospline = 5101
+Opolygon = 5100
+Onull = 5140
+Oinstance = 5126
+SPLINEOBJECT_TYPE = 1000
+MCOMMAND_JOIN = 12144
+
+
+def __getattr__(name):
+    #any c4d constant (Ospline, SWEEPOBJECT_CONSTANT, ...) resolves to a stable unique int
+    if not name[:1].isupper():
+        raise AttributeError(name)
+    if name not in _constants:
+        _constants[name] = next(_ids)
+    return _constants[name]
+
+
+def reset():
+    """Clear the call counters."""
+    calls.clear()
+
+
+def GetC4DVersion():
+    return 24000
+
+
+def EventAdd(flags=0):
+    calls["EventAdd"] += 1
+
+
+class Vector(object):
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x=0.0, y=None, z=None):
+        if y is None:
+            y = z = x
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __getitem__(self, i):
+        return (self.x, self.y, self.z)[i]
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __add__(self, o):
+        return Vector(self.x + o.x, self.y + o.y, self.z + o.z)
+
+    def __sub__(self, o):
+        return Vector(self.x - o.x, self.y - o.y, self.z - o.z)
+
+    def __mul__(self, s):
+        return Vector(self.x * s, self.y * s, self.z * s)
+
+    def __repr__(self):
+        return "Vector(%g, %g, %g)" % (self.x, self.y, self.z)
+
+
+class Matrix(object):
+
+    def __init__(self, off=None, v1=None, v2=None, v3=None):
+        self.off = off or Vector(0.0)
+        self.v1 = v1 or Vector(1.0, 0.0, 0.0)
+        self.v2 = v2 or Vector(0.0, 1.0, 0.0)
+        self.v3 = v3 or Vector(0.0, 0.0, 1.0)
+
+
+class CPolygon(object):
+    __slots__ = ("a", "b", "c", "d")
+
+    def __init__(self, a, b, c, d=None):
+        self.a, self.b, self.c = a, b, c
+        self.d = c if d is None else d
+
+
+class BaseContainer(object):
+
+    def __init__(self, id=0):
+        self._id = id
+        self._values = {}
+
+    def __getitem__(self, key):
+        return self._values.get(key)
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def GetId(self):
+        return self._id
+
+    def GetContainer(self, id):
+        value = self._values.get(id)
+        return value.GetClone() if isinstance(value, BaseContainer) else BaseContainer()
+
+    def SetContainer(self, id, bc):
+        self._values[id] = bc.GetClone()
+
+    def GetLink(self, id, doc=None):
+        return self._values.get(("link", id))
+
+    def SetLink(self, id, op):
+        self._values[("link", id)] = op
+
+    def GetClone(self, flags=0):
+        clone = BaseContainer(self._id)
+        clone._values = dict(self._values)
+        return clone
+
+
+class BaseList2D(object):
+
+    def __init__(self, type=0):
+        self._type = type
+        self._data = {}
+        self._name = ""
+        self._container = BaseContainer()
+
+    def __getitem__(self, key):
+        if key == ID_BASELIST_NAME:
+            return self._name
+        return self._data.get(key)
+
+    def __setitem__(self, key, value):
+        if key == ID_BASELIST_NAME:
+            self._name = value
+        else:
+            self._data[key] = value
+
+    def GetName(self):
+        return self._name
+
+    def SetName(self, name):
+        self._name = name
+
+    def GetType(self):
+        return self._type
+
+    def GetDataInstance(self):
+        return self._container
+
+
+class BaseTag(BaseList2D):
+    pass
+
+
+class VariableTag(BaseTag):
+
+    def __init__(self, type, count):
+        BaseTag.__init__(self, type)
+        self._values = [0.0] * count
+
+    def SetAllHighlevelData(self, values):
+        calls["SetAllHighlevelData"] += 1
+        self._values = list(values)
+
+    def GetAllHighlevelData(self):
+        return list(self._values)
+
+
+class BaseObject(BaseList2D):
+
+    def __init__(self, type=0):
+        BaseList2D.__init__(self, type)
+        calls["BaseObject"] += 1
+        self._parent = None
+        self._children = []
+        self._tags = []
+        self._points = []
+        self._segments = []
+        self._polygons = []
+        self._doc = None
+        self._matrices = []
+
+    #hierarchy
+    def InsertUnder(self, parent):
+        calls["InsertUnder"] += 1
+        self.Remove()
+        self._parent = parent
+        parent._children.insert(0, self)
+
+    def InsertUnderLast(self, parent):
+        calls["InsertUnder"] += 1
+        self.Remove()
+        self._parent = parent
+        parent._children.append(self)
+
+    def Remove(self):
+        if self._parent is not None:
+            self._parent._children.remove(self)
+            self._parent = None
+        elif self._doc is not None:
+            self._doc._objects.remove(self)
+            self._doc = None
+
+    def GetUp(self):
+        return self._parent
+
+    def GetChildren(self):
+        return list(self._children)
+
+    def GetDown(self):
+        return self._children[0] if self._children else None
+
+    def GetPred(self):
+        siblings = self._parent._children if self._parent is not None else (
+            self._doc._objects if self._doc is not None else [self])
+        i = siblings.index(self)
+        return siblings[i - 1] if i > 0 else None
+
+    def GetNext(self):
+        siblings = self._parent._children if self._parent is not None else (
+            self._doc._objects if self._doc is not None else [self])
+        i = siblings.index(self)
+        return siblings[i + 1] if i + 1 < len(siblings) else None
+
+    def GetDocument(self):
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node._doc
+
+    #tags
+    def InsertTag(self, tag):
+        self._tags.append(tag)
+
+    def MakeTag(self, type):
+        tag = BaseTag(type)
+        self._tags.append(tag)
+        return tag
+
+    def GetTags(self):
+        return list(self._tags)
+
+    #points and segments
+    def ResizeObject(self, pcnt, scnt=None, vcnt=None):
+        calls["ResizeObject"] += 1
+        self._points = [Vector(0.0)] * pcnt
+        if scnt is not None and not isinstance(self, PolygonObject):
+            self._segments = [(0, False)] * scnt
+        if isinstance(self, PolygonObject) and scnt is not None:
+            self._polygons = [None] * scnt
+        return True
+
+    def SetPoint(self, i, v):
+        calls["SetPoint"] += 1
+        self._points[i] = v
+
+    def GetPoint(self, i):
+        return self._points[i]
+
+    def SetAllPoints(self, points):
+        calls["SetAllPoints"] += 1
+        points = list(points)
+        if len(points) != len(self._points):
+            raise IndexError("SetAllPoints: point count does not match")
+        self._points = points
+
+    def GetAllPoints(self):
+        return list(self._points)
+
+    def GetPointCount(self):
+        return len(self._points)
+
+    def SetSegment(self, id, cnt, closed):
+        calls["SetSegment"] += 1
+        self._segments[id] = (cnt, closed)
+
+    def GetSegment(self, id):
+        cnt, closed = self._segments[id]
+        return {"cnt": cnt, "closed": closed}
+
+    def GetSegmentCount(self):
+        return len(self._segments)
+
+    def SetPolygon(self, i, poly):
+        calls["SetPolygon"] += 1
+        self._polygons[i] = poly
+
+    def GetPolygonCount(self):
+        return len(self._polygons)
+
+    def GetAllPolygons(self):
+        return list(self._polygons)
+
+    #misc
+    def Message(self, type, data=None):
+        calls["Message"] += 1
+        return True
+
+    def SetPhong(self, on, anglelimit=False, angle=0.0):
+        self._data["phong"] = (on, anglelimit, angle)
+        return True
+
+    def SetDeformMode(self, mode):
+        self._data["deform"] = mode
+
+    def GetClone(self, flags=0):
+        calls["GetClone"] += 1
+        clone = self.__class__.__new__(self.__class__)
+        BaseObject.__init__(clone, self._type)
+        clone._name = self._name
+        clone._data = dict(self._data)
+        clone._container = self._container.GetClone()
+        clone._points = list(self._points)
+        clone._segments = list(self._segments)
+        clone._polygons = list(self._polygons)
+        clone._matrices = list(self._matrices)
+        for child in self._children:
+            c = child.GetClone()
+            c._parent = clone
+            clone._children.append(c)
+        return clone
+
+    def GetRad(self):
+        pts = self.GetAllPoints()
+        if not pts:
+            return Vector(0.0)
+        lo = [min(p[i] for p in pts) for i in range(3)]
+        hi = [max(p[i] for p in pts) for i in range(3)]
+        return Vector(*[(hi[i] - lo[i]) / 2.0 for i in range(3)])
+
+    def SetInstanceMatrices(self, matrices):
+        calls["SetInstanceMatrices"] += 1
+        self._matrices = list(matrices)
+
+    def GetInstanceMatrices(self):
+        return list(self._matrices)
+
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self._name)
+
+
+class PointObject(BaseObject):
+    pass
+
+
+class SplineObject(PointObject):
+
+    def __init__(self, pcnt=0, type=0):
+        PointObject.__init__(self, Ospline)
+        self._points = [Vector(0.0)] * pcnt
+        self._data[SPLINEOBJECT_TYPE] = type
+
+
+class PolygonObject(PointObject):
+
+    def __init__(self, pcnt=0, vcnt=0):
+        PointObject.__init__(self, Opolygon)
+        self._points = [Vector(0.0)] * pcnt
+        self._polygons = [None] * vcnt
+
+
+class InstanceObject(BaseObject):
+
+    def __init__(self):
+        BaseObject.__init__(self, Oinstance)
+
+
+class BaseDocument(BaseList2D):
+
+    def __init__(self):
+        BaseList2D.__init__(self)
+        self._objects = []
+        self.undoDepth = 0
+
+    def InsertObject(self, op, parent=None, pred=None, checknames=False):
+        calls["InsertObject"] += 1
+        op.Remove()
+        siblings = parent._children if parent is not None else self._objects
+        position = siblings.index(pred) + 1 if pred is not None else 0
+        if parent is not None:
+            op._parent = parent
+        else:
+            op._doc = self
+        siblings.insert(position, op)
+
+    def GetObjects(self):
+        return list(self._objects)
+
+    def GetActiveObject(self):
+        active = self.GetActiveObjects()
+        return active[0] if active else None
+
+    def GetActiveObjects(self, flags=0):
+        return [op for op in self.IterObjects() if op._data.get("active")]
+
+    def SetActiveObject(self, op, mode=0):
+        op._data["active"] = True
+
+    def SearchObject(self, name):
+        calls["SearchObject"] += 1
+        for op in self.IterObjects():
+            if op.GetName() == name:
+                return op
+        return None
+
+    def IterObjects(self):
+        stack = list(reversed(self._objects))
+        while stack:
+            op = stack.pop()
+            yield op
+            stack.extend(reversed(op._children))
+
+    def AddUndo(self, type, data=None):
+        calls["AddUndo"] += 1
+
+    def StartUndo(self):
+        calls["StartUndo"] += 1
+        self.undoDepth += 1
+
+    def EndUndo(self):
+        calls["EndUndo"] += 1
+        self.undoDepth -= 1
+
+
+def documents_GetActiveDocument():
+    return BaseDocument()
+
+
+from . import gui, storage, utils, documents  # noqa: E402
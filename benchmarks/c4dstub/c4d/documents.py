@@ -0,0 +1,12 @@
+"""Stub of c4d.documents."""
+
+import c4d
+
+_active = None
+
+
+def GetActiveDocument():
+    global _active
+    if _active is None:
+        _active = c4d.BaseDocument()
+    return _active
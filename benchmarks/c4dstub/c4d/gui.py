@@ -0,0 +1,15 @@
+"""Stub of c4d.gui: the dialog never opens; MessageDialog just prints."""
+
+
+class GeDialog(object):
+
+    def Open(self, *args, **kwargs):
+        return True
+
+    def Close(self):
+        return True
+
+
+def MessageDialog(text, type=0):
+    print(text)
+    return True
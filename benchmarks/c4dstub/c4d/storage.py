@@ -0,0 +1,7 @@
+"""Stub of c4d.storage; LoadDialog returns whatever path was queued in nextPath."""
+
+nextPath = None
+
+
+def LoadDialog(*args, **kwargs):
+    return nextPath
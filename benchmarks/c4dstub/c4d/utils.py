@@ -0,0 +1,21 @@
+"""Stub of c4d.utils; MCOMMAND_JOIN merges the child splines of the given object."""
+
+import c4d
+
+
+def SendModelingCommand(command, list, mode=0, bc=None, doc=None, flags=0):
+    c4d.calls["SendModelingCommand"] += 1
+    if command != c4d.MCOMMAND_JOIN:
+        return True
+    #like C4D, the joined spline takes the name of the first object in the list
+    joined = c4d.SplineObject(0, 0)
+    joined.SetName(list[0].GetName())
+    points, segments = [], []
+    for op in list:
+        for child in op.GetChildren():
+            pts = child.GetAllPoints()
+            points.extend(pts)
+            segments.append((len(pts), False))
+    joined._points = points
+    joined._segments = segments
+    return [joined]
@@ -0,0 +1,177 @@
+"""
+Headless harness: run the NeuronBuild import against the stub c4d module in benchmarks/c4dstub.
+
+The stub counts every call the importer makes into the scene (InsertObject, AddUndo,
+EventAdd, SearchObject, SetPoint, ...). With --check, the harness fails if an import
+touches the document more than a fixed number of times, whatever the size of the neuron:
+one EventAdd, one undo group, no SearchObject, and a handful of top-level inserts.
+
+With --batch, the argument is a folder or glob pattern and every matching file is imported
+through the batch path (worker-process preparation, one EventAdd for the whole batch).
+
+With --profile, the importer's stage timings and counters (neuronbuild/profile.py) are
+printed after the call counts; --profile-file also writes them to a file.
+
+Usage: python benchmarks/headless.py file.swc [--check] [--no-rail] [--no-sweep] ...
+       python benchmarks/headless.py folder --batch [--workers N] [--check]
+       python benchmarks/headless.py file.swc --profile [--profile-file profile.json]
+"""
+
+import argparse, gc, importlib.util, os, sys, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(HERE, "c4dstub"))
+sys.path.insert(0, ROOT)
+
+import c4d
+from neuronbuild import spatial
+
+SCRIPT = os.path.join(ROOT, "NeuronBuild_1.9.py")
+
+#the dialog defaults
+DEFAULTS = dict(DoHN=True, DoConnect=True, DoRail=True, DoSweep=True, DoSingleSpline=True,
+                NSides=6, DoVB=False, DoVM=False, DoMesh=False,
+                DoVoxel=False, VoxelSize=0.0, DoCache=False, DoLOD=False, DoProfile=False, DoInstance=False,
+                DoCrop=False, DoCompact=False, DoTypes=False,
+                ResampleSpacing=0.0, DoRepair=False, cropRegion=None)
+
+#document traffic allowed for one import, independent of the number of sections
+LIMITS = dict(EventAdd=1, StartUndo=1, EndUndo=1, SearchObject=0, InsertObject=5)
+
+#a batch gets one undo group and up to five inserts per file, but still a single EventAdd
+BATCH_LIMITS = dict(EventAdd=1, SearchObject=0)
+
+
+def loadScript(path=SCRIPT):
+    """Load a NeuronBuild script file as a module, with a fresh stub document as doc."""
+    spec = importlib.util.spec_from_file_location("neuronbuild_script", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.doc = c4d.BaseDocument()
+    return module
+
+
+def runImport(swcPath, script=None, **options):
+    """Import swcPath headless; returns (document, call counts)."""
+    if script is None:
+        script = loadScript()
+    settings = dict(DEFAULTS)
+    settings.update(options)
+    for name, value in settings.items():
+        setattr(script, name, value)
+    c4d.reset()
+    script.readFile(swcPath)
+    return script.doc, dict(c4d.calls)
+
+
+def runBatch(pattern, workers=None, script=None, **options):
+    """Batch-import every SWC file matching pattern headless; returns (document, call counts, report)."""
+    if script is None:
+        script = loadScript()
+    settings = dict(DEFAULTS)
+    settings.update(options)
+    for name, value in settings.items():
+        setattr(script, name, value)
+    c4d.reset()
+    report = script.batchImport(pattern, workers=workers)
+    return script.doc, dict(c4d.calls), report
+
+
+def batchLimits(report):
+    """The limits for a batch import: BATCH_LIMITS, plus one undo group and five inserts per imported file."""
+    n = len(report.prepared)
+    return dict(BATCH_LIMITS, StartUndo=n, EndUndo=n, InsertObject=5 * n)
+
+
+def checkLimits(calls, limits=LIMITS):
+    """Return a list of messages for every counter above its limit."""
+    problems = []
+    for name, limit in limits.items():
+        if calls.get(name, 0) > limit:
+            problems.append("%s called %d times (limit %d)" % (name, calls.get(name, 0), limit))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("swc")
+    parser.add_argument("--check", action="store_true", help="fail when document traffic exceeds the limits")
+    for name in ("HN", "Connect", "Rail", "Sweep", "SingleSpline"):
+        parser.add_argument("--no-" + name.lower(), dest="Do" + name, action="store_false", default=True)
+    parser.add_argument("--vb", dest="DoVB", action="store_true")
+    parser.add_argument("--vm", dest="DoVM", action="store_true")
+    parser.add_argument("--mesh", dest="DoMesh", action="store_true")
+    parser.add_argument("--voxel", dest="DoVoxel", action="store_true")
+    parser.add_argument("--lod", dest="DoLOD", action="store_true")
+    parser.add_argument("--instance", dest="DoInstance", action="store_true")
+    parser.add_argument("--compact", dest="DoCompact", action="store_true")
+    parser.add_argument("--types", dest="DoTypes", action="store_true", help="with --mesh, one mesh per neurite type")
+    parser.add_argument("--repair", dest="DoRepair", action="store_true",
+                        help="repair what validation finds instead of stopping on it")
+    parser.add_argument("--crop-box", default=None, metavar="X0,Y0,Z0,X1,Y1,Z1",
+                        help="build only what is inside this box (C4D space)")
+    parser.add_argument("--crop-sphere", default=None, metavar="X,Y,Z,R",
+                        help="build only what is inside this sphere (C4D space)")
+    parser.add_argument("--voxel-size", dest="VoxelSize", type=float, default=0.0)
+    parser.add_argument("--resample", dest="ResampleSpacing", type=float, default=0.0, metavar="SPACING",
+                        help="resample sections to this spacing first, and time the import against no resampling")
+    parser.add_argument("--resample-radius", dest="RESAMPLE_RADIUS_SCALE", type=float, default=None,
+                        help="let the resampling spacing grow to this multiple of the radius")
+    parser.add_argument("--sides", dest="NSides", type=int, default=6)
+    parser.add_argument("--cache", dest="CACHE_DIR", default=None, help="use an import cache in this directory")
+    parser.add_argument("--batch", action="store_true", help="treat the argument as a folder or glob pattern")
+    parser.add_argument("--workers", type=int, default=None, help="batch worker processes (0: in-process)")
+    parser.add_argument("--profile", action="store_true", help="print the importer's stage timings")
+    parser.add_argument("--profile-file", dest="PROFILE_FILE", default=None, help="also write them to this file")
+    args = parser.parse_args(argv)
+
+    options = dict((k, v) for k, v in vars(args).items() if k not in ("swc", "check", "batch", "workers", "CACHE_DIR",
+                                                                      "profile", "PROFILE_FILE", "crop_box",
+                                                                      "crop_sphere", "RESAMPLE_RADIUS_SCALE"))
+    if args.RESAMPLE_RADIUS_SCALE is not None:
+        options.update(RESAMPLE_RADIUS_SCALE=args.RESAMPLE_RADIUS_SCALE)
+    if args.crop_box:
+        values = [float(v) for v in args.crop_box.split(",")]
+        options.update(DoCrop=True, cropRegion=spatial.Box(values[:3], values[3:]))
+    if args.crop_sphere:
+        values = [float(v) for v in args.crop_sphere.split(",")]
+        options.update(DoCrop=True, cropRegion=spatial.Sphere(values[:3], values[3]))
+    if args.CACHE_DIR:
+        options.update(DoCache=True, CACHE_DIR=args.CACHE_DIR)
+    script = loadScript()
+    script.profiler.enabled = args.profile or args.PROFILE_FILE is not None
+    script.PROFILE_FILE = args.PROFILE_FILE
+    if args.batch:
+        doc, calls, report = runBatch(args.swc, workers=args.workers, script=script, **options)
+        limits = batchLimits(report)
+    else:
+        if args.ResampleSpacing > 0:
+            #the same import without resampling first, to measure what resampling saves
+            start = time.perf_counter()
+            runImport(args.swc, script=script, **dict(options, ResampleSpacing=0.0))
+            plain = time.perf_counter() - start
+            script.profiler.reset()
+            script.doc = c4d.BaseDocument()
+            gc.collect()
+        start = time.perf_counter()
+        doc, calls = runImport(args.swc, script=script, **options)
+        if args.ResampleSpacing > 0:
+            resampled = time.perf_counter() - start
+            print("import %.3f s without resampling, %.3f s resampled (%.2fx)" % (plain, resampled,
+                                                                                  plain / max(resampled, 1e-9)))
+        limits = LIMITS
+    for name in sorted(calls):
+        print("%-20s %d" % (name, calls[name]))
+    if script.profiler.enabled:
+        script.profileReport()
+    if args.check:
+        problems = checkLimits(calls, limits)
+        for p in problems:
+            print("FAIL: " + p)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Synthetic SWC generators for the NeuronBuild benchmarks.
+Files are written in neuromorpho layout: sorted, contiguous ids, parents before children.
+"""
+
+import random
+
+
+def randomNeuron(samples, branchProbability=0.02, seed=1, children=2, spacing=1.5):
+    """Return a list of SWC rows (id, type, x, y, z, radius, parent) for a random dendritic tree.
+
+    samples            size of the tree
+    branchProbability  chance per sample of starting a new branch instead of extending the newest tip
+    children           branching factor: each branch event starts children - 1 new branches from one sample
+    spacing            sample density: each sample is up to this far from its parent along every axis
+    """
+    rng = random.Random(seed)
+    rows = [(1, 1, 0.0, 0.0, 0.0, 8.0, -1)]
+    tips = [1]
+    pending = []
+    for i in range(2, samples + 1):
+        #mostly extend the newest tip, occasionally branch from an older one
+        if pending:
+            parent = pending.pop()
+        elif len(tips) > 1 and rng.random() < branchProbability:
+            parent = rng.choice(tips[:-1])
+            #the point already has one child; the remaining siblings start right after this one
+            pending = [parent] * (children - 2)
+        else:
+            parent = tips[-1]
+        p = rows[parent - 1]
+        x = p[2] + rng.uniform(-spacing, spacing)
+        y = p[3] + rng.uniform(-spacing, spacing)
+        z = p[4] + rng.uniform(-spacing, spacing)
+        radius = max(0.1, p[5] * 0.995) if parent > 1 else 2.0
+        rows.append((i, 3, x, y, z, radius, parent))
+        tips.append(i)
+    return rows
+
+
+def writeSWC(path, rows):
+    """Write SWC rows to path with a short neuromorpho-style header."""
+    with open(path, "w") as f:
+        f.write("# synthetic neuron written by benchmarks/synthetic.py\n")
+        for r in rows:
+            f.write("%d %d %.4f %.4f %.4f %.4f %d\n" % r)
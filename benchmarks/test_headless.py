@@ -0,0 +1,69 @@
+"""
+Document-traffic regression test: headless imports of synthetic neurons must stay within headless.LIMITS.
+
+Runs the same check as `python benchmarks/headless.py file.swc --check`, for every build mode of
+the benchmark suite (plus levels of detail, instances, cropping and the batch path), so a builder
+that adds a second EventAdd or undo group, or calls SearchObject again, fails the test run.
+
+Usage: python -m pytest benchmarks   (or python benchmarks/test_headless.py)
+"""
+
+import os, shutil, tempfile, unittest
+
+import headless
+import synthetic
+from bench_suite import MODES
+from neuronbuild import spatial
+
+#build modes the benchmark suite does not time, checked as well
+EXTRA_MODES = {
+    "lod": dict(DoLOD=True),
+    "instance": dict(DoInstance=True),
+    "volume": dict(DoVB=True, DoVM=True),
+    "crop": dict(DoCrop=True, cropRegion=spatial.Box([-20.0, -20.0, -20.0], [20.0, 20.0, 20.0])),
+}
+
+#(samples, branchProbability) of the neurons imported; two sizes, so limits that grow with the neuron show up
+NEURONS = ((300, 0.05), (3000, 0.02))
+
+
+class HeadlessLimitsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.paths = []
+        for samples, branchProbability in NEURONS:
+            path = os.path.join(cls.directory, "synthetic-%d.swc" % samples)
+            synthetic.writeSWC(path, synthetic.randomNeuron(samples, branchProbability))
+            cls.paths.append(path)
+        cls.script = headless.loadScript()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def runImport(self, path, options):
+        self.script.doc = headless.c4d.BaseDocument()
+        return headless.runImport(path, script=self.script, **options)
+
+    def test_import_limits(self):
+        modes = dict(MODES)
+        modes.update(EXTRA_MODES)
+        for mode, options in sorted(modes.items()):
+            for path in self.paths:
+                with self.subTest(mode=mode, file=os.path.basename(path)):
+                    doc, calls = self.runImport(path, options)
+                    self.assertEqual(headless.checkLimits(calls), [])
+                    self.assertTrue(doc.GetObjects())
+
+    def test_batch_limits(self):
+        self.script.doc = headless.c4d.BaseDocument()
+        doc, calls, report = headless.runBatch(self.directory, workers=0, script=self.script)
+        self.assertEqual(report.failures, [])
+        self.assertEqual(len(report.prepared), len(self.paths))
+        self.assertEqual(headless.checkLimits(calls, headless.batchLimits(report)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
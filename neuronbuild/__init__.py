@@ -0,0 +1,10 @@
+"""
+NeuronBuild core | Nick Woolridge | 2013-2020 | n.woolridge@utoronto.ca
+Pure Python/NumPy support code for the NeuronBuild Cinema 4D script. Nothing in this
+package imports c4d, so files can be parsed, checked and pre-processed on any machine
+(batch jobs, benchmarks) and the results handed to the builders in NeuronBuild_1.9.py.
+
+This software is open-source under the MIT License (see LICENSE.md).
+"""
+
+from .swc import Morphology, readSWC
@@ -0,0 +1,317 @@
+"""
+Batch preparation of many SWC files.
+
+The expensive, C4D-independent part of an import (parsing, section decomposition and,
+for the mesh and voxel modes, the geometry itself) runs in worker processes through
+prepareAll. Results come back in file order as they become available, so the caller
+can build each neuron in the document while the workers are still busy with the next
+files. A file that fails is reported as a Failure and the batch carries on.
+
+With a cache.Cache, prepareFile stores what it computes and skips the parse and/or the
+geometry when the same file content (and geometry options) was prepared before.
+"""
+
+import collections, glob, os, time, traceback
+
+from . import swc, topology, mesh, voxel, nbm, spatial, resample, validate, stats as statsmodule, cache as cachemodule
+
+#files in flight per worker process in prepareAll; bounds the memory held by finished, unbuilt results
+WINDOW_PER_WORKER = 2
+
+#file name endings picked up when a directory is given
+SWC_ENDINGS = (".swc", ".swc.txt", nbm.EXTENSION)
+
+
+class Prepared(object):
+    """A parsed file and whatever geometry was pre-computed for it.
+
+    stats is the stats.Stats of the morphology (in the space the geometry is built in). points
+    is morph.points converted to that space when prepareFile needed the copy itself, else None.
+    geometry is a mesh.Mesh for the mesh and voxel modes, else None. index is a
+    spatial.SegmentIndex over the sections when one was asked for, else None. resampled is
+    the resample.Resampled summary when the file was resampled (morph and sections are then
+    the resampled ones), else None. validation is the validate.Validation of the parsed file,
+    and repaired tells whether morph is the repaired one. renumbered tells whether the samples
+    were put in depth-first order (topology.renumber; ids then run 1..n in that order). timings
+    maps stage names ("parse", "validate", "sections", "resample", "renumber", "stats",
+    "geometry", "index", and "build" once the caller adds it) to seconds. cached lists the stages that were
+    loaded from the cache instead of computed.
+    """
+
+    def __init__(self, path, morph, sections, geometry, timings, cached=(), index=None, stats=None,
+                 resampled=None, validation=None, repaired=False, renumbered=False, points=None):
+        self.path = path
+        self.name = morph.name
+        self.morph = morph
+        self.sections = sections
+        self.geometry = geometry
+        self.index = index
+        self.stats = stats
+        self.resampled = resampled
+        self.validation = validation
+        self.repaired = repaired
+        self.renumbered = renumbered
+        self.points = points
+        self.timings = timings
+        self.cached = tuple(cached)
+
+
+class Failure(object):
+    """A file that could not be prepared or built."""
+
+    def __init__(self, path, message, details=""):
+        self.path = path
+        self.name = swc.swcName(path)
+        self.message = message
+        self.details = details
+
+
+def findFiles(pattern):
+    """Return the sorted SWC files in a directory, or the files matching a glob pattern."""
+    if os.path.isdir(pattern):
+        names = [os.path.join(pattern, n) for n in os.listdir(pattern)]
+        return sorted(p for p in names if os.path.isfile(p) and p.lower().endswith(SWC_ENDINGS))
+    return sorted(p for p in glob.glob(pattern) if os.path.isfile(p))
+
+
+def geometryOptions(options):
+    """Return the options that determine the pre-computed geometry, or None if there is none."""
+    if options.get("voxel"):
+        key = dict(kind="voxel", voxelSize=float(options.get("voxelSize") or 0.0), flipZ=bool(options.get("flipZ")))
+    elif options.get("mesh"):
+        key = dict(kind="mesh", sides=int(options.get("sides", 6)), flipZ=bool(options.get("flipZ")))
+    else:
+        return None
+    #the geometry follows the depth-first sample order prepareFile renumbers to
+    key.update(order="depth-first")
+    if options.get("repair"):
+        key.update(repair=True)
+    if options.get("resample"):
+        key.update(resample=float(options["resample"]), resampleRadius=float(options.get("resampleRadius") or 0.0))
+    return key
+
+
+def prepareFile(path, options=None, cache=None):
+    """Parse path (SWC, or NBM, which is mapped instead) and pre-compute what the builders need.
+
+    Raises on bad input.
+
+    options: sides (int), mesh (bool), voxel (bool), voxelSize (float, 0 = automatic),
+    flipZ (bool: convert to C4D's left-handed space before building geometry),
+    index (bool: build a spatial.SegmentIndex over the sections, for cropping),
+    repair (bool: fix what validation finds, see validate.py; without it a file whose parent
+    links loop, or with a position or radius that is not a finite number, raises a ValueError
+    naming the line),
+    resample (float: resample the sections to this spacing first, 0 = off) and
+    resampleRadius (float: let the spacing grow to this multiple of the radius; see resample.py).
+    cache: a cache.Cache to load from and store into, or None.
+
+    Unless every section already is a contiguous run of rows, the samples are then put in
+    depth-first order and renumbered (topology.renumber) before any geometry is built, and
+    again after resampling. The parse cache stores them in that order.
+    """
+    options = options or {}
+    geometryKey = geometryOptions(options)
+    timings = {}
+    cached = []
+    name = swc.swcName(path)
+
+    start = time.perf_counter()
+    key = cachemodule.contentKey(path) if cache is not None else None
+    arrays = cache.load(key, "parse") if cache is not None and not nbm.isNBM(path) else None
+    if nbm.isNBM(path):
+        #already parsed, with its section table: opening it is the whole parse
+        morph, sections = nbm.read(path)
+        morph.name = name
+        timings["parse"] = time.perf_counter() - start
+    elif arrays is not None:
+        morph, sections = cachemodule.parseFromArrays(arrays, name)
+        renumbered = bool(arrays["renumbered"])
+        timings["parse"] = time.perf_counter() - start
+        cached.append("parse")
+    else:
+        morph = swc.readSWC(path, name)
+        timings["parse"] = time.perf_counter() - start
+        sections = None
+
+    start = time.perf_counter()
+    validation = validate.validate(morph)
+    if validation.issues and not nbm.isNBM(path):
+        validation.lines = swc.dataLines(path)
+    timings["validate"] = time.perf_counter() - start
+    repaired = bool(options.get("repair")) and validation.repairable()
+    if repaired:
+        start = time.perf_counter()
+        morph = validate.repair(validation)
+        sections = None
+        timings["validate"] += time.perf_counter() - start
+    elif validation.get(validate.CYCLE) is not None:
+        row = validation.get(validate.CYCLE).rows[0]
+        raise ValueError("parent links form a loop (%s, sample id %d); import with repair to cut it" % (
+            validation.where(row), morph.ids[row]))
+    else:
+        #NaN or infinite positions and radii would reach every builder; stop here, like a loop
+        nonFinite = validation.nonFinite()
+        if len(nonFinite):
+            row = nonFinite[0]
+            raise ValueError("%d samples have a position or radius that is not a finite number (%s, sample id %d); "
+                             "import with repair to drop or fix them" % (len(nonFinite), validation.where(row),
+                                                                         morph.ids[row]))
+
+    if "parse" not in cached:
+        if sections is None:
+            start = time.perf_counter()
+            sections = topology.buildSections(morph)
+            timings["sections"] = time.perf_counter() - start
+
+        #depth-first order makes every section a contiguous run of rows, sliceable without copies
+        renumbered = sections.runs() is None
+        if renumbered:
+            start = time.perf_counter()
+            morph, sections = topology.renumber(morph)
+            timings["renumber"] = time.perf_counter() - start
+
+        #the parse cache holds the file ready to build, so a hit skips the sections and the renumbering too.
+        #Only clean files are stored: the issue report needs the rows as they are in the file, and a repaired
+        #file is repaired again on every import
+        if cache is not None and not validation.serious() and not nbm.isNBM(path):
+            cache.store(key, "parse", cachemodule.parseArrays(morph, sections, renumbered))
+
+    resampled = None
+    if options.get("resample"):
+        start = time.perf_counter()
+        resampled = resample.resample(morph, sections, float(options["resample"]),
+                                      float(options.get("resampleRadius") or 0.0))
+        morph, sections = resampled.morph, resampled.sections
+        timings["resample"] = time.perf_counter() - start
+        #the new samples come after the kept ones; put them back in depth-first order
+        if sections.runs() is None:
+            start = time.perf_counter()
+            morph, sections = topology.renumber(morph)
+            resampled.morph, resampled.sections = morph, sections
+            renumbered = True
+            timings["renumber"] = timings.get("renumber", 0.0) + time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = statsmodule.measure(morph, flipZ=bool(options.get("flipZ")))
+    timings["stats"] = time.perf_counter() - start
+
+    #positions in the space the geometry is built in; the flipped copy is only made when something here
+    #needs it, and is handed on to the builders (Prepared.points) so they do not make another
+    points = morph.points
+    if options.get("flipZ") and (geometryKey is not None or options.get("index")):
+        points = morph.points * (1.0, 1.0, -1.0)
+
+    geometry = None
+    if geometryKey is not None:
+        start = time.perf_counter()
+        entry = key + "-" + cachemodule.optionsKey(geometryKey) if cache is not None else None
+        arrays = cache.load(entry, "geometry") if cache is not None else None
+        if arrays is not None:
+            geometry = cachemodule.meshFromArrays(arrays)
+            cached.append("geometry")
+        else:
+            if options.get("voxel"):
+                voxelSize = options.get("voxelSize") or stats.voxelSize()
+                geometry = voxel.voxelize(morph, topology.buildSections(morph, exclude=()), voxelSize, points=points)
+            else:
+                geometry = mesh.tubeMesh(morph, sections, options.get("sides", 6), points=points)
+            if cache is not None:
+                cache.store(entry, "geometry", cachemodule.meshArrays(geometry))
+        timings["geometry"] = time.perf_counter() - start
+
+    index = None
+    if options.get("index"):
+        start = time.perf_counter()
+        index = spatial.segmentIndex(morph, sections, points=points)
+        timings["index"] = time.perf_counter() - start
+    return Prepared(path, morph, sections, geometry, timings, cached, index, stats, resampled, validation, repaired,
+                    renumbered, points if points is not morph.points else None)
+
+
+def _prepareSafe(job):
+    """prepareFile for worker processes: errors come back as a Failure instead of raising."""
+    path, options, cache = job
+    try:
+        return prepareFile(path, options, cache)
+    except Exception as e:
+        return Failure(path, "%s: %s" % (type(e).__name__, e), traceback.format_exc())
+
+
+def prepareAll(paths, options=None, workers=None, cache=None):
+    """Yield a Prepared or Failure for every path, in order.
+
+    workers is the number of worker processes (None: one per CPU; 0 or 1: prepare in
+    this process). At most WINDOW_PER_WORKER files per worker are in flight at once, so
+    finished results (meshes included) do not pile up while the caller builds. If a process
+    pool cannot be started, preparation falls back to this process for the remaining files.
+    """
+    jobs = [(p, options, cache) for p in paths]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    done = 0
+    if workers > 1 and len(jobs) > 1:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            workers = min(workers, len(jobs))
+            with ProcessPoolExecutor(workers) as pool:
+                pending = collections.deque()
+                submitted = 0
+                while done < len(jobs):
+                    #keep the window full, then hand back the oldest file once it is ready
+                    while submitted < len(jobs) and len(pending) < WINDOW_PER_WORKER * workers:
+                        pending.append(pool.submit(_prepareSafe, jobs[submitted]))
+                        submitted += 1
+                    result = pending.popleft().result()
+                    done += 1
+                    yield result
+        except (OSError, RuntimeError, ImportError) as e:
+            #e.g. an embedded interpreter that cannot spawn workers (BrokenProcessPool is a RuntimeError)
+            print("NeuronBuild: worker processes unavailable (%s), preparing files in-process" % e)
+    for job in jobs[done:]:
+        yield _prepareSafe(job)
+
+
+class Report(object):
+    """Per-file timings and failures for a batch."""
+
+    STAGES = ("parse", "validate", "sections", "resample", "renumber", "stats", "geometry", "build")
+
+    def __init__(self):
+        self.prepared = []
+        self.failures = []
+        self.start = time.perf_counter()
+
+    def add(self, result):
+        if isinstance(result, Failure):
+            self.failures.append(result)
+        else:
+            self.prepared.append(result)
+
+    def format(self):
+        """Return the report as text: one line per file, totals, then the failures."""
+        lines = ["%-40s %9s %9s" % ("file", "samples", "sections")
+                 + "".join(" %9s" % s for s in self.STAGES) + " %9s  %s" % ("total", "cached")]
+        totals = dict((s, 0.0) for s in self.STAGES)
+        for p in self.prepared:
+            row = "%-40s %9d %9d" % (p.name[:40], len(p.morph), len(p.sections))
+            for s in self.STAGES:
+                t = p.timings.get(s)
+                row += " %9s" % ("-" if t is None else "%.3f" % t)
+                totals[s] += t or 0.0
+            lines.append(row + " %9.3f  %s" % (sum(p.timings.values()), ",".join(p.cached) or "-"))
+        lines.append("%d imported, %d failed, %.2f s elapsed (stage sums: %s)" % (
+            len(self.prepared), len(self.failures), time.perf_counter() - self.start,
+            ", ".join("%s %.2f s" % (s, totals[s]) for s in self.STAGES)))
+        resampled = [p.resampled for p in self.prepared if p.resampled is not None]
+        if resampled:
+            before = sum(r.before for r in resampled)
+            removed = sum(r.removed() for r in resampled)
+            lines.append("resampling removed %d of %d path points (%.1f%%) in %d files" % (
+                removed, before, 100.0 * removed / max(before, 1), len(resampled)))
+        for p in self.prepared:
+            if p.validation is not None and p.validation.serious():
+                lines.append("%s %s: %r" % ("REPAIRED" if p.repaired else "ISSUES", p.path, p.validation))
+        for f in self.failures:
+            lines.append("FAILED %s: %s" % (f.path, f.message))
+        return "\n".join(lines)
@@ -0,0 +1,153 @@
+"""
+On-disk cache for parsed morphologies and generated geometry.
+
+Entries are NumPy .npz files named after the SHA-1 of the SWC file's bytes, so a file is
+recognized again after it is renamed or moved, and an edited file is never served stale:
+  <content>.parse.npz               Morphology and Sections arrays, in the depth-first order
+                                    batch.prepareFile builds from (independent of build options)
+  <content>-<options>.geometry.npz  Mesh arrays for one set of geometry options
+Changing only a build option therefore still skips the parse. FORMAT is part of every key;
+bump it whenever the stored layout or the generators' output changes.
+
+The cache is bounded by size: every hit refreshes the entry's modification time, and after
+each store the least recently used entries are deleted until the total fits in maxBytes.
+Entries are written to a temporary file and renamed into place, so worker processes can
+share one cache directory.
+"""
+
+import hashlib, io, os
+
+import numpy as np
+
+from . import swc, topology, mesh
+
+FORMAT = 2
+
+#default size bound, in bytes
+DEFAULT_BYTES = 1 << 30
+
+#read size when hashing files
+HASH_BLOCK = 1 << 20
+
+
+def contentKey(path):
+    """Return the hex SHA-1 of a file's bytes."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def optionsKey(options):
+    """Return a short stable digest of a dict of build options."""
+    text = repr(sorted((k, options[k]) for k in options))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def parseArrays(morph, sections, renumbered=False):
+    """Flatten a Morphology and its Sections into a dict of arrays for storing; renumbered records
+    whether the samples were reordered from the file's (topology.renumber)."""
+    return dict(ids=morph.ids, types=morph.types, points=morph.points, radii=morph.radii,
+                parents=morph.parents, sectionRows=sections.rows, sectionOffsets=sections.offsets,
+                sectionParents=sections.parents, sectionTypes=sections.types, renumbered=np.array(renumbered))
+
+
+def parseFromArrays(arrays, name):
+    """Rebuild (Morphology, Sections) from parseArrays output."""
+    morph = swc.Morphology(arrays["ids"], arrays["types"], arrays["points"], arrays["radii"],
+                           arrays["parents"], name)
+    sections = topology.Sections(arrays["sectionRows"], arrays["sectionOffsets"],
+                                 arrays["sectionParents"], arrays["sectionTypes"])
+    return morph, sections
+
+
+def meshArrays(tubes):
+    """Flatten a Mesh into a dict of arrays for storing."""
+    return dict(vertices=tubes.vertices, polygons=tubes.polygons, sections=tubes.sections)
+
+
+def meshFromArrays(arrays):
+    """Rebuild a Mesh from meshArrays output."""
+    return mesh.Mesh(arrays["vertices"], arrays["polygons"], arrays["sections"])
+
+
+class Cache(object):
+    """A size-bounded directory of .npz entries; see the module docstring."""
+
+    def __init__(self, directory, maxBytes=DEFAULT_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def __repr__(self):
+        return "Cache(%r, maxBytes=%d)" % (self.directory, self.maxBytes)
+
+    def entryPath(self, key, kind):
+        return os.path.join(self.directory, "%s-v%d.%s.npz" % (key, FORMAT, kind))
+
+    def load(self, key, kind):
+        """Return the stored dict of arrays, or None on a miss or an unreadable entry."""
+        path = self.entryPath(key, kind)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = dict((name, data[name]) for name in data.files)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            #missing, or damaged by an interrupted write or a full disk: treat as a miss
+            if os.path.exists(path):
+                self._remove(path)
+            return None
+        return arrays
+
+    def store(self, key, kind, arrays):
+        """Write a dict of arrays under key, then evict down to the size bound."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.entryPath(key, kind)
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        temp = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp, "wb") as f:
+            f.write(buffer.getbuffer())
+        os.replace(temp, path)
+        self.evict()
+
+    def entries(self):
+        """Return (mtime, size, path) for every entry, oldest first."""
+        found = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".npz"):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        found.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return []
+        return sorted(found)
+
+    def size(self):
+        """Total bytes held by the cache."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in maxBytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            #another process got there first, or (Windows) is still reading it
+            pass
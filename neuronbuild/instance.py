@@ -0,0 +1,130 @@
+"""
+Instanced neurites: every segment (pair of consecutive samples in a section path) as a
+transformed copy of one of a few canonical unit cone frustums.
+
+A canonical frustum has its base ring (radius 1) at y = 0 and its top ring (radius
+`ratio`) at y = 1, where ratio runs over a small fixed set (taperRatios). A segment
+becomes the frustum whose ratio is closest to its own narrow/wide radius ratio, under a
+matrix whose axes are
+    v1, v3  unit vectors perpendicular to the segment, scaled by the wide-end radius
+    v2      the segment vector from its wide end to its narrow end
+and whose offset is the wide-end sample. The axes form a right-handed (unmirrored)
+basis, so the frustum polygons keep facing outwards.
+
+The scene then holds the few frustum meshes plus one matrix per segment, so memory and
+evaluation time follow the number of segments rather than the number of polygons.
+"""
+
+import numpy as np
+
+from .mesh import Mesh, perpendicular, EPSILON
+
+#number of canonical frustums
+SHAPES = 8
+
+
+class Instances(object):
+    """Per-segment instance transforms, held as arrays.
+
+    offsets   float64 (n, 3)     wide-end position of each segment
+    axes      float64 (n, 3, 3)  matrix axes v1, v2, v3 of each segment (rows)
+    shapes    int64   (n,)       index into ratios of each segment's canonical frustum
+    sections  int64   (n,)       section each segment belongs to
+    ratios    float64 (k,)       top/base radius ratio of each canonical frustum
+    """
+
+    def __init__(self, offsets, axes, shapes, sections, ratios):
+        self.offsets = offsets
+        self.axes = axes
+        self.shapes = shapes
+        self.sections = sections
+        self.ratios = ratios
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return "Instances(%d segments, %d shapes)" % (len(self), len(self.ratios))
+
+    def shape(self, index):
+        """Return the rows (segment numbers) that use canonical frustum index."""
+        return np.flatnonzero(self.shapes == index)
+
+    def matrices(self):
+        """Return every segment's offset, v1, v2 and v3 as one (n, 12) array."""
+        return np.concatenate((self.offsets, self.axes.reshape(-1, 9)), axis=1)
+
+
+def taperRatios(count=SHAPES):
+    """The top/base radius ratios of the canonical frustums: 1 (a cylinder) down to 1/count."""
+    return 1.0 - np.arange(count) / float(count)
+
+
+def unitFrustum(ratio, sides=6, caps=True):
+    """Return the canonical frustum with the given top/base radius ratio as a Mesh.
+
+    Vertex order and polygon winding match mesh.tubeMesh for a path running along +y.
+    """
+    angles = 2.0 * np.pi * np.arange(sides) / sides
+    ring = np.stack((np.cos(angles), np.zeros(sides), -np.sin(angles)), axis=1)
+    top = ring * ratio
+    top[:, 1] = 1.0
+    vertices = [ring, top]
+
+    k = np.arange(sides)
+    k1 = (k + 1) % sides
+    polygons = [np.stack((k, k1, k1 + sides, k + sides), axis=1)]
+    if caps:
+        vertices.append(np.array([[0.0, 0.0, 0.0], [0.0, 1.0, 0.0]]))
+        base, apex = 2 * sides, 2 * sides + 1
+        startFan = np.stack((np.full(sides, base), k1, k, k), axis=1)
+        endFan = np.stack((np.full(sides, apex), k + sides, k1 + sides, k1 + sides), axis=1)
+        polygons.extend((startFan, endFan))
+    polygons = np.concatenate(polygons).astype(np.int32)
+    return Mesh(np.concatenate(vertices), polygons, np.zeros(len(polygons), dtype=np.int64))
+
+
+def segmentInstances(morph, sections, points=None, shapes=SHAPES):
+    """Return the Instances for every segment of every section path.
+
+    points overrides morph.points (e.g. positions already converted to C4D space).
+    Segments of zero length are left out.
+    """
+    if points is None:
+        points = morph.points
+    ratios = taperRatios(shapes)
+    rows, offsets = sections.paths()
+    counts = np.diff(offsets)
+
+    #a segment starts at every path point but the last of its path
+    notLast = np.ones(len(rows), dtype=bool)
+    notLast[offsets[1:] - 1] = False
+    starts = np.flatnonzero(notLast)
+    a, b = rows[starts], rows[starts + 1]
+    segmentSections = np.repeat(np.arange(len(counts)), np.maximum(counts - 1, 0))
+
+    #point every segment from its wide end to its narrow end
+    ra, rb = morph.radii[a], morph.radii[b]
+    swap = rb > ra
+    wide = np.where(swap, b, a)
+    narrow = np.where(swap, a, b)
+    wideRadius = np.maximum(ra, rb)
+    narrowRadius = np.minimum(ra, rb)
+
+    vectors = points[narrow] - points[wide]
+    length = np.linalg.norm(vectors, axis=1)
+    keep = length > EPSILON
+    wide, vectors, length = wide[keep], vectors[keep], length[keep]
+    wideRadius, narrowRadius, segmentSections = wideRadius[keep], narrowRadius[keep], segmentSections[keep]
+
+    #nearest canonical taper; a segment with no radius at all is a (zero-size) cylinder
+    ratio = np.divide(narrowRadius, wideRadius, out=np.ones_like(wideRadius), where=wideRadius > 0)
+    shape = np.clip(np.rint((1.0 - ratio) * shapes), 0, shapes - 1).astype(np.int64)
+
+    tangents = vectors / length[:, None]
+    side = perpendicular(tangents) if len(tangents) else np.zeros((0, 3))
+    axes = np.empty((len(wide), 3, 3))
+    axes[:, 0] = side * wideRadius[:, None]
+    axes[:, 1] = vectors
+    axes[:, 2] = np.cross(side, tangents) * wideRadius[:, None]
+    return Instances(points[wide], axes, shape, segmentSections, ratios)
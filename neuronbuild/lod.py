@@ -0,0 +1,116 @@
+"""
+Level-of-detail simplification of section paths.
+
+Each section path ([attachment] + rows, see topology.py) is simplified with Douglas-Peucker
+on (position, radius): a sample may be dropped when the surface of the simplified tube
+stays within `tolerance` of it, measured as its distance from the chord between the
+samples kept on either side plus the difference between its radius and the radius
+interpolated along that chord. Path ends are always kept, so branch points, tips and type
+changes survive and the simplified sections still connect exactly as before.
+
+All sections are simplified together: every pass takes each open interval of every path,
+finds its worst sample in one array operation and either keeps that sample (splitting the
+interval) or closes the interval. The number of passes is the depth of the recursion,
+typically logarithmic in the section length.
+"""
+
+import numpy as np
+
+from . import topology
+
+
+class Level(object):
+    """One level of detail: the simplified Sections and how much they kept.
+
+    tolerance  the simplification tolerance (same units as the morphology, 0 = full detail)
+    sections   topology.Sections holding only the kept samples
+    points     number of path points (attachments included) the level draws
+    """
+
+    def __init__(self, tolerance, sections, points):
+        self.tolerance = tolerance
+        self.sections = sections
+        self.points = points
+
+    def __repr__(self):
+        return "Level(tolerance=%g, %d points)" % (self.tolerance, self.points)
+
+
+def deviation(positions, radii, rows, left, right):
+    """Return the surface deviation of samples rows from the chords left-right."""
+    a = positions[left]
+    chord = positions[right] - a
+    offset = positions[rows] - a
+    length2 = np.einsum("ij,ij->i", chord, chord)
+    t = np.einsum("ij,ij->i", offset, chord) / np.where(length2 > 0, length2, 1.0)
+    t = np.clip(t, 0.0, 1.0)
+    distance = np.linalg.norm(offset - t[:, None] * chord, axis=1)
+    radius = radii[left] + t * (radii[right] - radii[left])
+    return distance + np.abs(radii[rows] - radius)
+
+
+def simplifyPaths(positions, radii, offsets, tolerance):
+    """Return a bool mask over flat paths (positions, radii laid out by offsets) of the samples to keep.
+
+    Samples whose deviation is not finite (NaN or infinite input) are dropped rather than split on.
+    """
+    n = len(positions)
+    index = np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[offsets[:-1]] = True
+    keep[offsets[1:] - 1] = True
+    undecided = ~keep
+    while undecided.any():
+        #the kept samples on either side of every sample bound its current interval
+        left = np.maximum.accumulate(np.where(keep, index, 0))
+        right = np.minimum.accumulate(np.where(keep, index, n)[::-1])[::-1]
+        candidates = np.flatnonzero(undecided)
+        error = deviation(positions, radii, candidates, left[candidates], right[candidates])
+        #a NaN or infinite position or radius gives no usable deviation: such a sample is never the one kept,
+        #and an interval with nothing else in it is closed instead of split
+        error[~np.isfinite(error)] = -1.0
+
+        #candidates are in path order, so each interval's samples are a contiguous run
+        starts = np.flatnonzero(np.r_[True, left[candidates][1:] != left[candidates][:-1]])
+        sizes = np.diff(np.r_[starts, len(candidates)])
+        interval = np.repeat(np.arange(len(starts)), sizes)
+        worst = np.maximum.reduceat(error, starts)
+        split = worst > tolerance
+
+        #keep the first worst sample of every interval that is out of tolerance; close the others
+        isWorst = np.flatnonzero(error == worst[interval])
+        first = isWorst[np.r_[True, interval[isWorst][1:] != interval[isWorst][:-1]]]
+        keep[candidates[first[split[interval[first]]]]] = True
+        undecided[candidates[~split[interval]]] = False
+        undecided &= ~keep
+    return keep
+
+
+def simplifySections(morph, sections, tolerance, points=None):
+    """Return (Sections, path point count) keeping only the samples needed within tolerance."""
+    if points is None:
+        points = morph.points
+    rows, offsets = sections.paths()
+    if tolerance <= 0 or len(rows) == 0:
+        return sections, len(rows)
+    keep = simplifyPaths(points[rows], morph.radii[rows], offsets, tolerance)
+
+    #drop the attachment slots again to get back to the Sections layout
+    attached = sections.parents >= 0
+    isAttachment = np.zeros(len(rows), dtype=bool)
+    isAttachment[offsets[:-1][attached]] = True
+    kept = keep & ~isAttachment
+    counts = np.add.reduceat(kept.astype(np.int64), offsets[:-1]) if len(offsets) > 1 else np.zeros(0, dtype=np.int64)
+    newOffsets = np.zeros(len(sections) + 1, dtype=np.int64)
+    np.cumsum(counts, out=newOffsets[1:])
+    simplified = topology.Sections(rows[kept], newOffsets, sections.parents, sections.types)
+    return simplified, int(keep.sum())
+
+
+def levels(morph, sections, tolerances, points=None):
+    """Return a Level for full detail followed by one per tolerance, in the given order."""
+    result = [Level(0.0, sections, int(len(sections.rows) + (sections.parents >= 0).sum()))]
+    for tolerance in tolerances:
+        simplified, count = simplifySections(morph, sections, tolerance, points)
+        result.append(Level(tolerance, simplified, count))
+    return result
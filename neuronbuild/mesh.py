@@ -0,0 +1,251 @@
+"""
+Tube mesh generator: one polygon mesh of radius-varying tubes for all sections.
+
+Each section path ([attachment] + rows, see topology.py) gets a ring of `sides` vertices
+per sample, sized by the sample radius, joined to the next ring by quads. Ring
+orientation follows parallel-transport (rotation minimizing) frames, so the tubes do
+not twist around their path. The frames are computed for every section at once: the
+rotation between consecutive tangents is a quaternion, and the running product along
+each section is a segmented prefix scan done in log2(longest section) array steps.
+
+Polygons use the C4D layout: quads (a, b, c, d), triangles repeat c as d. The face
+normal cross(b - a, c - a) points out of the tube.
+"""
+
+import numpy as np
+
+#tangents shorter than this (duplicate samples) borrow the previous tangent
+EPSILON = 1e-9
+
+
+class Mesh(object):
+    """A polygon mesh held as arrays.
+
+    vertices  float64 (v, 3)  vertex positions
+    polygons  int32   (p, 4)  vertex indices per polygon, triangles have c == d
+    sections  int64   (p,)    section each polygon was generated from
+    """
+
+    def __init__(self, vertices, polygons, sections):
+        self.vertices = vertices
+        self.polygons = polygons
+        self.sections = sections
+
+    def __repr__(self):
+        return "Mesh(%d vertices, %d polygons)" % (len(self.vertices), len(self.polygons))
+
+    def subset(self, polygonMask):
+        """Return a new Mesh holding only the polygons in polygonMask, with unused vertices dropped."""
+        polygons = self.polygons[polygonMask]
+        used = np.zeros(len(self.vertices), dtype=bool)
+        used[polygons.ravel()] = True
+        remap = np.cumsum(used) - 1
+        return Mesh(self.vertices[used], remap[polygons].astype(np.int32), self.sections[polygonMask])
+
+
+def joinMeshes(meshes):
+    """Return one Mesh holding all of meshes, vertex indices shifted to the joined vertex array."""
+    meshes = list(meshes)
+    if not meshes:
+        return Mesh(np.zeros((0, 3)), np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.int64))
+    starts = np.cumsum([0] + [len(m.vertices) for m in meshes[:-1]])
+    return Mesh(np.concatenate([m.vertices for m in meshes]),
+                np.concatenate([m.polygons + start for m, start in zip(meshes, starts)]).astype(np.int32),
+                np.concatenate([m.sections for m in meshes]))
+
+
+def splitMesh(tubes, labels):
+    """Split a Mesh by a label per polygon (e.g. the structure type of its section).
+
+    Returns (values, meshes): the sorted distinct labels and one Mesh per label. Polygons
+    and vertices are grouped with one stable sort each, so every part keeps its own order.
+    A vertex shared by polygons of different labels goes into each of their parts.
+    """
+    labels = np.asarray(labels)
+    values, polygonLabels = np.unique(labels, return_inverse=True)
+    if len(values) < 2:
+        return values, [tubes]
+
+    #the label of every vertex; a vertex used under two labels makes the split fall back to subsets
+    vertexLabels = np.full(len(tubes.vertices), -1, dtype=np.int64)
+    vertexLabels[tubes.polygons.ravel()] = np.repeat(polygonLabels, tubes.polygons.shape[1])
+    if not np.array_equal(vertexLabels[tubes.polygons], np.repeat(polygonLabels[:, None], tubes.polygons.shape[1], 1)):
+        return values, [tubes.subset(polygonLabels == i) for i in range(len(values))]
+
+    used = vertexLabels >= 0
+    vertexOrder = np.flatnonzero(used)[np.argsort(vertexLabels[used], kind="stable")]
+    vertexStarts = np.searchsorted(vertexLabels[vertexOrder], np.arange(len(values) + 1))
+    #new index of each vertex within its own part
+    remap = np.empty(len(tubes.vertices), dtype=np.int64)
+    remap[vertexOrder] = np.arange(len(vertexOrder)) - np.repeat(vertexStarts[:-1], np.diff(vertexStarts))
+
+    polygonOrder = np.argsort(polygonLabels, kind="stable")
+    polygonStarts = np.searchsorted(polygonLabels[polygonOrder], np.arange(len(values) + 1))
+    polygons = remap[tubes.polygons[polygonOrder]].astype(np.int32)
+    vertices = tubes.vertices[vertexOrder]
+    sections = tubes.sections[polygonOrder]
+    meshes = [Mesh(vertices[vertexStarts[i]:vertexStarts[i + 1]], polygons[polygonStarts[i]:polygonStarts[i + 1]],
+                   sections[polygonStarts[i]:polygonStarts[i + 1]]) for i in range(len(values))]
+    return values, meshes
+
+
+def quatMultiply(q, r):
+    """Hamilton product of quaternion arrays (w, x, y, z)."""
+    w1, x1, y1, z1 = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    w2, x2, y2, z2 = r[:, 0], r[:, 1], r[:, 2], r[:, 3]
+    return np.stack((w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                     w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                     w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                     w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2), axis=1)
+
+
+def quatRotate(q, v):
+    """Rotate vectors v (n, 3) by unit quaternions q (n, 4)."""
+    w = q[:, :1]
+    u = q[:, 1:]
+    t = 2.0 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
+def perpendicular(t):
+    """Return unit vectors perpendicular to the unit vectors t."""
+    axis = np.zeros_like(t)
+    axis[np.arange(len(t)), np.argmin(np.abs(t), axis=1)] = 1.0
+    p = np.cross(t, axis)
+    return p / np.linalg.norm(p, axis=1)[:, None]
+
+
+def pathTangents(positions, offsets):
+    """Return unit tangents for flat paths (central differences inside, one-sided at the ends)."""
+    n = len(positions)
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    following = np.minimum(np.arange(n) + 1, n - 1)
+    preceding = np.maximum(np.arange(n) - 1, 0)
+    isStart = np.zeros(n, dtype=bool)
+    isEnd = np.zeros(n, dtype=bool)
+    isStart[starts] = True
+    isEnd[ends] = True
+    following[isEnd] = np.arange(n)[isEnd]
+    preceding[isStart] = np.arange(n)[isStart]
+    tangents = positions[following] - positions[preceding]
+
+    #samples on top of each other have no direction; give the start of each path a chord
+    #(or z) direction, then let every other such sample borrow its predecessor's tangent
+    length = np.linalg.norm(tangents, axis=1)
+    valid = length > EPSILON
+    badStarts = starts[~valid[starts]]
+    if len(badStarts):
+        chord = positions[ends[~valid[starts]]] - positions[badStarts]
+        chordLength = np.linalg.norm(chord, axis=1)
+        chord[chordLength <= EPSILON] = (0.0, 0.0, 1.0)
+        tangents[badStarts] = chord
+        length[badStarts] = np.linalg.norm(chord, axis=1)
+        valid[badStarts] = True
+    fill = np.maximum.accumulate(np.where(valid, np.arange(n), 0))
+    tangents = tangents[fill] / length[fill][:, None]
+    return tangents
+
+
+def transportFrames(tangents, offsets):
+    """Return parallel-transported unit normals for flat paths with the given unit tangents."""
+    n = len(tangents)
+    starts = offsets[:-1]
+    counts = np.diff(offsets)
+    position = np.arange(n) - np.repeat(starts, counts)
+
+    #minimal rotation from each tangent's predecessor to it; identity at path starts
+    previous = tangents[np.maximum(np.arange(n) - 1, 0)]
+    dot = np.einsum("ij,ij->i", previous, tangents)
+    q = np.empty((n, 4))
+    q[:, 0] = 1.0 + dot
+    q[:, 1:] = np.cross(previous, tangents)
+    flipped = q[:, 0] < EPSILON
+    if flipped.any():
+        #a 180 degree turn: rotate about any axis perpendicular to the tangent
+        q[flipped, 0] = 0.0
+        q[flipped, 1:] = perpendicular(tangents[flipped])
+    q[position == 0] = (1.0, 0.0, 0.0, 0.0)
+    q /= np.linalg.norm(q, axis=1)[:, None]
+
+    #segmented inclusive scan: q[i] becomes R_i * R_(i-1) * ... * R_(start + 1)
+    step = 1
+    while step < (counts.max() if len(counts) else 0):
+        later = np.flatnonzero(position >= step)
+        q[later] = quatMultiply(q[later], q[later - step])
+        #renormalize to keep rounding from accumulating over long sections
+        q[later] /= np.linalg.norm(q[later], axis=1)[:, None]
+        step *= 2
+
+    firstNormals = perpendicular(tangents[starts])
+    normals = quatRotate(q, np.repeat(firstNormals, counts, axis=0))
+    #remove drift so the frame stays exactly orthogonal to the tangent
+    normals -= np.einsum("ij,ij->i", normals, tangents)[:, None] * tangents
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    return normals
+
+
+def tubeMesh(morph, sections, sides=6, points=None, caps=True):
+    """Build one Mesh of tubes for all sections with at least two path points.
+
+    points overrides morph.points (e.g. positions already converted to C4D space).
+    With caps, both ends of every tube are closed with a triangle fan.
+    """
+    if points is None:
+        points = morph.points
+    rows, offsets = sections.paths()
+    counts = np.diff(offsets)
+    keep = counts >= 2
+    if not keep.all():
+        rows = rows[np.repeat(keep, counts)]
+        counts = counts[keep]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+    sectionIds = np.flatnonzero(keep)
+    if len(rows) == 0:
+        return Mesh(np.zeros((0, 3)), np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.int64))
+
+    positions = points[rows]
+    radii = morph.radii[rows]
+    tangents = pathTangents(positions, offsets)
+    normals = transportFrames(tangents, offsets)
+    binormals = np.cross(tangents, normals)
+
+    #rings: vertex k of sample i sits at angle 2*pi*k/sides around the path
+    angles = 2.0 * np.pi * np.arange(sides) / sides
+    cos, sin = np.cos(angles), np.sin(angles)
+    ringOffsets = (normals[:, None, :] * cos[None, :, None] + binormals[:, None, :] * sin[None, :, None])
+    vertices = (positions[:, None, :] + radii[:, None, None] * ringOffsets).reshape(-1, 3)
+
+    #quads between consecutive rings of the same path
+    n = len(rows)
+    notLast = np.ones(n, dtype=bool)
+    notLast[offsets[1:] - 1] = False
+    ringStarts = np.flatnonzero(notLast) * sides
+    k = np.arange(sides)
+    k1 = (k + 1) % sides
+    a = ringStarts[:, None] + k[None, :]
+    b = ringStarts[:, None] + k1[None, :]
+    quads = np.stack((a, b, b + sides, a + sides), axis=2).reshape(-1, 4)
+    quadSections = np.repeat(np.repeat(sectionIds, counts - 1), sides)
+
+    polygons = [quads]
+    polygonSections = [quadSections]
+    if caps:
+        #a centre vertex per path end and a fan of triangles around it
+        startRings = offsets[:-1] * sides
+        endRings = (offsets[1:] - 1) * sides
+        centres = np.concatenate((positions[offsets[:-1]], positions[offsets[1:] - 1]))
+        centreIndex = len(vertices) + np.arange(len(centres))
+        vertices = np.concatenate((vertices, centres))
+        m = len(startRings)
+        startFan = np.stack((np.repeat(centreIndex[:m], sides),
+                             (startRings[:, None] + k1[None, :]).ravel(),
+                             (startRings[:, None] + k[None, :]).ravel()), axis=1)
+        endFan = np.stack((np.repeat(centreIndex[m:], sides),
+                           (endRings[:, None] + k[None, :]).ravel(),
+                           (endRings[:, None] + k1[None, :]).ravel()), axis=1)
+        fans = np.concatenate((startFan, endFan))
+        polygons.append(np.concatenate((fans, fans[:, 2:3]), axis=1))
+        polygonSections.append(np.concatenate((np.repeat(sectionIds, sides), np.repeat(sectionIds, sides))))
+
+    return Mesh(vertices, np.concatenate(polygons).astype(np.int32), np.concatenate(polygonSections))
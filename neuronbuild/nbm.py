@@ -0,0 +1,157 @@
+"""
+NBM: a memory-mappable binary container for a Morphology and its Sections.
+
+Opening an .nbm file maps it and hands out column views into the mapping, so nothing
+is parsed or copied; the operating system pages data in as the builders touch it.
+
+Layout (all integers little-endian):
+
+    header   magic "NBMORPH\\0", uint32 version, uint32 flags (0),
+             int64 samples n, int64 sections k, int64 section rows m, int64 name bytes
+    name     UTF-8 file name the data came from
+    columns  each starting on a 64-byte boundary, in this order:
+             ids int64 (n)            types int32 (n)        points float64 (n, 3)
+             radii float64 (n)        parents int64 (n)
+             sectionRows int64 (m)    sectionOffsets int64 (k + 1)
+             sectionParents int64 (k) sectionTypes int32 (k)
+
+The columns are the swc.Morphology and topology.Sections arrays unchanged; the section
+table is the one buildSections produces with the default exclude (soma left out).
+convert() writes the samples in depth-first order (topology.renumber), so every section
+is a contiguous run of the mapped columns and imports need not reorder (copy) them.
+
+Convert from the command line:
+    python -m neuronbuild.nbm in.swc [out.nbm]     SWC to NBM
+    python -m neuronbuild.nbm in.nbm out.swc       NBM back to SWC
+"""
+
+import os, struct, sys
+
+import numpy as np
+
+from . import swc, topology
+
+MAGIC = b"NBMORPH\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIqqqq")
+ALIGN = 64
+
+#(name, dtype, columns per row, length key): length key n = samples, m = section rows, k = sections
+COLUMNS = (
+    ("ids", "<i8", 1, "n"),
+    ("types", "<i4", 1, "n"),
+    ("points", "<f8", 3, "n"),
+    ("radii", "<f8", 1, "n"),
+    ("parents", "<i8", 1, "n"),
+    ("sectionRows", "<i8", 1, "m"),
+    ("sectionOffsets", "<i8", 1, "k+1"),
+    ("sectionParents", "<i8", 1, "k"),
+    ("sectionTypes", "<i4", 1, "k"),
+)
+
+EXTENSION = ".nbm"
+
+#rows formatted per write by writeSWC
+WRITE_BLOCK = 1 << 16
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(n, k, m, nameBytes):
+    """Yield (name, dtype, shape, byte offset) for every column."""
+    lengths = {"n": n, "m": m, "k": k, "k+1": k + 1}
+    offset = _aligned(HEADER.size + nameBytes)
+    for name, dtype, width, key in COLUMNS:
+        shape = (lengths[key], width) if width > 1 else (lengths[key],)
+        yield name, np.dtype(dtype), shape, offset
+        offset = _aligned(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+
+def isNBM(path):
+    """True when path names an NBM file (by extension)."""
+    return str(path).lower().endswith(EXTENSION)
+
+
+def write(path, morph, sections=None):
+    """Write morph (and its sections, built here if not given) to path as NBM."""
+    if sections is None:
+        sections = topology.buildSections(morph)
+    name = morph.name.encode("utf-8")
+    n, k, m = len(morph), len(sections), len(sections.rows)
+    arrays = dict(ids=morph.ids, types=morph.types, points=morph.points, radii=morph.radii,
+                  parents=morph.parents, sectionRows=sections.rows, sectionOffsets=sections.offsets,
+                  sectionParents=sections.parents, sectionTypes=sections.types)
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, n, k, m, len(name)))
+        f.write(name)
+        for column, dtype, shape, offset in _layout(n, k, m, len(name)):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(arrays[column], dtype=dtype).reshape(shape).tobytes())
+    os.replace(temp, path)
+
+
+def read(path):
+    """Map an NBM file; returns (Morphology, Sections) whose arrays are read-only views of the file."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("%s: not an NBM file (too short)" % path)
+        magic, version, flags, n, k, m, nameBytes = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("%s: not an NBM file" % path)
+        if version != VERSION:
+            raise ValueError("%s: NBM version %d is not supported (expected %d)" % (path, version, VERSION))
+        name = f.read(nameBytes).decode("utf-8")
+
+    layout = list(_layout(n, k, m, nameBytes))
+    _, lastType, lastShape, lastOffset = layout[-1]
+    size = lastOffset + int(np.prod(lastShape)) * lastType.itemsize
+    if os.path.getsize(path) < size:
+        raise ValueError("%s: truncated NBM file" % path)
+    data = np.memmap(path, dtype=np.uint8, mode="r", shape=(size,))
+    columns = {}
+    for column, dtype, shape, offset in layout:
+        count = int(np.prod(shape))
+        columns[column] = data[offset:offset + count * dtype.itemsize].view(dtype).reshape(shape)
+
+    morph = swc.Morphology(columns["ids"], columns["types"], columns["points"], columns["radii"],
+                           columns["parents"], name or swc.swcName(path))
+    sections = topology.Sections(columns["sectionRows"], columns["sectionOffsets"],
+                                 columns["sectionParents"], columns["sectionTypes"])
+    return morph, sections
+
+
+def writeSWC(path, morph):
+    """Write morph as an SWC text file (ids, types and parents as integers, 10 significant digits)."""
+    template = "%d %d %.10g %.10g %.10g %.10g %d\n"
+    with open(path, "w") as f:
+        f.write("# %s, written by NeuronBuild\n" % morph.name)
+        #formatted in blocks so the text never exists for the whole file at once
+        for start in range(0, len(morph), WRITE_BLOCK):
+            block = slice(start, start + WRITE_BLOCK)
+            columns = (morph.ids[block], morph.types[block], morph.points[block, 0], morph.points[block, 1],
+                       morph.points[block, 2], morph.radii[block], morph.parents[block])
+            f.write("".join(template % row for row in zip(*[c.tolist() for c in columns])))
+
+
+def convert(source, target=None):
+    """Convert between SWC and NBM by file extension; returns the target path."""
+    if isNBM(source):
+        if target is None:
+            target = os.path.splitext(source)[0] + ".swc"
+        morph, _ = read(source)
+        writeSWC(target, morph)
+    else:
+        if target is None:
+            target = os.path.join(os.path.dirname(source), swc.swcName(source) + EXTENSION)
+        write(target, *topology.renumber(swc.readSWC(source)))
+    return target
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python -m neuronbuild.nbm in.swc [out.nbm] | in.nbm [out.swc]")
+    print(convert(*sys.argv[1:]))
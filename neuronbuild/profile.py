@@ -0,0 +1,118 @@
+"""
+Lightweight stage profiling: named, nested timing spans and counters.
+
+    profiler = Profiler(enabled=True)
+    with profiler.span("readFile"):
+        with profiler.span("parse"):
+            ...
+        profiler.count("points", 1200)
+    print(profiler.report())
+
+Spans nest: a span opened inside another is recorded under "outer/inner", and repeated
+spans with the same path are summed. Times measured elsewhere (e.g. in a worker process)
+can be added with record(). When the profiler is disabled, span() returns one shared
+object whose enter and exit do nothing, and count() and record() return at once, so the
+hooks can stay in place in the importer.
+"""
+
+import json, time
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack
+        self.profiler._add("/".join(stack), elapsed, 1)
+        stack.pop()
+        return False
+
+
+class Profiler(object):
+    """Collects span times and counters; see the module docstring."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        #path -> [calls, seconds], in the order spans were first seen
+        self.spans = {}
+        self.counters = {}
+        self._stack = []
+
+    def span(self, name):
+        """Return a context manager timing the enclosed block as name (nested under any open span)."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, seconds, calls=1):
+        """Add a time measured elsewhere as a span name under the currently open span."""
+        if self.enabled:
+            self._add("/".join(self._stack + [name]), seconds, calls)
+
+    def count(self, name, n=1):
+        """Add n to the counter name."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _add(self, path, seconds, calls):
+        entry = self.spans.get(path)
+        if entry is None:
+            self.spans[path] = [calls, seconds]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+
+    def asDict(self):
+        """Return the spans and counters as plain data (for JSON)."""
+        return dict(spans=[dict(path=path, calls=calls, seconds=seconds)
+                           for path, (calls, seconds) in self.spans.items()],
+                    counters=dict(self.counters))
+
+    def report(self):
+        """Return the spans as an indented table (time, share of all top-level spans, calls), then the counters."""
+        top = sum(seconds for path, (calls, seconds) in self.spans.items() if "/" not in path)
+        lines = ["%-44s %10s %7s %8s" % ("stage", "seconds", "%", "calls")]
+        #children listed under their parents, in the order they were first seen
+        order = dict((path, i) for i, path in enumerate(self.spans))
+        def sortKey(path):
+            parts = path.split("/")
+            return [order.get("/".join(parts[:i + 1]), -1) for i in range(len(parts))]
+        for path in sorted(self.spans, key=sortKey):
+            calls, seconds = self.spans[path]
+            depth = path.count("/")
+            label = "  " * depth + path.rsplit("/", 1)[-1]
+            lines.append("%-44s %10.4f %6.1f%% %8d" % (label, seconds, 100.0 * seconds / top if top else 0.0, calls))
+        for name in sorted(self.counters):
+            lines.append("%-44s %10d" % (name, self.counters[name]))
+        return "\n".join(lines)
+
+    def write(self, path):
+        """Write the report to path: JSON if it ends in .json, else the text table."""
+        with open(path, "w") as f:
+            if path.lower().endswith(".json"):
+                json.dump(self.asDict(), f, indent=1)
+            else:
+                f.write(self.report() + "\n")
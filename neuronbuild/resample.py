@@ -0,0 +1,156 @@
+"""
+Arc-length resampling of section paths, to even out the sample density before building.
+
+Tracings are sampled very unevenly: some files carry runs of near-duplicate samples a
+fraction of a micron apart, and every builder pays for each of them. resample() moves
+the interior samples of every section path ([attachment] + rows, see topology.py) to an
+even spacing along the path and drops the surplus. Path ends are kept exactly, so branch
+points, tips and type changes stay where they are, and so do soma samples and anything
+else outside the sections.
+
+The spacing may grow with the radius: a segment is measured in units of
+max(spacing, radiusScale * radius), since detail finer than its own radius is lost in a
+tube anyway. All paths are handled at once on one cumulative (scaled) length array:
+path p of total length U gets k = round(U) intervals, and its new samples sit at
+j * U / k along it, found by a binary search in the cumulative lengths and linear
+interpolation of positions and radii. Resampling only ever removes samples: a path
+whose current spacing is already at or above the target keeps its samples unchanged.
+"""
+
+import numpy as np
+
+from . import swc, topology
+
+
+class Resampled(object):
+    """A resampled morphology and what resampling did.
+
+    morph     swc.Morphology with the kept samples in file order, then the new samples
+    sections  topology.Sections over morph: section i is section i of the input, resampled (a
+              fresh buildSections of morph may number them differently, since the new samples
+              come after the kept ones; topology.renumber puts both in buildSections order)
+    before    path points (attachments included) before resampling
+    after     path points after resampling
+    paths     number of section paths that were resampled
+    """
+
+    def __init__(self, morph, sections, spacing, radiusScale, before, after, paths):
+        self.morph = morph
+        self.sections = sections
+        self.spacing = spacing
+        self.radiusScale = radiusScale
+        self.before = before
+        self.after = after
+        self.paths = paths
+
+    def __repr__(self):
+        return "Resampled(%d -> %d path points)" % (self.before, self.after)
+
+    def removed(self):
+        """Return the number of path points resampling removed."""
+        return self.before - self.after
+
+    def format(self):
+        """Return a one-line summary."""
+        return "resampled %d of %d sections to %g µm spacing: %d -> %d path points (%.1f%% removed)" % (
+            self.paths, len(self.sections), self.spacing, self.before, self.after,
+            100.0 * self.removed() / max(self.before, 1))
+
+
+def resample(morph, sections, spacing, radiusScale=0.0):
+    """Return the Resampled morphology with every section path evened out to spacing.
+
+    spacing is in the morphology's units; radiusScale > 0 lets the spacing grow to that
+    multiple of the local radius. Sample ids of kept samples do not change; new samples
+    get ids above the largest one in the file.
+    """
+    rows, offsets = sections.paths()
+    counts = np.diff(offsets)
+    if spacing <= 0 or len(rows) < 2:
+        return Resampled(morph, sections, spacing, radiusScale, len(rows), len(rows), 0)
+    positions = morph.points[rows]
+    radii = morph.radii[rows]
+    #NaN lengths would turn into garbage interval counts (validation stops such files unless they are repaired)
+    bad = ~(np.isfinite(positions).all(axis=1) & np.isfinite(radii))
+    if bad.any():
+        raise ValueError("cannot resample: sample id %d has a position or radius that is not a finite number"
+                         % morph.ids[rows[np.argmax(bad)]])
+
+    #cumulative length of the flat paths in units of the local spacing; no length between paths
+    lengths = np.linalg.norm(positions[1:] - positions[:-1], axis=1)
+    lengths[offsets[1:-1] - 1] = 0.0
+    step = np.maximum(spacing, radiusScale * (radii[1:] + radii[:-1]) / 2.0)
+    cumulative = np.zeros(len(rows))
+    np.cumsum(lengths / step, out=cumulative[1:])
+
+    starts, ends = offsets[:-1], offsets[1:] - 1
+    total = cumulative[ends] - cumulative[starts]
+    if not np.isfinite(total).all():
+        raise ValueError("cannot resample: a section path is too long to measure")
+    intervals = np.maximum(np.rint(total), 1).astype(np.int64)
+    resampled = intervals < counts - 1
+    intervals = np.where(resampled, intervals, counts - 1)
+
+    #new interior samples at even steps along every resampled path
+    which = np.flatnonzero(resampled)
+    #between none and all of the path's interior samples, whatever the rounding did
+    addedCounts = np.clip(intervals[which] - 1, 0, counts[which] - 2)
+    paths = np.repeat(which, addedCounts)
+    firsts = np.zeros(len(which) + 1, dtype=np.int64)
+    np.cumsum(addedCounts, out=firsts[1:])
+    j = np.arange(len(paths)) - np.repeat(firsts[:-1], addedCounts) + 1
+    target = cumulative[starts[paths]] + j * total[paths] / intervals[paths]
+    segment = np.clip(np.searchsorted(cumulative, target, side="right") - 1, starts[paths], ends[paths] - 1)
+    width = cumulative[segment + 1] - cumulative[segment]
+    t = np.divide(target - cumulative[segment], width, out=np.zeros_like(target), where=width > 0)
+    newPoints = positions[segment] + t[:, None] * (positions[segment + 1] - positions[segment])
+    newRadii = radii[segment] + t * (radii[segment + 1] - radii[segment])
+
+    #the interior samples of resampled paths go; everything else stays, in file order
+    slotPaths = np.repeat(np.arange(len(counts)), counts)
+    slots = np.arange(len(rows)) - np.repeat(starts, counts)
+    interior = resampled[slotPaths] & (slots > 0) & (slots < counts[slotPaths] - 1)
+    keep = np.ones(len(morph), dtype=bool)
+    keep[rows[interior]] = False
+    kept = np.flatnonzero(keep)
+    newIndex = np.full(len(morph), -1, dtype=np.int64)
+    newIndex[kept] = np.arange(len(kept))
+
+    #new samples hang from their predecessor along the path, and each path end from the last new sample
+    ids = morph.ids
+    newIds = ids.max() + 1 + np.arange(len(paths))
+    startIds = ids[rows[starts[which]]]
+    hasNew = addedCounts > 0
+    previous = np.empty(len(paths), dtype=np.int64)
+    previous[1:] = newIds[:-1]
+    previous[firsts[:-1][hasNew]] = startIds[hasNew]
+    lastNew = np.append(newIds, -1)[np.maximum(firsts[1:] - 1, 0)]
+    parents = morph.parents.copy()
+    parents[rows[ends[which]]] = np.where(hasNew, lastNew, startIds)
+    result = swc.Morphology(np.concatenate((ids[kept], newIds)),
+                            np.concatenate((morph.types[kept], sections.types[paths])),
+                            np.concatenate((morph.points[kept], newPoints)),
+                            np.concatenate((morph.radii[kept], newRadii)),
+                            np.concatenate((parents[kept], previous)), morph.name)
+
+    #the new path layout: start, new samples, end for resampled paths, the old samples for the others
+    newCounts = intervals + 1
+    newOffsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(newCounts, out=newOffsets[1:])
+    pathRows = np.empty(newOffsets[-1], dtype=np.int64)
+    survivors = np.flatnonzero(~interior)
+    survivorPaths = slotPaths[survivors]
+    survivorSlots = np.where(resampled[survivorPaths] & (slots[survivors] > 0), intervals[survivorPaths],
+                             slots[survivors])
+    pathRows[newOffsets[survivorPaths] + survivorSlots] = newIndex[rows[survivors]]
+    pathRows[newOffsets[paths] + j] = len(kept) + np.arange(len(paths))
+
+    #and back to the Sections layout, without the attachment slots
+    attached = sections.parents >= 0
+    isAttachment = np.zeros(len(pathRows), dtype=bool)
+    isAttachment[newOffsets[:-1][attached]] = True
+    sectionOffsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(newCounts - attached, out=sectionOffsets[1:])
+    parentRows = np.where(attached, newIndex[np.maximum(sections.parents, 0)], -1)
+    newSections = topology.Sections(pathRows[~isAttachment], sectionOffsets, parentRows, sections.types)
+    return Resampled(result, newSections, spacing, radiusScale, len(rows), len(pathRows), len(which))
@@ -0,0 +1,277 @@
+"""
+Soma reconstruction: one closed polygon mesh for the cell body, whatever the encoding.
+
+SWC files describe the soma (type 1 samples) in one of a few ways; NeuroMorpho.org
+uses all of them. The soma rows are split into connected groups (by their parent links
+among soma rows), and each group is recognised as
+
+    single point    one sample: a sphere of its radius
+    three point     a centre sample with two samples at +-radius on opposite sides (the
+                    NeuroMorpho standard): the sphere of the centre's radius
+    contour         an unbranched chain of samples outlining the soma in (roughly) a plane,
+                    wider than the samples are thick: the outline lofted into a closed
+                    blob, rounded off above and below by the outline's equivalent radius
+    cylinder stack  an unbranched chain of samples along the soma's axis, each radius a
+                    cross-section: a tube through the samples, capped at both ends
+    point cloud     anything else (branching or scattered soma samples): the ellipsoid
+                    fitted to the samples' principal axes, grown by their mean radius
+
+Every shape is a loft: rings of vertices stacked along an axis and closed by a pole
+vertex at each end, with the polygon layout and winding of mesh.tubeMesh (face normals
+point out). All of it is array arithmetic over the soma rows, so even contours of
+hundreds of samples take a negligible share of an import.
+"""
+
+import numpy as np
+
+from .mesh import Mesh, pathTangents, transportFrames, joinMeshes, EPSILON
+
+SINGLE_POINT = "single point"
+THREE_POINT = "three point"
+CONTOUR = "contour"
+CYLINDERS = "cylinder stack"
+CLOUD = "point cloud"
+
+#vertices around each ring of the generated shapes (contours keep more if they have them)
+SEGMENTS = 16
+
+#how far (relative to the centre radius) the outer samples of a three-point soma may sit
+#from where the standard puts them
+THREE_POINT_TOLERANCE = 0.25
+
+
+class Soma(object):
+    """One reconstructed soma group.
+
+    encoding  one of SINGLE_POINT, THREE_POINT, CONTOUR, CYLINDERS, CLOUD
+    rows      int64 (k,)  the group's rows, in chain order for contours and cylinder stacks
+    mesh      the closed mesh.Mesh of the group (no polygons when it has no size)
+    """
+
+    def __init__(self, encoding, rows, mesh):
+        self.encoding = encoding
+        self.rows = rows
+        self.mesh = mesh
+
+    def __repr__(self):
+        return "Soma(%s, %d samples, %r)" % (self.encoding, len(self.rows), self.mesh)
+
+
+def _empty():
+    return Mesh(np.zeros((0, 3)), np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.int64))
+
+
+def loft(rings, bottom, top):
+    """Close a stack of rings into a Mesh.
+
+    rings is (r, m, 3), listed from bottom to top, each ring running counterclockwise seen
+    from the top; bottom and top are the pole positions.
+    """
+    count, m = rings.shape[0], rings.shape[1]
+    vertices = np.concatenate((rings.reshape(-1, 3), [bottom, top]))
+    k = np.arange(m)
+    k1 = (k + 1) % m
+    starts = np.arange(count - 1)[:, None] * m
+    a = starts + k[None, :]
+    b = starts + k1[None, :]
+    quads = np.stack((a, b, b + m, a + m), axis=2).reshape(-1, 4)
+    lowest, highest = 0, (count - 1) * m
+    bottomFan = np.stack((np.full(m, count * m), lowest + k1, lowest + k, lowest + k), axis=1)
+    topFan = np.stack((np.full(m, count * m + 1), highest + k, highest + k1, highest + k1), axis=1)
+    polygons = np.concatenate((quads, bottomFan, topFan)).astype(np.int32)
+    return Mesh(vertices, polygons, np.zeros(len(polygons), dtype=np.int64))
+
+
+def _latitudes(segments):
+    """Sines and cosines of the ring latitudes between the poles."""
+    bands = max(segments // 2, 2)
+    phi = -np.pi / 2.0 + np.pi * np.arange(1, bands) / bands
+    return np.sin(phi), np.cos(phi)
+
+
+def ellipsoidMesh(centre, axes, segments=SEGMENTS):
+    """Return the closed Mesh of the ellipsoid with the given centre and semi-axes (rows of axes, (3, 3))."""
+    axes = np.array(axes, dtype=np.float64)
+    if np.linalg.det(axes) < 0:
+        axes[2] = -axes[2]
+    angles = 2.0 * np.pi * np.arange(segments) / segments
+    circle = np.cos(angles)[:, None] * axes[0] + np.sin(angles)[:, None] * axes[1]
+    sin, cos = _latitudes(segments)
+    rings = centre + cos[:, None, None] * circle[None, :, :] + sin[:, None, None] * axes[2]
+    return loft(rings, centre - axes[2], centre + axes[2])
+
+
+def sphereMesh(centre, radius, segments=SEGMENTS):
+    """Return the closed Mesh of a sphere."""
+    return ellipsoidMesh(centre, np.eye(3) * radius, segments)
+
+
+def contourMesh(outline, segments=SEGMENTS):
+    """Return the closed Mesh lofted from a closed outline (k, 3) of soma samples."""
+    if len(outline) > 1 and np.linalg.norm(outline[-1] - outline[0]) <= EPSILON:
+        outline = outline[:-1]
+    centre = outline.mean(axis=0)
+    offsets = outline - centre
+    normal = np.linalg.svd(offsets, full_matrices=False)[2][2]
+
+    #run the outline counterclockwise around the normal
+    turning = np.cross(offsets, np.roll(offsets, -1, axis=0)).sum(axis=0) @ normal
+    if turning < 0:
+        offsets = offsets[::-1]
+    area = abs(turning) / 2.0
+    if area <= EPSILON:
+        return _empty()
+
+    #a few samples would give a faceted outline: resample it evenly by arc length
+    if len(offsets) < segments:
+        closed = np.concatenate((offsets, offsets[:1]))
+        lengths = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(closed, axis=0), axis=1))))
+        at = lengths[-1] * np.arange(segments) / segments
+        offsets = np.stack([np.interp(at, lengths, closed[:, i]) for i in range(3)], axis=1)
+
+    height = np.sqrt(area / np.pi) * normal
+    sin, cos = _latitudes(segments)
+    rings = centre + cos[:, None, None] * offsets[None, :, :] + sin[:, None, None] * height
+    return loft(rings, centre - height, centre + height)
+
+
+def cylinderMesh(positions, radii, segments=SEGMENTS):
+    """Return the closed Mesh of a tube through positions (k, 3) with the given radii, capped at both ends."""
+    if len(positions) < 2 or radii.max() <= 0:
+        return _empty()
+    offsets = np.array([0, len(positions)])
+    tangents = pathTangents(positions, offsets)
+    normals = transportFrames(tangents, offsets)
+    binormals = np.cross(tangents, normals)
+    angles = 2.0 * np.pi * np.arange(segments) / segments
+    circle = normals[:, None, :] * np.cos(angles)[None, :, None] + binormals[:, None, :] * np.sin(angles)[None, :, None]
+    rings = positions[:, None, :] + radii[:, None, None] * circle
+    return loft(rings, positions[0], positions[-1])
+
+
+def cloudMesh(positions, radii, segments=SEGMENTS):
+    """Return the closed Mesh of the ellipsoid fitted to scattered soma samples."""
+    centre = positions.mean(axis=0)
+    offsets = positions - centre
+    #principal axes; points spread evenly over an ellipsoid's surface have variance a^2 / 3 along each
+    spread, axes = np.linalg.eigh(offsets.T @ offsets / len(positions))
+    semiAxes = np.sqrt(3.0 * np.maximum(spread, 0.0)) + radii.mean()
+    if semiAxes.max() <= 0:
+        return _empty()
+    return ellipsoidMesh(centre, axes.T[::-1] * semiAxes[::-1, None], segments)
+
+
+def _threePointCentre(positions, radii):
+    """Return the centre row (0-2) of a standard three-point soma, or None."""
+    for centre in range(3):
+        radius = radii[centre]
+        if radius <= 0:
+            continue
+        a, b = [positions[i] - positions[centre] for i in range(3) if i != centre]
+        tolerance = THREE_POINT_TOLERANCE * radius
+        if (np.linalg.norm(a + b) <= tolerance and abs(np.linalg.norm(a) - radius) <= tolerance
+                and abs(np.linalg.norm(b) - radius) <= tolerance):
+            return centre
+    return None
+
+
+def _groups(parentRows, rows):
+    """Split rows into groups connected by parent links among them.
+
+    Returns (groups, chains): each group's rows (ordered from its root outwards when the
+    group is an unbranched chain), and whether it is one.
+    """
+    m = len(rows)
+    local = np.full(len(parentRows), -1, dtype=np.int64)
+    local[rows] = np.arange(m)
+    parents = parentRows[rows]
+    localParents = np.where(parents >= 0, local[np.maximum(parents, 0)], -1)
+    localParents[localParents == np.arange(m)] = -1
+
+    #pointer jumping to each row's root; a cycle gets cut at its first row and the jump redone
+    while True:
+        pointer = np.where(localParents >= 0, localParents, np.arange(m))
+        depth = (localParents >= 0).astype(np.int64)
+        for _ in range(max(1, m).bit_length() + 1):
+            following = pointer[pointer]
+            if np.array_equal(following, pointer):
+                break
+            depth += depth[pointer]
+            pointer = following
+        stuck = np.flatnonzero(localParents[pointer] >= 0)
+        if len(stuck) == 0:
+            break
+        localParents[stuck[0]] = -1
+
+    linked = localParents >= 0
+    children = np.bincount(localParents[linked], minlength=m)
+    groups, chains = [], []
+    for root in np.flatnonzero(~linked):
+        members = np.flatnonzero(pointer == root)
+        chain = children[members].max() <= 1
+        if chain:
+            members = members[np.argsort(depth[members], kind="stable")]
+        groups.append(rows[members])
+        chains.append(bool(chain))
+    return groups, chains
+
+
+def classify(positions, radii, chain):
+    """Return the encoding of one soma group from its positions and radii (in chain order if chain)."""
+    k = len(positions)
+    if k == 1:
+        return SINGLE_POINT
+    if k == 3 and _threePointCentre(positions, radii) is not None:
+        return THREE_POINT
+    if not chain:
+        return CLOUD
+    if k >= 3:
+        #an outline spans an area wider than its samples are thick; a stack of cylinders does not
+        spread = np.linalg.svd(positions - positions.mean(axis=0), compute_uv=False)
+        if spread[1] / np.sqrt(k) > np.median(radii):
+            return CONTOUR
+    return CYLINDERS
+
+
+def reconstruct(morph, rows, points=None, parentRows=None, segments=SEGMENTS):
+    """Return a Soma for every connected group of the soma rows.
+
+    points overrides morph.points (e.g. positions already converted to C4D space);
+    parentRows is the parent row of every sample (topology.Tree.parentRows), looked up
+    from morph when not given.
+    """
+    if points is None:
+        points = morph.points
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return []
+    if parentRows is None:
+        parentRows = morph.rowsOf(morph.parents)
+    groups, chains = _groups(parentRows, rows)
+
+    somas = []
+    for group, chain in zip(groups, chains):
+        positions = points[group]
+        radii = morph.radii[group]
+        encoding = classify(positions, radii, chain)
+        if encoding == SINGLE_POINT:
+            mesh = sphereMesh(positions[0], radii[0], segments) if radii[0] > 0 else _empty()
+        elif encoding == THREE_POINT:
+            centre = _threePointCentre(positions, radii)
+            mesh = sphereMesh(positions[centre], radii[centre], segments)
+        elif encoding == CONTOUR:
+            mesh = contourMesh(positions, segments)
+        elif encoding == CYLINDERS:
+            mesh = cylinderMesh(positions, radii, segments)
+        else:
+            mesh = cloudMesh(positions, radii, segments)
+        somas.append(Soma(encoding, group, mesh))
+    return somas
+
+
+def somaMesh(somas):
+    """Join the meshes of somas (from reconstruct) into one Mesh; polygon sections number the groups."""
+    meshes = []
+    for i, soma in enumerate(somas):
+        meshes.append(Mesh(soma.mesh.vertices, soma.mesh.polygons, np.full(len(soma.mesh.polygons), i, dtype=np.int64)))
+    return joinMeshes(meshes)
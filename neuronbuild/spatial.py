@@ -0,0 +1,272 @@
+"""
+Spatial index over the segments of a morphology, for cropping an import to a region.
+
+Every segment (two consecutive samples of a section path, see topology.Sections.paths)
+is a capsule: the line between the samples, thickened by the larger of their radii.
+SegmentIndex sorts the capsules along a Morton (Z-order) curve, groups them into leaves
+of LEAF_SIZE, and stacks axis-aligned bounding boxes over the leaves in a complete binary
+tree stored level by level:
+
+    levels[0]   one box, the root
+    levels[i]   boxes of level i; node j has children 2j and 2j + 1 in levels[i + 1]
+    levels[-1]  one box per leaf
+
+A query walks the tree one level at a time for all surviving nodes at once, then tests
+the capsules of the leaves it reached. Regions implement two tests:
+
+    overlaps(lo, hi)          may the region intersect each box? (conservative)
+    capsules(a, b, radii)     does the region intersect each capsule?
+
+Box, Sphere and Frustum (a convex set of planes, e.g. a camera's view) are provided;
+regionText and parseRegion turn them into text and back, for storing with a scene.
+Capsule tests may keep a capsule that only touches the region's corners (Box tests the
+capsule's bounding box, Frustum tests plane by plane), never drop one that intersects it.
+"""
+
+import numpy as np
+
+#segments per leaf
+LEAF_SIZE = 16
+
+#Morton grid resolution per axis, in bits
+MORTON_BITS = 10
+
+
+class Box(object):
+    """The axis-aligned box from lo to hi (each a 3-sequence)."""
+
+    def __init__(self, lo, hi):
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+
+    def __repr__(self):
+        return "Box(%s, %s)" % (self.lo.tolist(), self.hi.tolist())
+
+    def overlaps(self, lo, hi):
+        return np.all((lo <= self.hi) & (hi >= self.lo), axis=1)
+
+    def capsules(self, a, b, radii):
+        r = radii[:, None]
+        return self.overlaps(np.minimum(a, b) - r, np.maximum(a, b) + r)
+
+
+class Sphere(object):
+    """The ball of radius around centre."""
+
+    def __init__(self, centre, radius):
+        self.centre = np.asarray(centre, dtype=np.float64)
+        self.radius = float(radius)
+
+    def __repr__(self):
+        return "Sphere(%s, %g)" % (self.centre.tolist(), self.radius)
+
+    def overlaps(self, lo, hi):
+        nearest = np.clip(self.centre, lo, hi)
+        return np.einsum("ij,ij->i", nearest - self.centre, nearest - self.centre) <= self.radius ** 2
+
+    def capsules(self, a, b, radii):
+        #distance from the centre to the nearest point of each segment
+        d = b - a
+        length2 = np.einsum("ij,ij->i", d, d)
+        t = np.einsum("ij,ij->i", self.centre - a, d)
+        t = np.clip(np.divide(t, length2, out=np.zeros_like(t), where=length2 > 0), 0.0, 1.0)
+        nearest = a + t[:, None] * d
+        reach = self.radius + radii
+        return np.einsum("ij,ij->i", nearest - self.centre, nearest - self.centre) <= reach ** 2
+
+
+class Frustum(object):
+    """The convex region inside every plane: planes is (k, 4) rows (nx, ny, nz, d) with
+    n . x + d >= 0 inside (normals pointing in, not necessarily unit length)."""
+
+    def __init__(self, planes):
+        planes = np.asarray(planes, dtype=np.float64).reshape(-1, 4)
+        #unit normals, so the plane distances compare with radii
+        self.planes = planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+    def __repr__(self):
+        return "Frustum(%d planes)" % len(self.planes)
+
+    @classmethod
+    def perspective(cls, position, right, up, forward, fovX, fovY, near=0.0, far=None):
+        """The view of a perspective camera at position looking along forward, with unit axes
+        right, up, forward, full horizontal and vertical fields of view in radians, and
+        optional clipping distances along forward."""
+        position, right, up, forward = [np.asarray(v, dtype=np.float64) for v in (position, right, up, forward)]
+        cx, sx = np.cos(fovX / 2.0), np.sin(fovX / 2.0)
+        cy, sy = np.cos(fovY / 2.0), np.sin(fovY / 2.0)
+        normals = [cx * right + sx * forward, -cx * right + sx * forward,
+                   cy * up + sy * forward, -cy * up + sy * forward, forward]
+        distances = [0.0, 0.0, 0.0, 0.0, near]
+        if far is not None:
+            normals.append(-forward)
+            distances.append(-far)
+        planes = [np.append(n, -np.dot(n, position) - dist) for n, dist in zip(normals, distances)]
+        return cls(planes)
+
+    def overlaps(self, lo, hi):
+        inside = np.ones(len(lo), dtype=bool)
+        for nx, ny, nz, d in self.planes.tolist():
+            #the box corner furthest along the normal
+            x = np.where(nx >= 0, hi[:, 0], lo[:, 0])
+            y = np.where(ny >= 0, hi[:, 1], lo[:, 1])
+            z = np.where(nz >= 0, hi[:, 2], lo[:, 2])
+            inside &= nx * x + ny * y + nz * z + d >= 0
+        return inside
+
+    def capsules(self, a, b, radii):
+        inside = np.ones(len(a), dtype=bool)
+        for plane in self.planes:
+            n, d = plane[:3], plane[3]
+            inside &= np.maximum(a @ n, b @ n) + d >= -radii
+        return inside
+
+
+def regionText(region):
+    """Return a Box, Sphere or Frustum as text (kind and parameters), e.g. to store with a scene; see parseRegion."""
+    if isinstance(region, Box):
+        values = np.concatenate((region.lo, region.hi))
+    elif isinstance(region, Sphere):
+        values = np.append(region.centre, region.radius)
+    elif isinstance(region, Frustum):
+        values = region.planes.ravel()
+    else:
+        raise ValueError("not a crop region: %r" % (region,))
+    return " ".join([type(region).__name__] + [repr(v) for v in values.tolist()])
+
+
+def parseRegion(text):
+    """Return the region regionText made text of."""
+    words = text.split()
+    values = np.array([float(v) for v in words[1:]])
+    if words and words[0] == "Box" and len(values) == 6:
+        return Box(values[:3], values[3:])
+    if words and words[0] == "Sphere" and len(values) == 4:
+        return Sphere(values[:3], values[3])
+    if words and words[0] == "Frustum" and len(values) and len(values) % 4 == 0:
+        return Frustum(values)
+    raise ValueError("not a crop region: %r" % text)
+
+
+def _spread(v):
+    """Spread the low MORTON_BITS bits of v so two zero bits follow every bit."""
+    v = v.astype(np.uint64)
+    result = np.zeros_like(v)
+    for bit in range(MORTON_BITS):
+        result |= ((v >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit)
+    return result
+
+
+def mortonOrder(centres):
+    """Return the permutation sorting centres (n, 3) along a Z-order curve."""
+    if len(centres) == 0:
+        return np.zeros(0, dtype=np.int64)
+    lo = centres.min(axis=0)
+    extent = np.maximum(centres.max(axis=0) - lo, 1e-12)
+    cells = ((centres - lo) / extent * ((1 << MORTON_BITS) - 1)).astype(np.int64)
+    codes = _spread(cells[:, 0]) | (_spread(cells[:, 1]) << np.uint64(1)) | (_spread(cells[:, 2]) << np.uint64(2))
+    return np.argsort(codes, kind="stable")
+
+
+class SegmentIndex(object):
+    """A bounding-volume hierarchy over segment capsules; see the module docstring.
+
+    a, b      float64 (n, 3)  segment end points, in Morton order
+    radii     float64 (n,)    capsule radius of each segment
+    segments  int64   (n,)    original segment number of each stored segment
+    sections  int64   (n,)    section of each stored segment
+    levels    list of (lo, hi) box arrays, root first, leaves last
+    """
+
+    def __init__(self, a, b, radii, sections, leafSize=LEAF_SIZE):
+        order = mortonOrder((a + b) / 2.0)
+        self.a = a[order]
+        self.b = b[order]
+        self.radii = radii[order]
+        self.segments = order
+        self.sections = sections[order]
+        self.sectionCount = int(sections.max()) + 1 if len(sections) else 0
+        self.leafSize = leafSize
+
+        r = self.radii[:, None]
+        lo = np.minimum(self.a, self.b) - r
+        hi = np.maximum(self.a, self.b) + r
+        leaves = -(-len(order) // leafSize)
+        #pad the last leaf with copies of its last capsule so every leaf is full
+        pad = leaves * leafSize - len(order)
+        if pad:
+            lo = np.concatenate((lo, np.repeat(lo[-1:], pad, axis=0)))
+            hi = np.concatenate((hi, np.repeat(hi[-1:], pad, axis=0)))
+        lo = lo.reshape(leaves, leafSize, 3).min(axis=1)
+        hi = hi.reshape(leaves, leafSize, 3).max(axis=1)
+        levels = [(lo, hi)]
+        while len(lo) > 1:
+            if len(lo) % 2:
+                lo = np.concatenate((lo, lo[-1:]))
+                hi = np.concatenate((hi, hi[-1:]))
+            lo = np.minimum(lo[0::2], lo[1::2])
+            hi = np.maximum(hi[0::2], hi[1::2])
+            levels.append((lo, hi))
+        self.levels = levels[::-1]
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __repr__(self):
+        return "SegmentIndex(%d segments, %d levels)" % (len(self), len(self.levels))
+
+    def bounds(self):
+        """Return (lo, hi) of everything indexed."""
+        lo, hi = self.levels[0]
+        return lo[0], hi[0]
+
+    def _candidates(self, region):
+        """Stored positions of the capsules in the leaves the region reaches."""
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64)
+        nodes = np.zeros(1, dtype=np.int64)
+        for depth, (lo, hi) in enumerate(self.levels):
+            nodes = nodes[region.overlaps(lo[nodes], hi[nodes])]
+            if depth + 1 < len(self.levels):
+                below = len(self.levels[depth + 1][0])
+                nodes = np.concatenate((2 * nodes, 2 * nodes + 1))
+                nodes = np.sort(nodes[nodes < below])
+        starts = nodes * self.leafSize
+        positions = (starts[:, None] + np.arange(self.leafSize)[None, :]).ravel()
+        return positions[positions < len(self)]
+
+    def query(self, region):
+        """Return the sorted segment numbers whose capsules intersect region."""
+        positions = self._candidates(region)
+        hit = region.capsules(self.a[positions], self.b[positions], self.radii[positions])
+        return np.sort(self.segments[positions[hit]])
+
+    def sectionMask(self, region):
+        """Return a bool array over the sections: True where any segment intersects region."""
+        positions = self._candidates(region)
+        hit = region.capsules(self.a[positions], self.b[positions], self.radii[positions])
+        mask = np.zeros(self.sectionCount, dtype=bool)
+        mask[self.sections[positions[hit]]] = True
+        return mask
+
+
+def segmentIndex(morph, sections, points=None, leafSize=LEAF_SIZE):
+    """Build the SegmentIndex over every segment of every section path.
+
+    points overrides morph.points (e.g. positions already converted to C4D space).
+    Segments are numbered in path order, as in instance.segmentInstances before it
+    drops zero-length segments.
+    """
+    if points is None:
+        points = morph.points
+    rows, offsets = sections.paths()
+    counts = np.diff(offsets)
+    notLast = np.ones(len(rows), dtype=bool)
+    notLast[offsets[1:] - 1] = False
+    starts = np.flatnonzero(notLast)
+    a, b = rows[starts], rows[starts + 1]
+    segmentSections = np.repeat(np.arange(len(counts)), np.maximum(counts - 1, 0))
+    index = SegmentIndex(points[a], points[b], np.maximum(morph.radii[a], morph.radii[b]), segmentSections,
+                         leafSize)
+    index.sectionCount = len(sections)
+    return index
@@ -0,0 +1,87 @@
+"""
+Extents and radius statistics of a morphology, measured once from the parsed columns.
+
+The importer used to read the size of a neuron back from the scene (GetRad on the
+joined single spline), which only worked when that spline was built. measure() gets the
+same numbers, and a few more, straight from the arrays, so every build mode has them.
+"""
+
+import numpy as np
+
+#the default voxel size is the largest extent divided by this (the Volume Builder rule)
+VOXEL_DIVISIONS = 200
+
+
+class Stats(object):
+    """Size and radius figures for one morphology.
+
+    lo, hi          float64 (3,)  bounding box of the samples with their radii
+    pointsLo/Hi     float64 (3,)  bounding box of the sample centres alone
+    samples         number of samples
+    minRadius, maxRadius, meanRadius, medianRadius
+    zeroRadii       number of samples with a radius of zero or less
+    """
+
+    def __init__(self, lo, hi, pointsLo, pointsHi, samples, minRadius, maxRadius, meanRadius, medianRadius,
+                 zeroRadii):
+        self.lo = lo
+        self.hi = hi
+        self.pointsLo = pointsLo
+        self.pointsHi = pointsHi
+        self.samples = samples
+        self.minRadius = minRadius
+        self.maxRadius = maxRadius
+        self.meanRadius = meanRadius
+        self.medianRadius = medianRadius
+        self.zeroRadii = zeroRadii
+
+    def __repr__(self):
+        return "Stats(%d samples, size %s, radii %g..%g)" % (self.samples, self.size().tolist(), self.minRadius,
+                                                             self.maxRadius)
+
+    def size(self):
+        """Return the extent along each axis, radii included."""
+        return self.hi - self.lo
+
+    def centre(self):
+        return (self.lo + self.hi) / 2.0
+
+    def largest(self):
+        """Return the largest extent, radii included."""
+        return float(self.size().max())
+
+    def voxelSize(self, divisions=VOXEL_DIVISIONS):
+        """Return the recommended voxel size: the largest extent over divisions."""
+        if self.samples == 0:
+            return 1.0
+        return max(self.largest() / divisions, 1e-6)
+
+    def format(self):
+        """Return a short human-readable summary."""
+        return "%d samples, %.1f x %.1f x %.1f, radii %.3g to %.3g (median %.3g), voxel size %.3g" % (
+            (self.samples,) + tuple(self.size().tolist()) + (self.minRadius, self.maxRadius, self.medianRadius,
+                                                             self.voxelSize()))
+
+
+def measure(morph, points=None, flipZ=False):
+    """Return the Stats of morph. points overrides morph.points (e.g. positions in C4D space);
+    flipZ gives the figures for the positions with z negated (C4D's left-handed space)
+    without making that copy of them."""
+    if points is None:
+        points = morph.points
+    radii = morph.radii
+    n = len(radii)
+    if n == 0:
+        zero = np.zeros(3)
+        return Stats(zero, zero, zero, zero, 0, 0.0, 0.0, 0.0, 0.0, 0)
+    #per axis, so no (n, 3) temporaries are made
+    lo, hi, pointsLo, pointsHi = np.empty(3), np.empty(3), np.empty(3), np.empty(3)
+    for axis in range(3):
+        column = points[:, axis]
+        pointsLo[axis], pointsHi[axis] = column.min(), column.max()
+        lo[axis], hi[axis] = (column - radii).min(), (column + radii).max()
+    if flipZ:
+        lo[2], hi[2] = -hi[2], -lo[2]
+        pointsLo[2], pointsHi[2] = -pointsHi[2], -pointsLo[2]
+    return Stats(lo, hi, pointsLo, pointsHi, n, float(radii.min()), float(radii.max()),
+                 float(radii.mean()), float(np.median(radii)), int(np.count_nonzero(radii <= 0)))
@@ -0,0 +1,264 @@
+"""
+Columnar SWC loader.
+
+An SWC file is parsed exactly once into typed NumPy columns held by a Morphology.
+The builders read these arrays directly; no per-line Python objects are kept.
+
+In-memory layout (n = number of samples; row i is the i-th data line of the file):
+
+    ids      int64    (n,)     sample identifier                (SWC column 1)
+    types    int32    (n,)     structure type: 1 soma, 2 axon,  (SWC column 2)
+                               3 basal, 4 apical, 5 custom,
+                               6 unspecified, 7 glial process
+    points   float64  (n, 3)   x, y, z in µm, C-contiguous      (SWC columns 3-5)
+    radii    float64  (n,)     radius in µm                     (SWC column 6)
+    parents  int64    (n,)     parent identifier, -1 for roots  (SWC column 7)
+
+Rows stay in file order. Ids are not assumed to be sorted or contiguous; use
+Morphology.rowsOf() to turn ids (e.g. the parents column) into row indices.
+
+Files are read by SWCReader, which tokenizes fixed-size byte chunks straight into
+these columns. They are allocated once the first chunk is parsed, for the rows the whole
+file holds at that chunk's bytes per row (plus a small margin), so peak memory is about
+the columns plus one chunk. Iterating a reader yields each chunk's rows as
+soon as they are parsed, for callers that want to start on per-sample work early.
+"""
+
+import io, os, warnings
+
+import numpy as np
+
+SOMA = 1
+AXON = 2
+BASAL_DENDRITE = 3
+APICAL_DENDRITE = 4
+CUSTOM = 5
+UNSPECIFIED = 6
+GLIAL_PROCESS = 7
+
+#names used for the generated objects, keyed by SWC structure type
+TYPE_NAMES = {
+    SOMA: "Soma",
+    AXON: "Axon",
+    BASAL_DENDRITE: "Basal Dendrite",
+    APICAL_DENDRITE: "Apical Dendrite",
+    CUSTOM: "Custom",
+    UNSPECIFIED: "Unspecified Neurites",
+    GLIAL_PROCESS: "Glial Process",
+}
+
+
+class Morphology(object):
+    """Typed column arrays for one SWC reconstruction (see the module docstring for the layout)."""
+
+    def __init__(self, ids, types, points, radii, parents, name=""):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.types = np.ascontiguousarray(types, dtype=np.int32)
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.ascontiguousarray(radii, dtype=np.float64)
+        self.parents = np.ascontiguousarray(parents, dtype=np.int64)
+        self.name = name
+        self._lookup = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return "Morphology(%r, %d samples)" % (self.name, len(self))
+
+    def rowsOf(self, ids):
+        """Return the row index for each id in ids, or -1 where the id is not in the file."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self._lookup is None:
+            self._lookup = self._buildLookup()
+        lookup = self._lookup
+        if isinstance(lookup, tuple):
+            #sparse ids: binary search in the sorted id column
+            order, sortedIds = lookup
+            pos = np.searchsorted(sortedIds, ids)
+            pos = np.minimum(pos, len(sortedIds) - 1)
+            found = (ids >= 0) & (len(sortedIds) > 0) & (sortedIds[pos] == ids)
+            return np.where(found, order[pos], -1)
+        inRange = (ids >= 0) & (ids < len(lookup))
+        return np.where(inRange, lookup[np.where(inRange, ids, 0)], -1)
+
+    def _buildLookup(self):
+        """Build an id -> row table; a dense array when ids are compact, else a sorted index."""
+        n = len(self.ids)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        low, high = self.ids.min(), self.ids.max()
+        if low >= 0 and high <= 4 * n + 1024:
+            lookup = np.full(high + 1, -1, dtype=np.int64)
+            #reversed so that the first occurrence of a duplicated id wins
+            lookup[self.ids[::-1]] = np.arange(n - 1, -1, -1, dtype=np.int64)
+            return lookup
+        order = np.argsort(self.ids, kind="stable")
+        return order, self.ids[order]
+
+
+#bytes tokenized per step by SWCReader
+CHUNK_BYTES = 1 << 22
+
+#the column buffers are sized for this multiple of the rows extrapolated from the bytes parsed so far
+ESTIMATE_MARGIN = 1.05
+
+#after the last chunk, the buffers are copied to their exact size only when more than this share is unused
+TRIM_SHARE = 1.0 / 8
+
+
+class SWCReader(object):
+    """Incremental SWC parser.
+
+    Iterating yields (start, stop): the rows parsed from each chunk of the file. At any
+    point, morphology() returns the rows read so far as a Morphology whose columns are
+    views of the reader's buffers (a snapshot: later chunks do not show up in it). The
+    buffers are sized from the bytes per row of the chunks parsed so far; once the whole
+    file is read, they are trimmed to the rows actually parsed if the estimate was far off.
+
+        reader = SWCReader(path)
+        for start, stop in reader:
+            ...                      #reader.points[start:stop] etc. are final
+        morph = reader.morphology()
+    """
+
+    def __init__(self, path, chunkBytes=CHUNK_BYTES):
+        self.path = path
+        self.chunkBytes = chunkBytes
+        self.count = 0
+        self.lines = 0
+        self.size = os.path.getsize(path)
+        self.parsedBytes = 0
+        self._allocate(0)
+
+    def _allocate(self, capacity):
+        """(Re)allocate the column buffers with room for capacity rows, keeping the rows read so far."""
+        n = self.count
+        columns = [("ids", np.int64, ()), ("types", np.int32, ()), ("points", np.float64, (3,)),
+                   ("radii", np.float64, ()), ("parents", np.int64, ())]
+        for name, dtype, shape in columns:
+            buffer = np.empty((capacity,) + shape, dtype=dtype)
+            if n:
+                buffer[:n] = getattr(self, "_" + name)[:n]
+            setattr(self, "_" + name, buffer)
+        self.capacity = capacity
+
+    @property
+    def ids(self):
+        return self._ids[:self.count]
+
+    @property
+    def types(self):
+        return self._types[:self.count]
+
+    @property
+    def points(self):
+        return self._points[:self.count]
+
+    @property
+    def radii(self):
+        return self._radii[:self.count]
+
+    @property
+    def parents(self):
+        return self._parents[:self.count]
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            carry = b""
+            while True:
+                block = f.read(self.chunkBytes)
+                if not block:
+                    break
+                #parse whole lines only; the partial last line is carried into the next chunk
+                end = block.rfind(b"\n")
+                if end < 0:
+                    carry += block
+                    continue
+                data = carry + block[:end + 1]
+                carry = block[end + 1:]
+                rows = self._parse(data)
+                if rows is not None:
+                    yield rows
+            if carry.strip():
+                rows = self._parse(carry)
+                if rows is not None:
+                    yield rows
+        #the buffers were sized from an estimate; give back the unused rows if there are many, since they
+        #would otherwise stay alive with every Morphology (and cache entry) made from them. A copy costs
+        #another set of columns at the peak, so a close estimate is kept as it is
+        if self.capacity - self.count > self.capacity * TRIM_SHARE:
+            self._allocate(self.count)
+
+    def _parse(self, data):
+        """Tokenize whole lines into the buffers; returns their (start, stop) rows, or None if there were none."""
+        firstLine = self.lines + 1
+        self.lines += data.count(b"\n")
+        self.parsedBytes += len(data)
+        try:
+            with warnings.catch_warnings():
+                #a chunk of nothing but comments is not an error
+                warnings.simplefilter("ignore", UserWarning)
+                #latin-1 maps every byte, so odd characters in neuromorpho header comments never fail the decode
+                values = np.loadtxt(io.BytesIO(data), comments="#", usecols=range(7), ndmin=2,
+                                    dtype=np.float64, encoding="latin-1").reshape(-1, 7)
+        except ValueError as e:
+            raise ValueError("%s: %s (in the lines from %d)" % (self.path, e, firstLine))
+        m = len(values)
+        if m == 0:
+            return None
+        start, stop = self.count, self.count + m
+        if stop > self.capacity:
+            #the rows the whole file holds at the bytes per row seen so far
+            estimate = int(stop * max(self.size, self.parsedBytes) / self.parsedBytes * ESTIMATE_MARGIN) + 16
+            self._allocate(max(stop, estimate))
+        self._ids[start:stop] = values[:, 0]
+        self._types[start:stop] = values[:, 1]
+        self._points[start:stop] = values[:, 2:5]
+        self._radii[start:stop] = values[:, 5]
+        self._parents[start:stop] = values[:, 6]
+        self.count = stop
+        return start, stop
+
+    def morphology(self, name=None):
+        """Return the rows read so far as a Morphology (views, no copy)."""
+        if name is None:
+            name = swcName(self.path)
+        return Morphology(self.ids, self.types, self.points, self.radii, self.parents, name)
+
+
+def readSWC(path, name=None, chunkBytes=CHUNK_BYTES):
+    """Parse an SWC file into a Morphology; comment lines (#) and blank lines are skipped."""
+    reader = SWCReader(path, chunkBytes)
+    for _ in reader:
+        pass
+    return reader.morphology(name)
+
+
+def fromArray(data, name=""):
+    """Build a Morphology from an (n, 7) array holding the seven SWC columns."""
+    data = np.asarray(data, dtype=np.float64).reshape(-1, 7)
+    return Morphology(data[:, 0], data[:, 1], data[:, 2:5], data[:, 5], data[:, 6], name)
+
+
+def dataLines(path):
+    """Return the 1-based file line of every data row of an SWC file (int64, one per Morphology row).
+
+    The parse does not keep line numbers; this finds them again in one vectorized pass over
+    the bytes, for error messages. A data line is one whose first non-blank character is not #.
+    """
+    with open(path, "rb") as f:
+        data = np.frombuffer(f.read(), dtype=np.uint8)
+    newline = data == ord("\n")
+    lineOf = np.cumsum(newline) - newline
+    blank = newline | (data == ord(" ")) | (data == ord("\t")) | (data == ord("\r"))
+    text = np.flatnonzero(~blank)
+    #the first non-blank character of every line that has one (text is in file order)
+    textLines = lineOf[text]
+    first = np.flatnonzero(np.r_[True, textLines[1:] != textLines[:-1]]) if len(text) else text
+    return textLines[first][data[text[first]] != ord("#")] + 1
+
+
+def swcName(path):
+    """Return the file name with its last extension removed, as used for object names."""
+    return os.path.splitext(os.path.basename(str(path)))[0]
@@ -0,0 +1,271 @@
+"""
+Tree topology and unbranched-section decomposition for a Morphology.
+
+Everything here works on row indices (see swc.py) and makes no assumption about row
+order or id numbering: files may be unsorted, have gapped ids or several roots.
+All passes are vectorized and linear in the number of samples, apart from the
+pointer-jumping step, which needs log2(longest section) sweeps.
+
+A section is a maximal unbranched run of samples of one structure type. It starts at a
+root, just after a branch point, or where the structure type changes (e.g. a dendrite
+leaving the soma), and ends at a tip or at a branch point. The sample a section hangs
+from (its attachment) is kept separately, so a section's drawn path is
+[attachment] + rows, the same shape of spline splineMake has always built.
+
+renumber() puts the samples in depth-first order (ids 1..n). Every section is then a
+contiguous run of rows, so a section's columns are slices of the Morphology's columns
+(Sections.runs, Sections.pathValues) instead of gathered copies.
+"""
+
+import numpy as np
+
+from . import swc
+
+
+class Tree(object):
+    """Parent/child links between rows of a morphology.
+
+    parentRows   int64 (n,)     row of each sample's parent, -1 for roots and missing parents
+    childCounts  int64 (n,)     number of children of each row
+    childOffsets int64 (n + 1,) children of row i are children[childOffsets[i]:childOffsets[i + 1]]
+    children     int64 (n - roots,)
+    """
+
+    def __init__(self, morph):
+        n = len(morph)
+        parentRows = morph.rowsOf(morph.parents)
+        #a sample listed as its own parent is treated as a root
+        parentRows[parentRows == np.arange(n)] = -1
+        self.parentRows = parentRows
+
+        linked = np.flatnonzero(parentRows >= 0)
+        self.childCounts = np.bincount(parentRows[linked], minlength=n).astype(np.int64)
+        self.childOffsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(self.childCounts, out=self.childOffsets[1:])
+        #stable, so children keep file order under their parent
+        self.children = linked[np.argsort(parentRows[linked], kind="stable")]
+
+    def __len__(self):
+        return len(self.parentRows)
+
+    def childrenOf(self, row):
+        """Return the child rows of row as a view."""
+        return self.children[self.childOffsets[row]:self.childOffsets[row + 1]]
+
+    def roots(self):
+        """Return the rows that have no parent in the file."""
+        return np.flatnonzero(self.parentRows < 0)
+
+
+class Sections(object):
+    """Unbranched sections stored flat, CSR style.
+
+    rows     int64 (m,)      rows of all sections, each section ordered from its start to its tip
+    offsets  int64 (k + 1,)  section s owns rows[offsets[s]:offsets[s + 1]]
+    parents  int64 (k,)      attachment row of each section, -1 when the section starts at a root
+    types    int32 (k,)      structure type of each section
+    """
+
+    def __init__(self, rows, offsets, parents, types):
+        self.rows = rows
+        self.offsets = offsets
+        self.parents = parents
+        self.types = types
+        self._runs = False
+
+    def __len__(self):
+        return len(self.parents)
+
+    def __repr__(self):
+        return "Sections(%d sections, %d samples)" % (len(self), len(self.rows))
+
+    def counts(self):
+        """Return the number of samples in each section (attachment not included)."""
+        return np.diff(self.offsets)
+
+    def sectionRows(self, s):
+        """Return the rows of section s as a view."""
+        return self.rows[self.offsets[s]:self.offsets[s + 1]]
+
+    def pathRows(self, s):
+        """Return the rows of section s preceded by its attachment row, if it has one."""
+        rows = self.sectionRows(s)
+        if self.parents[s] < 0:
+            return rows
+        return np.concatenate(([self.parents[s]], rows))
+
+    def runs(self):
+        """Return the first row of every section when each section is a contiguous run of rows
+        (as after renumber), else None. Section s then owns rows runs()[s]:runs()[s] + counts()[s]."""
+        if self._runs is False:
+            counts = self.counts()
+            starts = self.rows[self.offsets[:-1]] if len(self.rows) else np.zeros(len(self), dtype=np.int64)
+            expected = np.arange(len(self.rows)) + np.repeat(starts - self.offsets[:-1], counts)
+            self._runs = starts if np.array_equal(self.rows, expected) else None
+        return self._runs
+
+    def pathValues(self, s, column):
+        """Return column[pathRows(s)]: a view of column when the path is a contiguous run of rows (the
+        section follows its attachment directly, or has none), else a copy."""
+        runs = self.runs()
+        if runs is None:
+            return column[self.pathRows(s)]
+        start = runs[s]
+        end = start + self.offsets[s + 1] - self.offsets[s]
+        attachment = self.parents[s]
+        if attachment < 0:
+            return column[start:end]
+        if attachment == start - 1:
+            return column[start - 1:end]
+        return np.concatenate((column[attachment:attachment + 1], column[start:end]))
+
+    def subset(self, sectionMask):
+        """Return the Sections selected by sectionMask (bool (k,) or indices), in their original order.
+        Rows and attachment rows still refer to the same Morphology."""
+        keep = np.zeros(len(self), dtype=bool)
+        keep[sectionMask] = True
+        counts = self.counts()
+        offsets = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+        np.cumsum(counts[keep], out=offsets[1:])
+        return Sections(self.rows[np.repeat(keep, counts)], offsets, self.parents[keep], self.types[keep])
+
+    def paths(self):
+        """Return every section path laid out flat, as (rows, offsets) with the attachment rows included."""
+        counts = self.counts()
+        attached = self.parents >= 0
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts + attached, out=offsets[1:])
+        rows = np.empty(offsets[-1], dtype=np.int64)
+        #scatter the section rows after the attachment slot, then fill the attachment slots
+        shift = np.repeat(offsets[:-1] + attached - self.offsets[:-1], counts)
+        rows[np.arange(len(self.rows)) + shift] = self.rows
+        rows[offsets[:-1][attached]] = self.parents[attached]
+        return rows, offsets
+
+
+def buildTree(morph):
+    """Return the Tree (parent rows and child lists) of morph."""
+    return Tree(morph)
+
+
+def buildSections(morph, tree=None, exclude=(swc.SOMA,)):
+    """Decompose morph into unbranched Sections, leaving out samples whose type is in exclude.
+
+    Sections are numbered in the file order of their first sample. Raises ValueError when
+    the parent links contain a cycle that never reaches a root or branch point.
+    """
+    if tree is None:
+        tree = buildTree(morph)
+    n = len(morph)
+    types = morph.types
+    parentRows = tree.parentRows
+    included = ~np.isin(types, np.asarray(exclude, dtype=types.dtype)) if len(exclude) else np.ones(n, bool)
+
+    #a sample continues its parent's section when the parent is a non-branching sample of the same type
+    safeParents = np.where(parentRows >= 0, parentRows, 0)
+    continues = ((parentRows >= 0) & included & included[safeParents]
+                 & (types[safeParents] == types) & (tree.childCounts[safeParents] == 1))
+    isHead = included & ~continues
+
+    #pointer jumping: every sample finds its section head and its distance from it
+    rowIndex = np.arange(n, dtype=np.int64)
+    pointer = np.where(continues, parentRows, rowIndex)
+    dist = continues.astype(np.int64)
+    for _ in range(max(1, n).bit_length() + 1):
+        following = pointer[pointer]
+        if np.array_equal(following, pointer):
+            break
+        dist += dist[pointer]
+        pointer = following
+    stuck = included & ~isHead[pointer]
+    if stuck.any():
+        row = int(np.flatnonzero(stuck)[0])
+        raise ValueError("parent links form a cycle (sample id %d)" % morph.ids[row])
+
+    #number the sections by head and scatter every sample to its slot in one pass
+    heads = np.flatnonzero(isHead)
+    sectionOfHead = np.cumsum(isHead) - 1
+    members = np.flatnonzero(included)
+    sectionOf = sectionOfHead[pointer[members]]
+    counts = np.bincount(sectionOf, minlength=len(heads))
+    offsets = np.zeros(len(heads) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    rows = np.empty(len(members), dtype=np.int64)
+    rows[offsets[sectionOf] + dist[members]] = members
+
+    return Sections(rows, offsets, parentRows[heads].copy(), types[heads].copy())
+
+
+
+def _walk(morph, tree):
+    """Walk morph depth-first; returns (sections, order, rows, offsets).
+
+    sections are the Sections of morph with nothing excluded (so every sample is in one),
+    order is the order the walk visits them in, and rows are the rows of morph in depth-first
+    preorder: roots in file order, and children in file order under their parent, each
+    child's whole subtree before the next child. Within a section the samples already follow
+    each other, so rows is the sections' rows laid out in visiting order, section order[i]
+    taking rows[offsets[i]:offsets[i + 1]]. The walk goes over whole sections with an
+    explicit stack rather than recursion, since neurites can be thousands of branch points deep.
+    """
+    sections = buildSections(morph, tree, exclude=())
+    k = len(sections)
+
+    #the section a section hangs from: its attachment is always the last row of another section
+    sectionOfLast = np.full(len(morph), -1, dtype=np.int64)
+    sectionOfLast[sections.rows[sections.offsets[1:] - 1]] = np.arange(k)
+    parentSections = np.where(sections.parents >= 0, sectionOfLast[np.maximum(sections.parents, 0)], -1)
+    linked = np.flatnonzero(parentSections >= 0)
+    childOffsets = np.zeros(k + 1, dtype=np.int64)
+    np.cumsum(np.bincount(parentSections[linked], minlength=k), out=childOffsets[1:])
+    #sections are numbered in file order of their heads, so a stable sort keeps children in file order
+    children = linked[np.argsort(parentSections[linked], kind="stable")]
+
+    #explicit stack over the CSR child lists, children pushed in reverse so the first is visited first
+    #(plain lists: per-section numpy scalar access would cost more than the walk itself)
+    reversedChildren = children[::-1].tolist()
+    linkedCount = len(reversedChildren)
+    childOffsets = childOffsets.tolist()
+    stack = np.flatnonzero(parentSections < 0)[::-1].tolist()
+    visit = []
+    while stack:
+        s = stack.pop()
+        visit.append(s)
+        first, last = childOffsets[s], childOffsets[s + 1]
+        if last > first:
+            stack.extend(reversedChildren[linkedCount - last:linkedCount - first])
+    order = np.array(visit, dtype=np.int64)
+
+    counts = sections.counts()[order]
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    rows = sections.rows[np.arange(len(sections.rows)) + np.repeat(sections.offsets[order] - offsets[:-1], counts)]
+    return sections, order, rows, offsets
+
+
+def renumber(morph, tree=None, exclude=(swc.SOMA,)):
+    """Return (Morphology, Sections) with the samples of morph in depth-first preorder (see
+    _walk) and renumbered 1..n.
+
+    The Sections are the ones buildSections(result, exclude=exclude) would return, taken
+    straight from the walk: every section is a contiguous run of rows (see Sections.runs).
+    """
+    if tree is None:
+        tree = buildTree(morph)
+    n = len(morph)
+    sections, order, rows, offsets = _walk(morph, tree)
+
+    newRows = np.empty(n, dtype=np.int64)
+    newRows[rows] = np.arange(n)
+    parentRows = tree.parentRows[rows]
+    parents = np.where(parentRows >= 0, newRows[np.maximum(parentRows, 0)] + 1, -1)
+    result = swc.Morphology(np.arange(1, n + 1), morph.types[rows], morph.points[rows], morph.radii[rows],
+                            parents, morph.name)
+
+    #the walked sections in their new rows, without the excluded types
+    attachments = sections.parents[order]
+    walked = Sections(np.arange(n), offsets, np.where(attachments >= 0, newRows[np.maximum(attachments, 0)], -1),
+                      sections.types[order])
+    if len(exclude):
+        return result, walked.subset(~np.isin(walked.types, np.asarray(exclude, dtype=walked.types.dtype)))
+    return result, walked
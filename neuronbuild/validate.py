@@ -0,0 +1,233 @@
+"""
+Validation and repair of a parsed morphology.
+
+validate() checks the columns of a Morphology for the problems that make a tracing build
+wrongly or not at all:
+
+    duplicate id     an id used by more than one sample (rowsOf resolves it to the first)
+    missing parent   a parent id that no sample has
+    self parent      a sample listed as its own parent
+    cycle            a sample whose parent links never reach a root
+    radius           a radius that is zero, negative or not a finite number
+    coordinates      a position that is not finite
+    order            a sample listed before its parent
+
+Every check is one or two array passes over the columns. Only the cycle check needs more
+(pointer jumping: log2(depth) passes), and it runs only when some sample comes before its
+parent, since parent links that always point back up the file cannot form a loop.
+
+repair() returns a Morphology with the problems fixed: missing and self parents become
+roots, each loop is cut once (its first sample in the file becomes a root; samples that
+merely hang from the loop keep their parents), samples whose position is not finite are
+dropped (their children become roots), bad radii are clamped to the smallest valid radius,
+the samples are sorted so parents come first, and ids are renumbered 1..n. Validation keeps row numbers; Validation.lines (see swc.dataLines) turns
+them into file lines for the report.
+"""
+
+import numpy as np
+
+from . import swc
+
+DUPLICATE_ID = "duplicate id"
+MISSING_PARENT = "missing parent"
+SELF_PARENT = "self parent"
+CYCLE = "cycle"
+RADIUS = "radius"
+COORDINATES = "coordinates"
+ORDER = "order"
+
+#problems repair() fixes that would otherwise build wrongly (ORDER alone builds fine)
+REPAIRABLE = (DUPLICATE_ID, MISSING_PARENT, SELF_PARENT, CYCLE, RADIUS, COORDINATES)
+
+#examples listed per kind of problem by Validation.format
+EXAMPLES = 5
+
+
+class Issue(object):
+    """One kind of problem and the rows it was found in."""
+
+    def __init__(self, kind, rows, message):
+        self.kind = kind
+        self.rows = rows
+        self.message = message
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return "Issue(%s, %d samples)" % (self.kind, len(self))
+
+    def describe(self, morph, row):
+        """Return the message for one row, filled in from morph's columns."""
+        return self.message % dict(id=morph.ids[row], parent=morph.parents[row], radius=morph.radii[row])
+
+
+class Validation(object):
+    """The issues found in a morphology.
+
+    issues      list of Issue, in the order of the checks
+    parentRows  int64 (n,) parent row of every sample, -1 for roots and missing parents
+    lines       int64 (n,) file line of every row (swc.dataLines), or None to report rows
+    """
+
+    def __init__(self, morph, issues, parentRows, lines=None):
+        self.morph = morph
+        self.issues = issues
+        self.parentRows = parentRows
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.issues)
+
+    def __repr__(self):
+        return "Validation(%s)" % (", ".join("%d %s" % (len(i), i.kind) for i in self.issues) or "no issues")
+
+    def get(self, kind):
+        """Return the Issue of the given kind, or None."""
+        for issue in self.issues:
+            if issue.kind == kind:
+                return issue
+        return None
+
+    def repairable(self):
+        """Return True when repair() would change how the morphology builds."""
+        return any(issue.kind in REPAIRABLE for issue in self.issues)
+
+    def serious(self):
+        """Return True when there is more wrong than the sample order, which every import fixes anyway by
+        renumbering (see topology.renumber)."""
+        return any(issue.kind != ORDER for issue in self.issues)
+
+    def nonFinite(self):
+        """Return the rows whose position or radius is not a finite number, which no builder can use."""
+        morph = self.morph
+        return np.flatnonzero(~(np.isfinite(morph.points).all(axis=1) & np.isfinite(morph.radii)))
+
+    def where(self, row):
+        if self.lines is not None and len(self.lines) == len(self.morph):
+            return "line %d" % self.lines[row]
+        return "row %d" % (row + 1)
+
+    def format(self, examples=EXAMPLES):
+        """Return the issues as text: a count per kind and the first few samples of each."""
+        out = []
+        for issue in self.issues:
+            out.append("%d samples: %s" % (len(issue), issue.kind))
+            for row in issue.rows[:examples].tolist():
+                out.append("  %s: %s" % (self.where(row), issue.describe(self.morph, row)))
+            if len(issue) > examples:
+                out.append("  ...")
+        return "\n".join(out)
+
+
+def _jump(parentRows):
+    """Pointer-jump every row towards its root; returns (top, depth), top being a root unless the row is in or
+    below a loop."""
+    n = len(parentRows)
+    pointer = np.where(parentRows >= 0, parentRows, np.arange(n))
+    depth = (parentRows >= 0).astype(np.int64)
+    for _ in range(max(1, n).bit_length() + 1):
+        following = pointer[pointer]
+        if np.array_equal(following, pointer):
+            break
+        depth += depth[pointer]
+        pointer = following
+    return pointer, depth
+
+
+def _loopStarts(parentRows, loopedRows):
+    """Return the first row in the file of every loop that loopedRows (rows in or below a loop) lead into."""
+    n = len(parentRows)
+    #jumping further than the longest chain lands every looped row on its loop, and covers all of the loop
+    top, _ = _jump(parentRows)
+    loop = np.unique(top[loopedRows])
+    #the smallest row around each loop, by doubling along it: after k passes low covers 2**k links
+    low = np.arange(n)
+    pointer = np.where(parentRows >= 0, parentRows, np.arange(n))
+    for _ in range(max(1, len(loop)).bit_length() + 1):
+        low[loop] = np.minimum(low[loop], low[pointer[loop]])
+        pointer[loop] = pointer[pointer[loop]]
+    #its parent is further on in the file, so cutting that link leaves no loop and no other link changed
+    return loop[low[loop] == loop]
+
+
+def validate(morph):
+    """Return the Validation of morph's columns."""
+    n = len(morph)
+    rows = np.arange(n)
+    issues = []
+
+    firstRows = morph.rowsOf(morph.ids)
+    duplicate = np.flatnonzero(firstRows != rows)
+    if len(duplicate):
+        issues.append(Issue(DUPLICATE_ID, duplicate, "id %(id)d is already used by an earlier sample"))
+
+    parentRows = morph.rowsOf(morph.parents)
+    missing = np.flatnonzero((morph.parents >= 0) & (parentRows < 0))
+    if len(missing):
+        issues.append(Issue(MISSING_PARENT, missing, "sample %(id)d has parent %(parent)d, which is not in the file"))
+    selfParent = np.flatnonzero(parentRows == rows)
+    if len(selfParent):
+        issues.append(Issue(SELF_PARENT, selfParent, "sample %(id)d is its own parent"))
+    parentRows[selfParent] = -1
+
+    backwards = np.flatnonzero(parentRows > rows)
+    if len(backwards):
+        top, _ = _jump(parentRows)
+        looped = np.flatnonzero(parentRows[top] >= 0)
+        if len(looped):
+            issues.append(Issue(CYCLE, looped, "sample %(id)d is in, or hangs from, a loop of parent links"))
+
+    radius = np.flatnonzero(~((morph.radii > 0) & np.isfinite(morph.radii)))
+    if len(radius):
+        issues.append(Issue(RADIUS, radius, "sample %(id)d has radius %(radius)g"))
+    coordinates = np.flatnonzero(~np.isfinite(morph.points).all(axis=1))
+    if len(coordinates):
+        issues.append(Issue(COORDINATES, coordinates, "sample %(id)d has a position that is not a finite number"))
+    if len(backwards):
+        issues.append(Issue(ORDER, backwards, "sample %(id)d comes before its parent %(parent)d"))
+    return Validation(morph, issues, parentRows)
+
+
+def repair(validation, radius=None):
+    """Return a repaired copy of the validated Morphology (see the module docstring).
+
+    radius is what bad radii are clamped to; by default the smallest valid radius in the file.
+    """
+    morph = validation.morph
+    n = len(morph)
+    rows = np.arange(n)
+    parentRows = validation.parentRows.copy()
+
+    cycle = validation.get(CYCLE)
+    if cycle is not None:
+        parentRows[_loopStarts(parentRows, cycle.rows)] = -1
+
+    #samples at non-finite positions are dropped; whatever hangs from them becomes a root
+    keep = np.ones(n, dtype=bool)
+    coordinates = validation.get(COORDINATES)
+    if coordinates is not None:
+        keep[coordinates.rows] = False
+        parentRows[(parentRows >= 0) & ~keep[np.maximum(parentRows, 0)]] = -1
+
+    radii = morph.radii.copy()
+    bad = ~((radii > 0) & np.isfinite(radii))
+    if bad.any():
+        if radius is None:
+            valid = radii[~bad]
+            radius = float(valid.min()) if len(valid) else 1.0
+        radii[bad] = radius
+
+    #parents first: a stable sort by depth keeps file order among samples at the same depth
+    order = rows
+    if validation.get(ORDER) is not None:
+        _, depth = _jump(parentRows)
+        order = np.argsort(depth, kind="stable")
+
+    #renumber 1..n in the new order
+    order = order[keep[order]]
+    newRows = np.full(n, -1, dtype=np.int64)
+    newRows[order] = np.arange(len(order))
+    ids = np.arange(len(order)) + 1
+    parents = np.where(parentRows[order] >= 0, newRows[np.maximum(parentRows[order], 0)] + 1, -1)
+    return swc.Morphology(ids, morph.types[order], morph.points[order], radii[order], parents, morph.name)
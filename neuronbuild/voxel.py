@@ -0,0 +1,297 @@
+"""
+Signed-distance voxelizer: one closed, welded mesh for a whole neuron without C4D's Volume Builder.
+
+Every pair of consecutive samples on a section path is a capsule: a cone frustum from
+(a, ra) to (b, rb) capped by spheres (lone samples are spheres). The surface is the zero
+set of the minimum capsule distance, sampled on a grid of voxelSize spacing.
+
+The grid is sparse: it is cut into blocks of BLOCK voxels per side and only blocks that
+some capsule touches are evaluated. A block index (capsule -> blocks, inverted into
+block -> capsules) means each voxel only measures the few capsules near it. Blocks are
+independent, so they can be handed to any concurrent.futures executor.
+
+The surface is extracted per block with marching cubes in its tetrahedral form: each
+cube is split into six tetrahedra around its main diagonal, which gives a 16-case
+table, no ambiguous configurations and a watertight result. Vertices are keyed by the
+global grid edge they lie on, so the blocks weld together seamlessly.
+"""
+
+import numpy as np
+
+from . import mesh
+
+#voxels per block side
+BLOCK = 16
+#capsule/sample pairs evaluated at once (bounds temporary memory)
+CHUNK = 1 << 20
+#blocks per task when an executor is used
+BLOCKS_PER_TASK = 8
+
+#cube corner offsets, corner c = x + 2y + 4z
+CORNERS = np.array([[(c >> 0) & 1, (c >> 1) & 1, (c >> 2) & 1] for c in range(8)])
+#six tetrahedra sharing the cube diagonal 0-7
+TETRAHEDRA = np.array([[0, 1, 3, 7], [0, 3, 2, 7], [0, 2, 6, 7],
+                       [0, 6, 4, 7], [0, 4, 5, 7], [0, 5, 1, 7]])
+#tetrahedron edges as pairs of its vertices
+TET_EDGES = np.array([[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]])
+#every tetrahedron edge runs from a lower corner along a 0/1 step in x, y and z (one of 7 directions),
+#numbered dx + 2dy + 4dz
+DIRECTION_BITS = np.array([1, 2, 4])
+
+
+def _tetTable():
+    """Triangles (as tetrahedron edge triples, -1 padded) for each of the 16 inside/outside cases."""
+    edgeOf = dict(((int(a), int(b)), e) for e, (a, b) in enumerate(TET_EDGES))
+    edgeOf.update(((b, a), e) for (a, b), e in list(edgeOf.items()))
+    table = -np.ones((16, 2, 3), dtype=np.int64)
+    for case in range(1, 15):
+        inside = [v for v in range(4) if case >> v & 1]
+        outside = [v for v in range(4) if not case >> v & 1]
+        if len(inside) in (1, 3):
+            lone, others = (inside[0], outside) if len(inside) == 1 else (outside[0], inside)
+            table[case, 0] = [edgeOf[lone, o] for o in others]
+        else:
+            (a, b), (c, d) = inside, outside
+            table[case, 0] = [edgeOf[a, c], edgeOf[a, d], edgeOf[b, d]]
+            table[case, 1] = [edgeOf[a, c], edgeOf[b, d], edgeOf[b, c]]
+    return table
+
+TET_TABLE = _tetTable()
+
+
+class Capsules(object):
+    """Cone-frustum capsules: a, b float64 (m, 3) end points; ra, rb float64 (m,) end radii."""
+
+    def __init__(self, a, b, ra, rb):
+        self.a, self.b, self.ra, self.rb = a, b, ra, rb
+
+    def __len__(self):
+        return len(self.ra)
+
+    def bounds(self):
+        """Return the (low, high) corners of the box around all capsules."""
+        r = np.maximum(self.ra, self.rb)[:, None]
+        low = np.minimum(self.a, self.b) - r
+        high = np.maximum(self.a, self.b) + r
+        return low.min(axis=0), high.max(axis=0)
+
+
+def capsules(morph, sections, points=None):
+    """Return the Capsules along every section path; single-point paths become spheres."""
+    if points is None:
+        points = morph.points
+    rows, offsets = sections.paths()
+    counts = np.diff(offsets)
+    lastOfPath = np.zeros(len(rows), dtype=bool)
+    lastOfPath[offsets[1:] - 1] = True
+    #segment from each path point to the next one on the same path
+    starts = np.flatnonzero(~lastOfPath)
+    ends = starts + 1
+    #paths of a single point become a zero-length capsule
+    lone = offsets[:-1][counts == 1]
+    starts = np.concatenate((starts, lone))
+    ends = np.concatenate((ends, lone))
+    return Capsules(points[rows[starts]], points[rows[ends]],
+                    morph.radii[rows[starts]], morph.radii[rows[ends]])
+
+
+def capsuleDistance(p, a, b, ra, rb):
+    """Return the signed distance from each point p[i] to capsule i (approximate for the cone:
+    distance to the axis minus the radius interpolated along it)."""
+    ba = b - a
+    lengthSq = np.einsum("ij,ij->i", ba, ba)
+    pa = p - a
+    t = np.einsum("ij,ij->i", pa, ba) / np.where(lengthSq > 0, lengthSq, 1.0)
+    np.clip(t, 0.0, 1.0, out=t)
+    offset = pa - t[:, None] * ba
+    return np.sqrt(np.einsum("ij,ij->i", offset, offset)) - (ra + t * (rb - ra))
+
+
+class Grid(object):
+    """The sparse block grid and its capsule index.
+
+    blocks         int64 (k, 3)  block coordinates of the occupied blocks
+    blockOffsets   int64 (k + 1,) capsules of block i are capsuleIndex[blockOffsets[i]:blockOffsets[i + 1]]
+    """
+
+    def __init__(self, caps, voxelSize):
+        self.caps = caps
+        self.voxelSize = float(voxelSize)
+        low, high = caps.bounds()
+        margin = 2.0 * self.voxelSize
+        self.origin = np.floor((low - margin) / self.voxelSize) * self.voxelSize
+        #grid points per axis, rounded up to whole blocks
+        self.shape = np.ceil((high + margin - self.origin) / (self.voxelSize * BLOCK)).astype(np.int64) * BLOCK + 1
+
+        #blocks each capsule touches (its box grown by one voxel), then inverted into block -> capsules
+        r = np.maximum(caps.ra, caps.rb)[:, None] + self.voxelSize
+        boxLow = np.floor(((np.minimum(caps.a, caps.b) - r) - self.origin) / (self.voxelSize * BLOCK)).astype(np.int64)
+        boxHigh = np.floor(((np.maximum(caps.a, caps.b) + r) - self.origin) / (self.voxelSize * BLOCK)).astype(np.int64)
+        blockShape = (self.shape - 1) // BLOCK
+        boxLow = np.clip(boxLow, 0, blockShape - 1)
+        boxHigh = np.clip(boxHigh, 0, blockShape - 1)
+        span = boxHigh - boxLow + 1
+        perCapsule = span.prod(axis=1)
+        capsuleOf = np.repeat(np.arange(len(caps)), perCapsule)
+        local = np.arange(perCapsule.sum()) - np.repeat(np.cumsum(perCapsule) - perCapsule, perCapsule)
+        sx, sy = span[capsuleOf, 0], span[capsuleOf, 1]
+        cell = boxLow[capsuleOf] + np.stack((local % sx, (local // sx) % sy, local // (sx * sy)), axis=1)
+        keys = (cell[:, 2] * blockShape[1] + cell[:, 1]) * blockShape[0] + cell[:, 0]
+        order = np.argsort(keys, kind="stable")
+        keys, self.capsuleIndex = keys[order], capsuleOf[order]
+        unique, starts = np.unique(keys, return_index=True)
+        self.blockOffsets = np.append(starts, len(keys)).astype(np.int64)
+        self.blocks = np.stack((unique % blockShape[0], (unique // blockShape[0]) % blockShape[1],
+                                unique // (blockShape[0] * blockShape[1])), axis=1)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def blockSurface(self, i):
+        """Evaluate block i and extract its piece of the surface.
+
+        Returns (keys, positions): keys int64 (t, 3) global edge ids of each triangle's
+        vertices, positions float64 (t, 3, 3) their coordinates, triangles facing outward.
+        """
+        h = self.voxelSize
+        index = self.capsuleIndex[self.blockOffsets[i]:self.blockOffsets[i + 1]]
+        base = self.blocks[i] * BLOCK
+        axis = np.arange(BLOCK + 1)
+        gx, gy, gz = np.meshgrid(axis + base[0], axis + base[1], axis + base[2], indexing="ij")
+        gridPoints = np.stack((gx.ravel(), gy.ravel(), gz.ravel()), axis=1)
+        samples = self.origin + gridPoints * h
+        values = self.blockValues(index, base)
+        #exact zeros would sit on both sides of the surface; nudge them outward
+        values[values == 0.0] = 1e-12 * h
+
+        #corner sample indices of every cube in the block, then of every tetrahedron
+        n = BLOCK + 1
+        c = np.arange(BLOCK)
+        cx, cy, cz = np.meshgrid(c, c, c, indexing="ij")
+        cubeBase = (cx.ravel() * n + cy.ravel()) * n + cz.ravel()
+        cornerStep = (CORNERS[:, 0] * n + CORNERS[:, 1]) * n + CORNERS[:, 2]
+        cubeCorners = cubeBase[:, None] + cornerStep[None, :]
+        #skip cubes the surface cannot cross
+        cornerValues = values[cubeCorners]
+        crossing = (cornerValues.min(axis=1) < 0) & (cornerValues.max(axis=1) > 0)
+        tets = cubeCorners[crossing][:, TETRAHEDRA].reshape(-1, 4)
+        tetValues = values[tets]
+        case = ((tetValues < 0) * (1, 2, 4, 8)).sum(axis=1)
+
+        keys, positions = [], []
+        for slot in range(2):
+            edges = TET_TABLE[case, slot]
+            valid = edges[:, 0] >= 0
+            if not valid.any():
+                continue
+            t = tets[valid]
+            e = edges[valid]
+            ends = TET_EDGES[e]
+            rowsIdx = np.arange(len(t))[:, None]
+            p0, p1 = t[rowsIdx, ends[:, :, 0]], t[rowsIdx, ends[:, :, 1]]
+            v0, v1 = values[p0], values[p1]
+            w = (v0 / (v0 - v1))[:, :, None]
+            pos = samples[p0] + w * (samples[p1] - samples[p0])
+            #outward: the normal should point from the inside corners to the outside ones
+            tv = tetValues[valid]
+            tp = samples[t]
+            inside = tv < 0
+            direction = (((~inside)[:, :, None] * tp).sum(axis=1) / (~inside).sum(axis=1)[:, None]
+                         - (inside[:, :, None] * tp).sum(axis=1) / inside.sum(axis=1)[:, None])
+            normal = np.cross(pos[:, 1] - pos[:, 0], pos[:, 2] - pos[:, 0])
+            flip = np.einsum("ij,ij->i", normal, direction) < 0
+            pos[flip] = pos[flip][:, [0, 2, 1]]
+            #an edge is its lower grid point and its direction: a product of two grid indices would
+            #overflow int64 on fine grids (1e10 points) and weld unrelated edges together
+            lower = np.minimum(p0, p1)
+            step = np.abs(gridPoints[p1] - gridPoints[p0]) @ DIRECTION_BITS
+            key = self._globalIndex(gridPoints[lower]) * 8 + step
+            key[flip] = key[flip][:, [0, 2, 1]]
+            keys.append(key)
+            positions.append(pos)
+        if not keys:
+            return np.zeros((0, 3), dtype=np.int64), np.zeros((0, 3, 3))
+        return np.concatenate(keys), np.concatenate(positions)
+
+    def blockValues(self, index, base):
+        """Return the distance field on the (BLOCK + 1)^3 samples of the block at base.
+
+        Each capsule is measured only at the samples inside its own box grown by one voxel;
+        samples no capsule reaches keep a large positive value.
+        """
+        h = self.voxelSize
+        caps = self.caps
+        n = BLOCK + 1
+        values = np.full(n * n * n, 1e30)
+        r = np.maximum(caps.ra[index], caps.rb[index])[:, None] + h
+        low = np.floor((np.minimum(caps.a[index], caps.b[index]) - r - self.origin) / h).astype(np.int64) - base
+        high = np.ceil((np.maximum(caps.a[index], caps.b[index]) + r - self.origin) / h).astype(np.int64) - base
+        low = np.clip(low, 0, BLOCK)
+        high = np.clip(high, 0, BLOCK)
+        span = np.maximum(high - low + 1, 0)
+        perCapsule = span.prod(axis=1)
+        ends = np.cumsum(perCapsule)
+        start = 0
+        while start < len(index):
+            #take as many capsules as fit in one chunk of capsule/sample pairs
+            stop = max(start + 1, int(np.searchsorted(ends, ends[start] - perCapsule[start] + CHUNK, side="right")))
+            sel = np.arange(start, stop)
+            counts = perCapsule[sel]
+            which = np.repeat(sel, counts)
+            local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            sx, sy = span[which, 0], span[which, 1]
+            cell = low[which] + np.stack((local % sx, (local // sx) % sy, local // (sx * sy)), axis=1)
+            points = self.origin + (cell + base) * h
+            capsule = index[which]
+            d = capsuleDistance(points, caps.a[capsule], caps.b[capsule], caps.ra[capsule], caps.rb[capsule])
+            np.minimum.at(values, (cell[:, 0] * n + cell[:, 1]) * n + cell[:, 2], d)
+            start = stop
+        return values
+
+    def totalPoints(self):
+        return int(self.shape.prod())
+
+    def _globalIndex(self, gridPoints):
+        return (gridPoints[..., 2] * self.shape[1] + gridPoints[..., 1]) * self.shape[0] + gridPoints[..., 0]
+
+
+def _surfaceRun(run):
+    """Extract the surface of blocks start..stop of a grid (a picklable task for executors)."""
+    grid, start, stop = run
+    return [grid.blockSurface(i) for i in range(start, stop)]
+
+
+def voxelize(morph, sections, voxelSize, points=None, executor=None):
+    """Return a welded, closed triangle Mesh of the neuron surface at the given voxel size.
+
+    sections should include the soma (buildSections(morph, exclude=())) for a single
+    surface. executor is an optional concurrent.futures executor used to evaluate the
+    blocks in parallel.
+    """
+    if voxelSize <= 0:
+        raise ValueError("voxel size must be positive")
+    caps = capsules(morph, sections, points)
+    if len(caps) == 0:
+        return mesh.Mesh(np.zeros((0, 3)), np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.int64))
+    grid = Grid(caps, voxelSize)
+    if executor is None:
+        pieces = [grid.blockSurface(i) for i in range(len(grid))]
+    else:
+        #blocks go out in runs, so a process pool pickles the grid once per run rather than per block
+        runs = [(grid, start, min(start + BLOCKS_PER_TASK, len(grid)))
+                for start in range(0, len(grid), BLOCKS_PER_TASK)]
+        pieces = [piece for result in executor.map(_surfaceRun, runs) for piece in result]
+    keys = np.concatenate([k for k, p in pieces])
+    positions = np.concatenate([p for k, p in pieces])
+    if len(keys) == 0:
+        return mesh.Mesh(np.zeros((0, 3)), np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.int64))
+
+    #weld: one vertex per grid edge
+    unique, first, inverse = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+    vertices = positions.reshape(-1, 3)[first]
+    triangles = inverse.reshape(-1, 3)
+    #drop triangles that collapsed onto a shared vertex
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2])
+                          & (triangles[:, 0] != triangles[:, 2])]
+    polygons = np.concatenate((triangles, triangles[:, 2:3]), axis=1).astype(np.int32)
+    return mesh.Mesh(vertices, polygons, np.full(len(polygons), -1, dtype=np.int64))